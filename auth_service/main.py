@@ -1,13 +1,151 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
 
-app = FastAPI(title="Auth Service")
+from common.health import install_health
+from common.metrics import install_metrics
+from common.storage import open_storage
+from common.tokens import Keyring, issue_token
+from common.tracing import install_tracing
 
-# In-memory user store
+TOKEN_TTL = float(os.getenv("AUTH_TOKEN_TTL", "3600"))
+keyring = Keyring.from_env()
+
+# Password hashing: scrypt work factor and the pool it runs in
+SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("AUTH_SCRYPT_P", "1"))
+HASH_POOL = os.getenv("AUTH_HASH_POOL", "thread")  # thread | process
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "64"))
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P,
+                  salt: Optional[bytes] = None) -> str:
+    """Salted scrypt hash, encoded as scrypt$n$r$p$salt$hash."""
+    salt = salt or os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20)
+    return "$".join(["scrypt", str(n), str(r), str(p),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def check_password(password: str, encoded: str) -> bool:
+    try:
+        scheme, n, r, p, salt, _ = encoded.split("$")
+        if scheme != "scrypt":
+            return False
+        expected = hash_password(password, int(n), int(r), int(p), base64.b64decode(salt))
+    except ValueError:
+        return False
+    return hmac.compare_digest(expected, encoded)
+
+
+def needs_rehash(encoded: str) -> bool:
+    return not encoded.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+class PasswordHasher:
+    """Runs key derivation off the event loop in a bounded pool.
+
+    scrypt takes tens of milliseconds by design; run inline it would stall
+    every other request on the worker. hashlib releases the GIL while
+    hashing, so threads already run in parallel with the loop; a process
+    pool is available for interpreters where that does not hold. At most
+    `max_pending` hashes may be queued, beyond that logins are shed with 503.
+    """
+
+    def __init__(self, pool: str, workers: int, max_pending: int):
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unsupported hash pool: {pool!r}")
+        self.pool = pool
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.shed = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.pool == "process":
+                # Imported on first use: multiprocessing is not needed with the default thread pool
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.shed += 1
+            raise HTTPException(status_code=503, detail="Too many logins in progress, try again",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, encoded: str) -> bool:
+        return await self._run(check_password, password, encoded)
+
+    def stats(self) -> dict:
+        return {"pool": self.pool, "workers": self.workers, "pending": self.pending,
+                "max_pending": self.max_pending, "completed": self.completed, "shed": self.shed}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(HASH_POOL, HASH_WORKERS, HASH_MAX_PENDING)
+# Checked against unknown usernames so they take as long as a wrong password.
+# Only the work factor matters, so random bytes stand in for a real hash and
+# importing the service costs no key derivation.
+DUMMY_HASH = "$".join(["scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+                       base64.b64encode(os.urandom(16)).decode(), base64.b64encode(os.urandom(64)).decode()])
+
+# User store: {username: user}; all users share one partition. The last
+# id handed out is kept apart under USER_IDS so sign-ups can claim ids atomically.
+# With the default memory:// backend `users_db` is the live store. The demo
+# users' hashes are precomputed with the default work factor (rehashed on
+# login if AUTH_SCRYPT_* differ) rather than derived at every start.
+USERS = "users"
+USER_IDS = "user_ids"
 users_db = {
-    "user": {"username": "user", "password": "password", "role": "user", "id": 1},
-    "admin": {"username": "admin", "password": "admin", "role": "admin", "id": 2}
+    "user": {"username": "user", "role": "user", "id": 1, "password_hash":
+             "scrypt$16384$8$1$8qvBG4ACHeXaA5XSzVcI+Q==$+mWymRQbAbG3Tnt8ZSOkrr4RYglS8zwOnQs7CVr3wPgZrqWxPXTWABz85IEXyDpI3pcviMilB6/3eYuS7qAtcQ=="},
+    "admin": {"username": "admin", "role": "admin", "id": 2, "password_hash":
+              "scrypt$16384$8$1$3zU32E9+ekgkJT4VgTZseA==$xh1TdCBB4wf0Bb8do6+a06s9PsXjFgtB1nolqQXWlPGaFt2/4kXYLvegel+y3WM8xPs10Rs2odbj3kRMGmEE5g=="},
 }
+storage = open_storage(os.getenv("STORAGE_URL", "memory://"))
+user_store = storage.collection("users", data={USERS: users_db})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    hasher.shutdown()
+    await storage.aclose()
+
+
+app = FastAPI(title="Auth Service", lifespan=lifespan)
+install_tracing(app, "auth_service")
+install_metrics(app, "auth_service")
+install_health(app, {"storage": storage.ping})
 
 class LoginRequest(BaseModel):
     username: str
@@ -17,28 +155,67 @@ class RegisterRequest(BaseModel):
     username: str
     password: str
 
+
+async def next_user_id() -> int:
+    # The counter is advanced by the store, so concurrent sign-ups never share an id.
+    # Stores written before it existed start it from the highest id in use.
+    floor = 0
+    if await user_store.get(USER_IDS, "last") is None:
+        floor = max((user.get("id", 0) for user in (await user_store.items(USERS)).values()), default=0)
+    return await user_store.update(USER_IDS, "last", lambda last: max(last or 0, floor) + 1)
+
+
+async def authenticate(user: Optional[dict], password: str) -> bool:
+    if user is None:
+        await hasher.verify(password, DUMMY_HASH)
+        return False
+    if "password_hash" not in user:
+        # Stores written before hashing was introduced hold the plain password
+        ok = hmac.compare_digest(user.get("password", "").encode(), password.encode())
+    else:
+        ok = await hasher.verify(password, user["password_hash"])
+    if ok and ("password_hash" not in user or needs_rehash(user["password_hash"])):
+        # Upgrade legacy and old-work-factor hashes on successful login
+        password_hash = await hasher.hash(password)
+        user = {key: value for key, value in user.items() if key != "password"}
+        await user_store.put(USERS, user["username"], dict(user, password_hash=password_hash))
+    return ok
+
+
 @app.post("/register")
 async def register(creds: RegisterRequest):
-    if creds.username in users_db:
+    # Checked before hashing so duplicate sign-ups don't burn a hash; add() below settles races
+    if await user_store.get(USERS, creds.username) is not None:
         raise HTTPException(status_code=400, detail="Username already exists")
-    
-    new_id = len(users_db) + 1
-    users_db[creds.username] = {
+    password_hash = await hasher.hash(creds.password)
+    new_id = await next_user_id()
+    added = await user_store.add(USERS, creds.username, {
         "username": creds.username,
-        "password": creds.password, # In a real app, hash this!
+        "password_hash": password_hash,
         "role": "user",
         "id": new_id
-    }
+    })
+    if not added:
+        raise HTTPException(status_code=400, detail="Username already exists")
     return {"message": "User registered successfully"}
 
 @app.post("/login")
 async def login(creds: LoginRequest):
-    user = users_db.get(creds.username)
-    if user and user["password"] == creds.password:
+    user = await user_store.get(USERS, creds.username)
+    if await authenticate(user, creds.password):
+        # Signed and self-contained: the gateway verifies it without calling us
+        token = issue_token({"sub": str(user["id"]), "username": user["username"], "role": user["role"]},
+                            keyring, TOKEN_TTL)
         return {
-            "token": f"fake-jwt-token-{user['id']}", 
+            "token": token,
+            "token_type": "bearer",
+            "expires_in": int(TOKEN_TTL),
             "user_id": user['id'],
             "role": user['role'],
             "username": user['username']
         }
     raise HTTPException(status_code=401, detail="Invalid credentials")
+
+@app.get("/hashing")
+async def hashing_stats():
+    return hasher.stats()
@@ -20,4 +20,67 @@ def test_login_user():
 
 def test_login_invalid_user():
     r = client.post("/login", json={"username": "invaliduser", "password": "wrongpassword"})
-    assert r.status_code == 401
\ No newline at end of file
+    assert r.status_code == 401
+
+def test_login_issues_verifiable_token():
+    from auth_service.main import keyring
+    from common.tokens import decode_token
+    r = client.post("/login", json={"username": "user", "password": "password"})
+    data = r.json()
+    claims, kid = decode_token(data["token"], keyring)
+    assert claims["sub"] == str(data["user_id"]) and claims["role"] == "user"
+    assert kid == keyring.active
+    assert claims["exp"] - claims["iat"] == data["expires_in"]
+
+def test_passwords_are_stored_hashed():
+    from auth_service.main import users_db, check_password
+    client.post("/register", json={"username": "hashed", "password": "s3cret"})
+    stored = users_db["hashed"]
+    assert "password" not in stored
+    assert stored["password_hash"].startswith("scrypt$") and check_password("s3cret", stored["password_hash"])
+    assert client.post("/login", json={"username": "hashed", "password": "wrong"}).status_code == 401
+    assert client.post("/login", json={"username": "hashed", "password": "s3cret"}).status_code == 200
+
+def test_legacy_plaintext_password_is_upgraded_on_login():
+    from auth_service.main import users_db
+    users_db["legacy"] = {"username": "legacy", "password": "old", "role": "user", "id": 99}
+    try:
+        assert client.post("/login", json={"username": "legacy", "password": "nope"}).status_code == 401
+        assert client.post("/login", json={"username": "legacy", "password": "old"}).status_code == 200
+        assert "password" not in users_db["legacy"]
+        assert client.post("/login", json={"username": "legacy", "password": "old"}).status_code == 200
+    finally:
+        users_db.pop("legacy", None)
+
+def test_hashing_is_shed_when_pool_is_saturated(monkeypatch):
+    from auth_service.main import hasher
+    monkeypatch.setattr(hasher, "pending", hasher.max_pending)
+    r = client.post("/login", json={"username": "user", "password": "password"})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+    assert client.get("/hashing").json()["shed"] >= 1
+
+def test_concurrent_registrations_get_distinct_ids(tmp_path, monkeypatch):
+    import asyncio
+    import httpx
+    import auth_service.main as auth
+    from common.storage import SQLiteStorage
+    storage = SQLiteStorage(str(tmp_path / "users.db"))
+    monkeypatch.setattr(auth, "user_store", storage.collection("users", data={auth.USERS: auth.users_db}))
+
+    async def instant_hash(password):
+        return "scrypt$1$1$1$$"
+    # Hashes finishing together is what lines the sign-ups up on the same id
+    monkeypatch.setattr(auth.hasher, "hash", instant_hash)
+
+    async def register_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://auth") as c:
+            await asyncio.gather(*(c.post("/register", json={"username": f"u{n}", "password": "pw"})
+                                   for n in range(8)))
+        users = await auth.user_store.items(auth.USERS)
+        await storage.aclose()
+        return users
+
+    users = asyncio.run(register_all())
+    ids = [user["id"] for user in users.values()]
+    assert all(f"u{n}" in users for n in range(8)) and len(set(ids)) == len(ids)
@@ -0,0 +1,192 @@
+"""Cart throughput with cart_service split into 1, 2, 4 and 8 shards.
+
+    python -m benchmarks.cart_shards --shards 1 2 4 8 --requests 20000 --users 1000
+    python -m benchmarks.cart_shards --direct --clients 4
+
+For each shard count, starts the shards with `python -m common.sharding`
+and a gateway routing to them (with `--gateway-workers` uvicorn workers),
+then has `--clients` load-generator processes add items to the carts of
+`--users` users through the gateway. `--direct` skips the gateway and has
+the clients pick the shard with the same hash ring, to measure the shards
+alone. After each run every cart is read back and checked against the
+adds that were acknowledged, so a user split across shards shows up as
+`inconsistent_carts`.
+
+Scaling needs free cores: one per shard plus the gateway and clients.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import summarize
+from common.sharding import HashRing, shard_urls
+from common.tokens import Keyring, issue_token
+
+BENCH_SIGNING_KEYS = "bench:cart-shards-signing-key"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_ports(count: int) -> int:
+    """First of `count` consecutive free loopback ports."""
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + count >= 65536:
+            continue
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def wait_ready(url: str, deadline: float):
+    while True:
+        try:
+            httpx.get(f"{url}/metrics", timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not start")
+            time.sleep(0.1)
+
+
+@contextmanager
+def running(commands: List[List[str]], env: dict, urls: List[str]):
+    procs = [subprocess.Popen(command, cwd=ROOT, env=dict(env, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL)
+             for command in commands]
+    try:
+        deadline = time.monotonic() + 60
+        for url in urls:
+            wait_ready(url, deadline)
+        yield
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=15)
+
+
+def client_process(args: dict) -> dict:
+    """Add items to carts from one load-generator process; returns latencies and acknowledged adds."""
+    async def run():
+        keyring = Keyring.parse(BENCH_SIGNING_KEYS)
+        ring = HashRing(list(args["targets"])) if args["direct"] else None
+        headers = {user_id: {"Authorization": "Bearer " + issue_token({"sub": str(user_id)}, keyring, 3600)}
+                   for user_id in args["users"]}
+        clients = {name: httpx.AsyncClient(base_url=url, timeout=30,
+                                           limits=httpx.Limits(max_connections=args["concurrency"]))
+                   for name, url in args["targets"].items()}
+        latencies, acknowledged, failures = [], Counter(), Counter()
+        counter = iter(range(args["requests"]))
+
+        async def worker():
+            for i in counter:
+                user_id = args["users"][i % len(args["users"])]
+                client = clients[ring.node_for(user_id)] if ring else clients["gateway"]
+                start = time.perf_counter()
+                try:
+                    r = await client.post(f"/cart/{user_id}/add", json={"product_id": 1 + i % 7, "quantity": 1},
+                                          headers=headers[user_id])
+                    outcome = r.status_code
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                if outcome == 200:
+                    acknowledged[user_id] += 1
+                else:
+                    failures[str(outcome)] += 1
+
+        await asyncio.gather(*(worker() for _ in range(args["concurrency"])))
+        for client in clients.values():
+            await client.aclose()
+        return {"latencies": latencies, "acknowledged": dict(acknowledged), "failures": dict(failures)}
+
+    return asyncio.run(run())
+
+
+def run_shards(shards: int, args) -> dict:
+    cart_port = free_ports(shards)
+    gateway_port = free_ports(1)
+    cart_url = f"http://127.0.0.1:{cart_port}"
+    shard_names = ["cart"] + [f"cart-{i}" for i in range(1, shards)]
+    shard_targets = dict(zip(shard_names, shard_urls(cart_url, shards)))
+    env = dict(os.environ, AUTH_SIGNING_KEYS=BENCH_SIGNING_KEYS, CART_SERVICE_URL=cart_url,
+               CART_SERVICE_SHARDS=str(shards), GATEWAY_MAX_CONNECTIONS="1000", GATEWAY_MAX_KEEPALIVE="1000")
+    commands = [[sys.executable, "-m", "common.sharding", "cart_service.main:app", "--port", str(cart_port),
+                 "--shards", str(shards), "--log-level", "error"]]
+    urls = list(shard_targets.values())
+    if not args.direct:
+        commands.append([sys.executable, "-m", "uvicorn", "gateway.main:app", "--port", str(gateway_port),
+                         "--workers", str(args.gateway_workers), "--log-level", "error"])
+        urls.append(f"http://127.0.0.1:{gateway_port}")
+
+    with running(commands, env, urls):
+        targets = shard_targets if args.direct else {"gateway": f"http://127.0.0.1:{gateway_port}"}
+        users = list(range(1, args.users + 1))
+        jobs = [{"targets": targets, "direct": args.direct, "users": users[i::args.clients],
+                 "requests": args.requests // args.clients, "concurrency": args.concurrency}
+                for i in range(args.clients)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+        elapsed = time.perf_counter() - started
+
+        # Every acknowledged add must be in the cart of the shard that owns the user
+        acknowledged: Dict[int, int] = Counter()
+        for result in results:
+            acknowledged.update({int(user): count for user, count in result["acknowledged"].items()})
+        ring = HashRing(shard_names)
+        inconsistent = 0
+
+        async def verify():
+            nonlocal inconsistent
+            async with httpx.AsyncClient(timeout=30) as client:
+                for user_id in users:
+                    r = await client.get(f"{shard_targets[ring.node_for(user_id)]}/cart/{user_id}")
+                    if sum(item["quantity"] for item in r.json()) != acknowledged.get(user_id, 0):
+                        inconsistent += 1
+
+        asyncio.run(verify())
+
+    latencies = [latency for result in results for latency in result["latencies"]]
+    failures = sum((Counter(result["failures"]) for result in results), Counter())
+    report = summarize(latencies, elapsed, sum(failures.values()))
+    report["failures"] = dict(failures)
+    report["inconsistent_carts"] = inconsistent
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32, help="in flight per client process")
+    parser.add_argument("--clients", type=int, default=2, help="load-generator processes")
+    parser.add_argument("--gateway-workers", type=int, default=2)
+    parser.add_argument("--direct", action="store_true", help="send requests straight to the shards")
+    args = parser.parse_args()
+
+    report = {"cpus": os.cpu_count(), "direct": args.direct}
+    for shards in args.shards:
+        report[f"{shards}_shards"] = run_shards(shards, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Cold-start time of every service: import, boot and first requests.
+
+    python -m benchmarks.cold_start --repeat 5
+    python -m benchmarks.cold_start --services auth_service gateway
+
+For each service, in fresh interpreters:
+
+- import_ms: importing `<service>.main`, measured inside the interpreter;
+- interpreter_ms: the whole `python -c "import <service>.main"` process;
+- boot_ms: from spawning uvicorn until GET /healthz first answers;
+- first_request_ms / second_request_ms: a typical request right after boot,
+  then the same request warm;
+- openapi_first_ms / openapi_cached_ms: building the schema, then serving it.
+
+Every figure is the median over `--repeat` starts. Services run alone, so
+/readyz of those with upstreams (gateway, order_service) answers 503; its
+status is reported as `readyz`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.cart_shards import BENCH_SIGNING_KEYS, ROOT, free_ports
+
+# A typical first request per service: (method, path, JSON body)
+FIRST_REQUESTS: Dict[str, Tuple[str, str, object]] = {
+    "gateway": ("GET", "/", None),
+    "auth_service": ("POST", "/login", {"username": "user", "password": "password"}),
+    "product_service": ("GET", "/products", None),
+    "cart_service": ("GET", "/cart/1", None),
+    "order_service": ("GET", "/orders/1", None),
+    "payment_service": ("POST", "/pay", {"amount": 10.0, "user_id": "1"}),
+    "notification_service": ("POST", "/send", {"user_id": 1, "message": "hello"}),
+    "review_service": ("GET", "/reviews/1", None),
+}
+
+
+def environment() -> dict:
+    return dict(os.environ, PYTHONPATH=ROOT, AUTH_SIGNING_KEYS=BENCH_SIGNING_KEYS)
+
+
+def import_time(service: str) -> Tuple[float, float]:
+    code = f"import time; t = time.perf_counter(); import {service}.main; print(time.perf_counter() - t)"
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=environment(), check=True,
+                         capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1]), time.perf_counter() - start
+
+
+def timed_request(client: httpx.Client, method: str, path: str, body) -> float:
+    start = time.perf_counter()
+    client.request(method, path, json=body).raise_for_status()
+    return time.perf_counter() - start
+
+
+def boot(service: str) -> dict:
+    port = free_ports(1)
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", f"{service}.main:app", "--port", str(port),
+                             "--log-level", "error"], cwd=ROOT, env=environment(), stdout=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=url, timeout=30) as client:
+            while True:
+                try:
+                    if client.get("/healthz").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None or time.perf_counter() - started > 60:
+                    raise RuntimeError(f"{service} did not start")
+                time.sleep(0.005)
+            booted = time.perf_counter() - started
+            method, path, body = FIRST_REQUESTS[service]
+            return {
+                "boot": booted,
+                "first_request": timed_request(client, method, path, body),
+                "second_request": timed_request(client, method, path, body),
+                "openapi_first": timed_request(client, "GET", "/openapi.json", None),
+                "openapi_cached": timed_request(client, "GET", "/openapi.json", None),
+                "readyz": client.get("/readyz").status_code,
+            }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+
+
+def measure(service: str, repeat: int) -> dict:
+    imports: List[Tuple[float, float]] = [import_time(service) for _ in range(repeat)]
+    boots = [boot(service) for _ in range(repeat)]
+
+    def median_ms(values) -> float:
+        return round(statistics.median(values) * 1000, 1)
+
+    report = {"import_ms": median_ms(own for own, _ in imports),
+              "interpreter_ms": median_ms(total for _, total in imports)}
+    for key in ("boot", "first_request", "second_request", "openapi_first", "openapi_cached"):
+        report[f"{key}_ms"] = median_ms(run[key] for run in boots)
+    report["readyz"] = boots[-1]["readyz"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", nargs="+", default=list(FIRST_REQUESTS), choices=list(FIRST_REQUESTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps({service: measure(service, args.repeat) for service in args.services}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Per-request cost of the gateway itself, with upstream time taken out.
+
+    python -m benchmarks.gateway_overhead --requests 5000
+
+Sends requests in-process (ASGI, no sockets) to the real gateway app, with
+every upstream pool answering from an httpx.MockTransport. The time spent
+inside the mock upstream is subtracted, so what is left is middleware,
+auth, routing, header filtering, the resilience guard and streaming the
+response back. Also times route lookup alone: the compiled trie against a
+linear scan of compiled path regexes (how a list of framework routes is
+matched), for tables of growing size.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from typing import List
+
+import httpx
+
+import gateway.main as gw
+from benchmarks.common import percentile
+from common.routing import Route, RouteTable
+from common.tokens import issue_token
+
+UPSTREAM_SECONDS = [0.0]
+
+
+class Body(httpx.AsyncByteStream):
+    # Unread, like a real transport's response, so the gateway streams it
+    async def __aiter__(self):
+        yield b'{"ok": true}'
+
+
+def upstream(request: httpx.Request) -> httpx.Response:
+    start = time.perf_counter()
+    response = httpx.Response(200, headers={"content-type": "application/json", "x-upstream": "bench"},
+                              stream=Body())
+    UPSTREAM_SECONDS[0] += time.perf_counter() - start
+    return response
+
+
+async def requests_overhead(requests: int) -> dict:
+    gw.pools.clear()
+    for name, url in gw.UPSTREAMS.items():
+        gw.pools[name] = gw.UpstreamPool(name, url, timeout=5.0, limits=httpx.Limits(),
+                                         transport=httpx.MockTransport(upstream))
+    auth = {"Authorization": "Bearer " + issue_token({"sub": "7", "role": "user"}, gw.token_verifier.keyring, 3600)}
+    cases = {
+        "GET /products/{id} (cache hit)": lambda c, i: c.get(f"/products/{i % 10}"),
+        "GET /cart/{user_id}": lambda c, i: c.get("/cart/7", headers=auth),
+        "POST /cart/{user_id}/add": lambda c, i: c.post("/cart/7/add", headers=auth,
+                                                        json={"product_id": i % 10, "quantity": 1}),
+        "GET /orders/{user_id}": lambda c, i: c.get("/orders/7", headers=auth),
+        "GET /unknown (404)": lambda c, i: c.get("/unknown"),
+    }
+    report = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gw.app), base_url="http://bench") as client:
+        for name, send in cases.items():
+            for i in range(min(200, requests)):
+                await send(client, i)
+            samples: List[float] = []
+            for i in range(requests):
+                UPSTREAM_SECONDS[0] = 0.0
+                start = time.perf_counter()
+                await send(client, i)
+                samples.append(time.perf_counter() - start - UPSTREAM_SECONDS[0])
+            report[name] = {"p50_us": round(percentile(samples, 50) * 1e6, 1),
+                            "p99_us": round(percentile(samples, 99) * 1e6, 1)}
+    for pool in gw.pools.values():
+        await pool.aclose()
+    return report
+
+
+def lookup_cost(sizes: List[int], lookups: int) -> dict:
+    report = {}
+    for size in sizes:
+        prefixes = [f"/svc{n}/items" for n in range(size)]
+        table = RouteTable(Route(prefix, "bench", ["GET"]) for prefix in prefixes)
+        patterns = [re.compile("^" + re.escape(prefix) + "(/.*)?$") for prefix in prefixes]
+        # Worst case for the scan: the route registered last
+        path = f"/svc{size - 1}/items/42/details"
+
+        start = time.perf_counter()
+        for _ in range(lookups):
+            table.match("GET", path)
+        trie = (time.perf_counter() - start) / lookups
+
+        start = time.perf_counter()
+        for _ in range(lookups):
+            next(p for p in patterns if p.match(path))
+        scan = (time.perf_counter() - start) / lookups
+        report[f"{size}_routes"] = {"trie_ns": round(trie * 1e9), "regex_scan_ns": round(scan * 1e9)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000, help="per request type")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--table-sizes", type=int, nargs="+", default=[6, 50, 500])
+    args = parser.parse_args()
+
+    report = {"gateway_overhead": asyncio.run(requests_overhead(args.requests)),
+              "route_lookup": lookup_cost(args.table_sizes, args.lookups)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
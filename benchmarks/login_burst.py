@@ -0,0 +1,83 @@
+"""Catalog latency on a worker that is busy hashing passwords.
+
+    python -m benchmarks.login_burst --logins 200 --concurrency 16
+
+Serves auth_service and product_service from one uvicorn worker, then
+keeps GET /products traffic flowing while a burst of logins runs. Each
+hashing mode is measured in turn: `inline` runs scrypt on the event loop
+(what hashing inside the handler would do), `thread` and `process` use
+auth_service's pool.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import drive, serve, summarize
+import auth_service.main as auth
+from product_service.main import app as product_app
+
+
+class InlineHasher(auth.PasswordHasher):
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+
+async def products_during(client: httpx.AsyncClient, burst) -> dict:
+    latencies, done = [], asyncio.Event()
+
+    async def poll():
+        while not done.is_set():
+            start = time.perf_counter()
+            (await client.get("/catalog/products", params={"limit": 20})).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    pollers = [asyncio.create_task(poll()) for _ in range(4)]
+    started = time.perf_counter()
+    try:
+        result = await burst
+    finally:
+        done.set()
+        await asyncio.gather(*pollers)
+    return {"products": summarize(latencies, time.perf_counter() - started), "logins": result}
+
+
+def run_mode(mode: str, args) -> dict:
+    auth.hasher = InlineHasher("thread", 1, 10 ** 9) if mode == "inline" else \
+        auth.PasswordHasher(mode, args.workers, 10 ** 9)
+    app = FastAPI()
+    app.mount("/auth", auth.app)
+    app.mount("/catalog", product_app)
+    try:
+        with serve(app) as url:
+            async def scenario():
+                async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+                    idle = await products_during(client, asyncio.sleep(2))
+
+                    async def login(i):
+                        r = await client.post("/auth/login", json={"username": "user", "password": "password"})
+                        return r.status_code == 200
+
+                    busy = await products_during(client, drive(login, args.logins, args.concurrency))
+                    return {"idle_products": idle["products"], **busy}
+
+            return asyncio.run(scenario())
+    finally:
+        auth.hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=auth.HASH_WORKERS)
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread", "process"])
+    args = parser.parse_args()
+    print(json.dumps({mode: run_mode(mode, args) for mode in args.modes}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
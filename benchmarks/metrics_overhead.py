@@ -0,0 +1,68 @@
+"""Per-request cost of the metrics middleware.
+
+    python -m benchmarks.metrics_overhead --requests 20000
+
+Sends the same requests in-process (ASGI, no sockets) to two copies of a
+small app, one with `install_metrics` and one without, alternating batches
+so both see the same machine noise. Also times rendering /metrics.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import percentile
+from common.metrics import Registry, install_metrics
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/cart/{user_id}")
+    async def get_cart(user_id: int):
+        return {"user_id": user_id, "items": []}
+
+    if instrumented:
+        install_metrics(app, "bench", metrics=Registry())
+    return app
+
+
+async def run(requests: int, batch: int) -> dict:
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app(name == "metrics")),
+                                base_url="http://bench")
+        for name in ("bare", "metrics")
+    }
+    samples = {name: [] for name in clients}
+    for offset in range(0, requests, batch):
+        for name, client in clients.items():
+            for user_id in range(offset, min(offset + batch, requests)):
+                start = time.perf_counter()
+                (await client.get(f"/cart/{user_id % 1000}")).raise_for_status()
+                samples[name].append(time.perf_counter() - start)
+    start = time.perf_counter()
+    body = (await clients["metrics"].get("/metrics")).text
+    render_ms = (time.perf_counter() - start) * 1000
+    for client in clients.values():
+        await client.aclose()
+
+    report = {name: {"p50_us": round(percentile(s, 50) * 1e6, 1), "p99_us": round(percentile(s, 99) * 1e6, 1)}
+              for name, s in samples.items()}
+    report["overhead_p50_us"] = round(report["metrics"]["p50_us"] - report["bare"]["p50_us"], 1)
+    report["metrics_endpoint"] = {"ms": round(render_ms, 2), "bytes": len(body)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.batch)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
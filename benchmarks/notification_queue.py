@@ -0,0 +1,64 @@
+"""Notification intake: one message per request vs /send/batch.
+
+    python -m benchmarks.notification_queue --messages 20000 --concurrency 32
+
+Serves notification_service with a file sink and sends the same number of
+messages through POST /send and through POST /send/batch, then reports
+request latency, messages accepted per second and the enqueue-to-delivered
+latency from GET /queue.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import drive, serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch", type=int, default=100, help="messages per /send/batch call")
+    args = parser.parse_args()
+
+    sink_path = os.path.join(tempfile.mkdtemp(), "notifications.jsonl")
+    os.environ["NOTIFY_SINK"] = f"file://{sink_path}"
+    os.environ.setdefault("NOTIFY_QUEUE_SIZE", str(args.messages * 2))
+    import notification_service.main as service
+
+    report = {}
+    with serve(service.app) as url:
+        async def run():
+            async with httpx.AsyncClient(base_url=url, timeout=30,
+                                         limits=httpx.Limits(max_connections=args.concurrency)) as client:
+                async def single(i):
+                    r = await client.post("/send", json={"user_id": i, "message": f"Order {i} shipped"})
+                    return r.status_code == 202
+
+                async def batch(i):
+                    messages = [{"user_id": i * args.batch + j, "message": f"Promo {j}"} for j in range(args.batch)]
+                    r = await client.post("/send/batch", json={"messages": messages})
+                    return r.status_code == 202
+
+                for name, call, calls in (("send", single, args.messages),
+                                          ("send_batch", batch, args.messages // args.batch)):
+                    started = time.perf_counter()
+                    stats = await drive(call, calls, args.concurrency)
+                    while (await client.get("/queue")).json()["queued"]:
+                        await asyncio.sleep(0.01)
+                    stats["messages_per_s"] = round(calls * (1 if name == "send" else args.batch)
+                                                    / (time.perf_counter() - started), 1)
+                    report[name] = stats
+                report["queue"] = (await client.get("/queue")).json()
+
+        asyncio.run(run())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
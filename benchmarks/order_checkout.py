@@ -0,0 +1,85 @@
+"""Checkout latency with a deliberately slow notification service.
+
+    python -m benchmarks.order_checkout --orders 1000 --concurrency 32 --notify-delay 0.5
+
+Runs order_service against the real product and payment services (with
+enough stock that no checkout is refused) and a notification stub
+that sleeps `--notify-delay` seconds per message. Reports POST /orders
+latency (what the shopper waits for) and, separately, how long orders take
+to reach `confirmed` by polling a sample of them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import drive, serve, summarize
+
+notifications = FastAPI()
+NOTIFY_DELAY = {"seconds": 0.5}
+
+
+@notifications.post("/send")
+async def send():
+    await asyncio.sleep(NOTIFY_DELAY["seconds"])
+    return {"status": "sent"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--notify-delay", type=float, default=0.5)
+    parser.add_argument("--sample", type=int, default=100, help="orders polled until confirmed")
+    args = parser.parse_args()
+    NOTIFY_DELAY["seconds"] = args.notify_delay
+
+    os.environ.setdefault("PRODUCT_DEFAULT_STOCK", str(10 ** 9))
+    from payment_service.main import app as payment_app
+    from product_service.main import app as product_app
+    with serve(product_app) as product_url, serve(payment_app) as payment_url, serve(notifications) as notify_url:
+        os.environ["PRODUCT_SERVICE_URL"] = product_url
+        os.environ["PAYMENT_SERVICE_URL"] = payment_url
+        os.environ["NOTIFICATION_SERVICE_URL"] = notify_url
+        import order_service.main as orders
+        orders.PRODUCT_SERVICE_URL = product_url
+        orders.PAYMENT_SERVICE_URL, orders.NOTIFICATION_SERVICE_URL = payment_url, notify_url
+
+        with serve(orders.app) as order_url:
+            async def run():
+                placed = []
+                async with httpx.AsyncClient(base_url=order_url, timeout=30,
+                                             limits=httpx.Limits(max_connections=args.concurrency)) as client:
+                    async def checkout(i):
+                        r = await client.post("/orders", json={"user_id": i % 100,
+                                                                "items": [{"product_id": 1 + i % 10, "quantity": 1}]})
+                        placed.append((time.perf_counter(), r.json()))
+                        return r.status_code == 202
+
+                    checkout_stats = await drive(checkout, args.orders, args.concurrency)
+
+                    confirm_latencies = []
+                    for started, order in placed[:args.sample]:
+                        while True:
+                            r = await client.get(f"/orders/{order['user_id']}/{order['order_id']}")
+                            if r.json()["status"] != "pending":
+                                confirm_latencies.append(time.perf_counter() - started)
+                                break
+                            await asyncio.sleep(0.005)
+                    return {
+                        "checkout": checkout_stats,
+                        "time_to_confirmed_upper_bound": summarize(confirm_latencies, 1.0),
+                        "pipeline": (await client.get("/orders/pipeline")).json(),
+                    }
+
+            report = asyncio.run(run())
+    report["notify_delay_s"] = args.notify_delay
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Order history paging, the NDJSON export and the sales report.
+
+    python -m benchmarks.order_history --users 2000 --orders-per-user 50 --heavy-user-orders 20000
+
+Fills order_service's store (memory and SQLite backends) with settled orders,
+then, with the service on loopback:
+
+- reads the first page of one user with a long history, against reading the
+  whole list in one response as GET /orders/{user_id} used to;
+- pulls every order with GET /orders/export, against one full-list call per
+  user, reporting time and peak memory allocated (tracemalloc) for each;
+- reads GET /orders/report, against recomputing it from every order.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+import order_service.main as om
+from benchmarks.common import percentile, serve
+from common.reporting import build_report, day_of, tally
+from common.storage import MemoryStorage, SQLiteStorage
+
+HEAVY_USER = 0
+
+
+def make_order(user_id: int, n: int) -> dict:
+    items = [{"product_id": 1 + n % 7, "quantity": 1 + n % 3, "unit_price": 9.99},
+             {"product_id": 8 + n % 5, "quantity": 1, "unit_price": 24.5}]
+    return {"order_id": f"{user_id:06d}-{n:06d}", "user_id": user_id, "items": items,
+            "total_amount": round(sum(i["quantity"] * i["unit_price"] for i in items), 2),
+            "status": "confirmed" if n % 10 else "payment_failed", "created_at": 1.7e9 + n}
+
+
+async def seed(args) -> int:
+    days = {}
+    total = 0
+    for user_id in range(args.users):
+        count = args.heavy_user_orders if user_id == HEAVY_USER else args.orders_per_user
+        orders = [make_order(user_id, n) for n in range(count)]
+        # Concurrent puts share SQLite commits
+        await asyncio.gather(*(om.order_store.put(user_id, order["order_id"], order) for order in orders))
+        for n, order in enumerate(orders):
+            day = day_of(order["created_at"] + n % 30 * 86400)
+            days[day] = tally(days.get(day), order)
+        total += count
+    for day, record in days.items():
+        await om.report_store.put("daily", day, record)
+    return total
+
+
+async def timed(call, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    return {"p50_ms": round(percentile(samples, 50) * 1000, 2), "p99_ms": round(percentile(samples, 99) * 1000, 2)}
+
+
+async def peak(call) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = await call()
+    finally:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"seconds": round(time.perf_counter() - start, 3), "peak_mb": round(peak_bytes / 2**20, 1), **result}
+
+
+async def run(url: str, args) -> dict:
+    report = {}
+    async with httpx.AsyncClient(base_url=url, timeout=600) as client:
+        heavy = f"/orders/{HEAVY_USER}"
+
+        async def whole_history():
+            return json.dumps(list((await om.order_store.items(HEAVY_USER)).values()))
+
+        report["history"] = {
+            "first_page_50": await timed(lambda: client.get(heavy, params={"limit": 50}), args.repeat),
+            "cursor_page_50": await timed(lambda: client.get(heavy, params={
+                "limit": 50, "cursor": make_order(HEAVY_USER, args.heavy_user_orders // 2)["order_id"]}),
+                args.repeat),
+            # What the handler used to do: load and serialize the whole history
+            "whole_history": await timed(whole_history, max(1, args.repeat // 10)),
+        }
+
+        async def export():
+            lines = 0
+            async with client.stream("GET", "/orders/export") as r:
+                async for line in r.aiter_lines():
+                    lines += bool(line)
+            return {"orders": lines}
+
+        async def per_user():
+            # The old way: every user's full list, each response held whole
+            orders = requests = 0
+            for user_id in await om.order_store.partitions():
+                cursor = None
+                while True:
+                    r = await client.get(f"/orders/{user_id}", params={"limit": om.MAX_PAGE_SIZE,
+                                                                       **({"cursor": cursor} if cursor else {})})
+                    orders += len(r.json())
+                    requests += 1
+                    cursor = r.headers.get("x-next-cursor")
+                    if cursor is None:
+                        break
+            return {"orders": orders, "requests": requests}
+
+        report["export"] = {"ndjson_stream": await peak(export), "per_user_requests": await peak(per_user)}
+
+        async def recompute():
+            days = {}
+            for user_id in await om.order_store.partitions():
+                for order in (await om.order_store.items(user_id)).values():
+                    days["all"] = tally(days.get("all"), order)
+            return build_report(days)
+
+        report["report"] = {"incremental": await timed(lambda: client.get("/orders/report"), args.repeat),
+                            "recomputed_from_orders": await timed(recompute, 1)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--orders-per-user", type=int, default=50)
+    parser.add_argument("--heavy-user-orders", type=int, default=20000, help="history length of one user")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {"memory": lambda: MemoryStorage(),
+                    "sqlite": lambda: SQLiteStorage(os.path.join(tmp, "orders.db"))}
+        for name, factory in backends.items():
+            storage = factory()
+            om.order_store = storage.collection("orders")
+            om.report_store = storage.collection("order_reports")
+            started = time.perf_counter()
+            report[name] = {"orders": asyncio.run(seed(args)), "seed_s": round(time.perf_counter() - started, 2)}
+            with serve(om.app) as url:
+                report[name].update(asyncio.run(run(url, args)))
+            asyncio.run(storage.aclose())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
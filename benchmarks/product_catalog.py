@@ -0,0 +1,59 @@
+"""Lookup and page latency of the product catalog as it grows.
+
+    python -m benchmarks.product_catalog --sizes 100000 1000000
+
+Seeds ProductCatalog directly (bulk load), then times id lookups, first and
+deep cursor pages, and price-range pages. Latencies should stay flat as the
+catalog grows because every operation is a dict hit or a bisection.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import percentile
+from product_service.main import ProductCatalog
+
+
+def timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"p50_us": round(percentile(samples, 50) * 1e6, 2), "p99_us": round(percentile(samples, 99) * 1e6, 2)}
+
+
+def bench(size: int, repeat: int) -> dict:
+    rng = random.Random(size)
+    start = time.perf_counter()
+    catalog = ProductCatalog(
+        {"id": i, "name": f"Product {rng.random():.8f}", "price": round(rng.uniform(1, 3000), 2)}
+        for i in range(1, size + 1)
+    )
+    load_seconds = time.perf_counter() - start
+
+    _, deep_cursor = catalog.page(limit=size // 2)
+    ids = [rng.randint(1, size) for _ in range(repeat)]
+    return {
+        "size": size,
+        "load_s": round(load_seconds, 2),
+        "get_by_id": timed(lambda: catalog.get(ids[rng.randrange(repeat)]), repeat),
+        "first_page": timed(lambda: catalog.page(limit=50), repeat),
+        "deep_page": timed(lambda: catalog.page(limit=50, cursor=deep_cursor), repeat),
+        "price_range_page": timed(lambda: catalog.page(sort="price", min_price=1000, max_price=1200, limit=50), repeat),
+        "name_sorted_page": timed(lambda: catalog.page(sort="name", descending=True, limit=50), repeat),
+        "insert": timed(lambda: catalog.add({"name": f"New {rng.random()}", "price": rng.uniform(1, 3000)}), 200),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps([bench(size, args.repeat) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
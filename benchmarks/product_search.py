@@ -0,0 +1,83 @@
+"""Search latency on large synthetic catalogs.
+
+    python -m benchmarks.product_search --sizes 100000 1000000
+
+Products get a brand, a category and a few descriptive words drawn from a
+Zipf-like vocabulary, so some terms are rare and some appear in a large share
+of the catalog ("gaming" is in one product of seven, each category in one of
+fifteen). Reports index build time and p50/p99 per query shape; the common
+terms and short prefixes are the expensive ones.
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+
+from benchmarks.common import percentile
+from product_service.main import ProductCatalog
+
+BRANDS = ["asus", "apple", "sony", "corsair", "logitech", "samsung", "nintendo", "lenovo", "dell", "hp",
+          "acer", "msi", "razer", "bose", "jbl", "xiaomi", "huawei", "lg", "philips", "canon"]
+CATEGORIES = ["laptop", "phone", "headphones", "keyboard", "mouse", "monitor", "tablet", "earbuds",
+              "console", "camera", "speaker", "router", "charger", "watch", "drone"]
+
+QUERIES = {
+    "rare_term": "{rare}",
+    "common_term": "laptop",
+    "brand_category": "sony headphones",
+    "two_common_terms": "gaming laptop",
+    "typeahead_prefix": "logitech mou",
+    "common_term_prefix": "lap",
+    # The first letters of the most frequent descriptive word
+    "two_letter_prefix": "{head}",
+    "three_terms": "gaming laptop {rare}",
+}
+
+
+def make_vocabulary(rng: random.Random, size: int = 20_000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+
+
+def bench(size: int, repeat: int) -> dict:
+    rng = random.Random(size)
+    vocabulary = make_vocabulary(rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    products = []
+    for i in range(1, size + 1):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=8)
+        products.append({
+            "id": i,
+            "name": f"{rng.choice(BRANDS)} {rng.choice(CATEGORIES)} {words[0]}",
+            "price": round(rng.uniform(1, 3000), 2),
+            "description": "gaming " * (i % 7 == 0) + " ".join(words[1:]),
+        })
+    start = time.perf_counter()
+    catalog = ProductCatalog(products)
+    build_seconds = time.perf_counter() - start
+
+    index = catalog.search_index
+    report = {"size": size, "build_s": round(build_seconds, 2)}
+    for name, template in QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            query = template.format(rare=rng.choice(vocabulary[5000:]), head=vocabulary[0][:2])
+            started = time.perf_counter()
+            index.search(query, limit=20)
+            samples.append(time.perf_counter() - started)
+        report[name] = {"p50_ms": round(percentile(samples, 50) * 1000, 3),
+                        "p99_ms": round(percentile(samples, 99) * 1000, 3)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps([bench(size, args.repeat) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
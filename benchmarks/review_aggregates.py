@@ -0,0 +1,102 @@
+"""Review summaries and listing pages with millions of stored reviews.
+
+    python -m benchmarks.review_aggregates --reviews 2000000 --products 1000
+
+Seeds the in-memory store directly: half the reviews go to one hot product,
+the rest are spread over `--products` products. Times submits (which update
+the aggregate), single and bulk summaries, and first/deep pages by date and
+by rating, next to the full scan a summary used to require.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import random
+import time
+
+from fastapi import Response
+
+from benchmarks.common import percentile
+import review_service.main as svc
+
+
+async def timed(fn, repeat: int) -> dict:
+    # `fn` may return a coroutine, which is awaited inside the timing
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+        samples.append(time.perf_counter() - start)
+    return {"p50_us": round(percentile(samples, 50) * 1e6, 2), "p99_us": round(percentile(samples, 99) * 1e6, 2)}
+
+
+def seed(total: int, products: int, rng: random.Random):
+    hot = total // 2
+    counts = {1: hot}
+    for _ in range(total - hot):
+        pid = rng.randint(2, products)
+        counts[pid] = counts.get(pid, 0) + 1
+    svc.reviews.clear()
+    for pid, count in counts.items():
+        svc.reviews[pid] = {
+            rid: {"id": rid, "product_id": pid, "rating": rng.randint(1, 5), "comment": "c",
+                  "username": "u", "date": "2025-12-01"}
+            for rid in range(1, count + 1)
+        }
+    svc.summaries[svc.SUMMARIES] = {pid: svc.summarize(rs.values()) for pid, rs in svc.reviews.items()}
+    svc.indexes.clear()
+
+
+async def bench(args) -> dict:
+    rng = random.Random(args.reviews)
+    start = time.perf_counter()
+    seed(args.reviews, args.products, rng)
+    seed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await svc.product_index(1, len(svc.reviews[1]))
+    index_seconds = time.perf_counter() - start
+
+    async def page(**params):
+        # The endpoint returns a plain list and puts the cursor in a header
+        response = Response()
+        items = await svc.get_reviews_for_product(1, response, limit=50, cursor=params.pop("cursor", None), **params)
+        return items, response.headers.get("x-next-cursor")
+
+    deep = {}
+    for sort in ("date", "rating"):
+        index = svc.indexes[1]
+        _, cursor = index.page(sort=sort, descending=True, limit=len(index) // 2)
+        deep[sort] = svc.encode_cursor(cursor)
+
+    ids = list(range(1, args.products + 1))
+    submit = lambda: svc.submit_review(svc.Review(product_id=1, comment="new", rating=rng.randint(1, 5)))
+    return {
+        "reviews": args.reviews,
+        "hot_product_reviews": len(svc.reviews[1]),
+        "seed_s": round(seed_seconds, 2),
+        "index_build_s": round(index_seconds, 2),
+        "submit": await timed(submit, args.repeat),
+        "summary": await timed(lambda: svc.get_review_summary(1), args.repeat),
+        "bulk_summary_100": await timed(lambda: svc.lookup_summaries(rng.sample(ids, min(100, len(ids)))), args.repeat),
+        "full_scan_summary": await timed(lambda: svc.summarize(svc.reviews[1].values()), 5),
+        "first_page_newest": await timed(lambda: page(sort="date", order="desc"), args.repeat),
+        "deep_page_newest": await timed(lambda: page(sort="date", order="desc", cursor=deep["date"]), args.repeat),
+        "first_page_top_rated": await timed(lambda: page(sort="rating", order="desc"), args.repeat),
+        "deep_page_top_rated": await timed(lambda: page(sort="rating", order="desc", cursor=deep["rating"]), args.repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reviews", type=int, default=2_000_000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(bench(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""End-to-end load test of the whole stack through the gateway.
+
+    python -m benchmarks.stack --journeys 500 --concurrency 16
+    python -m benchmarks.stack --mode process --out baseline.json
+    python -m benchmarks.stack --mode process --baseline baseline.json --tolerance 0.2
+
+Boots every service on loopback, in this process (`--mode thread`, one
+uvicorn server per service in background threads) or as one uvicorn
+subprocess each (`--mode process`, closer to docker-compose). Virtual users
+then repeat the shopper's journey through the gateway:
+
+    GET /products -> GET /products/{id} -> GET /reviews/{id}
+    -> POST /cart/{user_id}/add -> GET /cart/{user_id}/expanded
+    -> POST /orders -> DELETE /cart/{user_id}/clear -> GET /orders/{user_id}
+
+Choices are drawn from a seeded RNG, so the same arguments replay the same
+requests. Tokens are minted with a benchmark signing key instead of logging
+in, so scrypt does not dominate the numbers (see benchmarks.login_burst).
+
+The JSON report has throughput and p50/p95/p99 per route and per journey.
+With `--baseline`, routes whose p95 grew by more than `--tolerance`, or
+that gained errors, are listed and the exit status is 1.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import free_port, serve, summarize
+from common.tokens import Keyring, issue_token
+
+BENCH_SIGNING_KEYS = "bench:load-test-signing-key"
+# Service module, gateway env var naming its URL
+SERVICES = {
+    "auth_service": "AUTH_SERVICE_URL",
+    "product_service": "PRODUCT_SERVICE_URL",
+    "cart_service": "CART_SERVICE_URL",
+    "payment_service": "PAYMENT_SERVICE_URL",
+    "notification_service": "NOTIFICATION_SERVICE_URL",
+    "order_service": "ORDER_SERVICE_URL",
+    "review_service": "REVIEW_SERVICE_URL",
+    "gateway": None,
+}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stack_env(ports: Dict[str, int]) -> Dict[str, str]:
+    # Enough stock that checkouts are never refused for running out
+    env = {"AUTH_SIGNING_KEYS": BENCH_SIGNING_KEYS, "PRODUCT_DEFAULT_STOCK": str(10 ** 9)}
+    for service, variable in SERVICES.items():
+        if variable:
+            env[variable] = f"http://127.0.0.1:{ports[service]}"
+    return env
+
+
+@contextmanager
+def in_threads(ports: Dict[str, int]):
+    # URLs are read at import time, so the environment is set first
+    os.environ.update(stack_env(ports))
+    with ExitStack() as stack:
+        for service in SERVICES:
+            app = importlib.import_module(f"{service}.main").app
+            stack.enter_context(serve(app, ports[service]))
+        yield
+
+
+@contextmanager
+def in_processes(ports: Dict[str, int]):
+    env = dict(os.environ, **stack_env(ports), PYTHONPATH=ROOT)
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "uvicorn", f"{service}.main:app", "--host", "127.0.0.1",
+                          "--port", str(ports[service]), "--log-level", "error"],
+                         cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        for service in SERVICES
+    ]
+    try:
+        deadline = time.monotonic() + 60
+        for service in SERVICES:
+            while True:
+                try:
+                    httpx.get(f"http://127.0.0.1:{ports[service]}/metrics", timeout=1).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{service} did not start")
+                    time.sleep(0.1)
+        yield
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, route: str, send) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            self.latencies[route].append(time.perf_counter() - start)
+            self.errors[route] += 1
+            raise
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+            response.raise_for_status()
+        return response
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            stats = summarize(latencies, elapsed, self.errors[route])
+            stats["error_rate"] = round(self.errors[route] / len(latencies), 4)
+            routes[route] = stats
+        return routes
+
+
+async def journey(client: httpx.AsyncClient, recorder: Recorder, rng: random.Random,
+                  user_id: int, token: str, product_ids: List[int]):
+    auth = {"Authorization": f"Bearer {token}"}
+    call = recorder.call
+    await call("GET /products", lambda: client.get("/products", params={"limit": 20}))
+    product_id = rng.choice(product_ids)
+    await call("GET /products/{id}", lambda: client.get(f"/products/{product_id}"))
+    await call("GET /reviews/{id}", lambda: client.get(f"/reviews/{product_id}", params={"limit": 20}))
+    quantity = rng.randint(1, 3)
+    await call("POST /cart/{user_id}/add", lambda: client.post(
+        f"/cart/{user_id}/add", json={"product_id": product_id, "quantity": quantity}, headers=auth))
+    cart = (await call("GET /cart/{user_id}/expanded",
+                       lambda: client.get(f"/cart/{user_id}/expanded", headers=auth))).json()
+    # The total is priced by the services; only the items are sent
+    order = {"user_id": user_id,
+             "items": [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in cart["items"]]}
+    key = f"bench-{rng.getrandbits(64):016x}"
+    await call("POST /orders", lambda: client.post("/orders", json=order,
+                                                   headers={**auth, "Idempotency-Key": key}))
+    await call("DELETE /cart/{user_id}/clear", lambda: client.delete(f"/cart/{user_id}/clear", headers=auth))
+    await call("GET /orders/{user_id}", lambda: client.get(f"/orders/{user_id}", headers=auth))
+
+
+async def load(gateway_url: str, args) -> dict:
+    keyring = Keyring.parse(BENCH_SIGNING_KEYS)
+    # Each virtual user is one shopper, so carts never contend across workers
+    tokens = {user_id: issue_token({"sub": str(user_id), "role": "user"}, keyring, 24 * 3600)
+              for user_id in range(1000, 1000 + args.concurrency)}
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=gateway_url, timeout=30, limits=limits) as client:
+        product_ids = [p["id"] for p in (await client.get("/products", params={"limit": 1000})).json()]
+        journeys = iter(range(args.journeys))
+        journey_latencies: List[float] = []
+        failed = 0
+
+        async def virtual_user(user_id: int):
+            nonlocal failed
+            for index in journeys:
+                rng = random.Random(args.seed * 1_000_003 + index)
+                start = time.perf_counter()
+                try:
+                    await journey(client, recorder, rng, user_id, tokens[user_id], product_ids)
+                except httpx.HTTPError:
+                    failed += 1
+                journey_latencies.append(time.perf_counter() - start)
+
+        # Warm pools and caches so the report reflects steady state
+        warmup = Recorder()
+        for user_id in list(tokens)[:1]:
+            await journey(client, warmup, random.Random(args.seed), user_id, tokens[user_id], product_ids)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(user_id) for user_id in tokens))
+        elapsed = time.perf_counter() - started
+    return {
+        "config": {"mode": args.mode, "journeys": args.journeys, "concurrency": args.concurrency,
+                   "seed": args.seed},
+        "elapsed_s": round(elapsed, 3),
+        "journeys": summarize(journey_latencies, elapsed, failed),
+        "routes": recorder.report(elapsed),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for route, stats in report["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if before is None:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+        if stats["error_rate"] > before["error_rate"]:
+            regressions.append(f"{route}: error rate {before['error_rate']} -> {stats['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--journeys", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 growth")
+    args = parser.parse_args()
+
+    ports = {service: free_port() for service in SERVICES}
+    # Services print notifications; keep stdout for the report
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        with (in_threads if args.mode == "thread" else in_processes)(ports):
+            report = asyncio.run(load(f"http://127.0.0.1:{ports['gateway']}", args))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Thousands of concurrent checkouts of the same hot item.
+
+    python -m benchmarks.stock_contention --checkouts 5000 --concurrency 512 --stock 2000
+
+Every checkout reserves one unit of product 1 in product_service and then,
+like order_service after payment, commits it (`--commit-ratio` of the time)
+or releases it. Runs twice: against the Inventory engine directly, to see
+its own cost, and over HTTP against the real service. Afterwards stock left
+plus units sold must equal the starting stock with nothing still reserved;
+`oversold` and `lost_units` in the report must be 0.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.common import drive, serve, summarize
+from product_service.main import InsufficientStock, Inventory, ProductCatalog, app, inventory, products_db
+
+HOT_PRODUCT = 1
+
+
+def check(stock: int, left: int, sold: int, reserved: int) -> dict:
+    return {"stock": stock, "left": left, "sold": sold, "still_reserved": reserved,
+            "oversold": max(0, sold - stock), "lost_units": stock - left - sold - reserved}
+
+
+async def engine(args) -> dict:
+    catalog = ProductCatalog([{"id": HOT_PRODUCT, "name": "Hot item", "price": 9.99, "stock": args.stock}])
+    engine = Inventory(catalog, ttl=60)
+    rng = random.Random(args.seed)
+    outcomes = {"committed": 0, "released": 0, "sold_out": 0}
+    latencies = []
+
+    async def checkout(i: int):
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        try:
+            engine.reserve(f"engine-{i}", {HOT_PRODUCT: 1})
+        except InsufficientStock:
+            outcomes["sold_out"] += 1
+            return
+        # Payment happens between reserving and settling
+        await asyncio.sleep(0)
+        if rng.random() < args.commit_ratio:
+            engine.commit(f"engine-{i}")
+            outcomes["committed"] += 1
+        else:
+            engine.release(f"engine-{i}")
+            outcomes["released"] += 1
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    for first in range(0, args.checkouts, args.concurrency):
+        await asyncio.gather(*(checkout(i) for i in range(first, min(first + args.concurrency, args.checkouts))))
+    elapsed = time.perf_counter() - started
+    return {"latency": summarize(latencies, elapsed), **outcomes,
+            **check(args.stock, catalog.get(HOT_PRODUCT)["stock"], outcomes["committed"],
+                    engine.reserved.get(HOT_PRODUCT, 0))}
+
+
+async def over_http(url: str, args) -> dict:
+    rng = random.Random(args.seed)
+    outcomes = {"committed": 0, "released": 0, "sold_out": 0}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        product = (await client.get(f"/products/{HOT_PRODUCT}")).json()
+        await client.put(f"/products/{HOT_PRODUCT}",
+                         json={"name": product["name"], "price": product["price"], "stock": args.stock})
+
+        async def checkout(i: int) -> bool:
+            r = await client.post("/inventory/reservations", json={
+                "reservation_id": f"http-{i}", "items": [{"product_id": HOT_PRODUCT, "quantity": 1}]})
+            if r.status_code == 409:
+                outcomes["sold_out"] += 1
+                return True
+            r.raise_for_status()
+            action = "commit" if rng.random() < args.commit_ratio else "release"
+            r = await client.post(f"/inventory/reservations/http-{i}/{action}")
+            r.raise_for_status()
+            outcomes["committed" if action == "commit" else "released"] += 1
+            return True
+
+        latency = await drive(checkout, args.checkouts, args.concurrency)
+        left = (await client.get(f"/products/{HOT_PRODUCT}")).json()["stock"]
+        stats = (await client.get("/inventory")).json()
+    return {"latency": latency, **outcomes,
+            **check(args.stock, left, outcomes["committed"], inventory.reserved.get(HOT_PRODUCT, 0)),
+            "inventory": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checkouts", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=512)
+    parser.add_argument("--stock", type=int, default=2000, help="units of the hot item; fewer than checkouts sells out")
+    parser.add_argument("--commit-ratio", type=float, default=0.8, help="share of checkouts whose payment succeeds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report = {"engine": asyncio.run(engine(args))}
+    snapshot = [dict(p) for p in products_db]
+    with serve(app) as url:
+        report["http"] = asyncio.run(over_http(url, args))
+    products_db.load(snapshot)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
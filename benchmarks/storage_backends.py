@@ -0,0 +1,62 @@
+"""Write and read throughput of the storage backends.
+
+    python -m benchmarks.storage_backends --ops 20000 --concurrency 64
+
+Runs cart-style read-modify-write updates from many concurrent writers, then
+point reads, against the memory backend, SQLite with group commit and SQLite
+committing every write on its own (max_batch=1).
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import drive
+from common.storage import MemoryStorage, SQLiteStorage
+
+
+def increment(current):
+    return (current or 0) + 1
+
+
+async def run(storage, ops: int, concurrency: int) -> dict:
+    carts = storage.collection("carts")
+
+    async def write(i):
+        await carts.update(i % 1000, i % 17, increment)
+        return True
+
+    async def read(i):
+        await carts.get(i % 1000, i % 17)
+        return True
+
+    writes = await drive(write, ops, concurrency)
+    reads = await drive(read, ops, concurrency)
+    await storage.aclose()
+    return {"writes": writes, "reads": reads, "storage": storage.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": lambda: MemoryStorage(),
+            "sqlite-group-commit": lambda: SQLiteStorage(os.path.join(tmp, "grouped.db")),
+            "sqlite-commit-per-write": lambda: SQLiteStorage(os.path.join(tmp, "single.db"), max_batch=1),
+        }
+        for name, factory in backends.items():
+            started = time.perf_counter()
+            report[name] = asyncio.run(run(factory(), args.ops, args.concurrency))
+            report[name]["wall_s"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Cost of authenticating one request at the gateway.
+
+    python -m benchmarks.token_verify --repeat 20000
+
+Compares a full HMAC verification, a hit in the gateway's verified-token
+cache, and the loopback HTTP round trip a gateway would pay to ask an auth
+service about the token instead.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import percentile, serve
+from common.tokens import Keyring, TokenVerifier, decode_token, issue_token
+
+
+def timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"p50_us": round(percentile(samples, 50) * 1e6, 2), "p99_us": round(percentile(samples, 99) * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    keyring = Keyring.parse("bench:" + "s" * 32)
+    tokens = [issue_token({"sub": str(i), "username": f"user{i}", "role": "user"}, keyring, 3600)
+              for i in range(args.repeat)]
+    verifier = TokenVerifier(keyring, max_entries=args.repeat)
+    for token in tokens:
+        verifier.verify(token)
+    fresh = iter(tokens)
+    cached = iter(tokens)
+
+    auth = FastAPI()
+
+    @auth.get("/verify")
+    async def verify(token: str):
+        return decode_token(token, keyring)[0]
+
+    report = {
+        "hmac_verify": timed(lambda: decode_token(next(fresh), keyring), args.repeat),
+        "cached_verify": timed(lambda: verifier.verify(next(cached)), args.repeat),
+    }
+    with serve(auth) as url:
+        async def round_trips():
+            samples = []
+            async with httpx.AsyncClient(base_url=url) as client:
+                for token in tokens[:min(args.repeat, 2000)]:
+                    start = time.perf_counter()
+                    (await client.get("/verify", params={"token": token})).raise_for_status()
+                    samples.append(time.perf_counter() - start)
+            return {"p50_us": round(percentile(samples, 50) * 1e6, 2), "p99_us": round(percentile(samples, 99) * 1e6, 2)}
+
+        report["auth_round_trip"] = asyncio.run(round_trips())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
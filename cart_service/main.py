@@ -1,36 +1,118 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
 from typing import List, Dict
+import asyncio
+import os
+import weakref
 
-app = FastAPI(title="Cart Service")
+from common.health import install_health
+from common.metrics import install_metrics
+from common.storage import DELETE, open_storage
+from common.tracing import install_tracing
+
+# Storage: {user_id: {product_id: quantity}}, kept in insertion order.
+# With the default memory:// backend `carts` is the live store.
+carts: Dict[int, Dict[int, int]] = {}
+storage = open_storage(os.getenv("STORAGE_URL", "memory://"))
+cart_store = storage.collection("carts", data=carts)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await storage.aclose()
+
+
+app = FastAPI(title="Cart Service", lifespan=lifespan)
+install_tracing(app, "cart_service")
+install_metrics(app, "cart_service")
+install_health(app, {"storage": storage.ping})
+
+# One lock per user with an active write; entries vanish once no request holds them
+_cart_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
 
-# In-memory storage: {user_id: [items]}
-carts: Dict[int, List[dict]] = {}
 # Model for cart item
 class CartItem(BaseModel):
     product_id: int
     quantity: int
 
+class BulkAddRequest(BaseModel):
+    items: List[CartItem] = Field(..., min_length=1)
+
+class QuantityUpdate(BaseModel):
+    quantity: int = Field(..., ge=0)
+
+
+def user_lock(user_id: int) -> asyncio.Lock:
+    lock = _cart_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _cart_locks[user_id] = lock
+    return lock
+
+
+async def cart_items(user_id: int) -> List[dict]:
+    return [{"product_id": pid, "quantity": qty} for pid, qty in (await cart_store.items(user_id)).items()]
+
+
+async def write_response(user_id: int, message: str, return_cart: bool, **extra) -> dict:
+    # Writes answer with the cart size only; the full cart is opt-in
+    body = {"message": message, **extra, "cart_size": await cart_store.count(user_id)}
+    if return_cart:
+        body["cart"] = await cart_items(user_id)
+    return body
+
+
+def add_quantity(quantity: int):
+    def apply(current):
+        new_quantity = (current or 0) + quantity
+        return new_quantity if new_quantity > 0 else DELETE
+    return apply
+
+
 @app.get("/cart/{user_id}")
 async def get_cart(user_id: int):
-    return carts.get(user_id, [])
+    return await cart_items(user_id)
 
 @app.post("/cart/{user_id}/add")
-async def add_to_cart(user_id: int, item: CartItem):
-    if user_id not in carts:
-        carts[user_id] = []
-    
-    # Check if item exists and update quantity
-    for cart_item in carts[user_id]:
-        if cart_item["product_id"] == item.product_id:
-            cart_item["quantity"] += item.quantity
-            return {"message": "Item quantity updated", "cart": carts[user_id]}
-
-    carts[user_id].append(item.dict())
-    return {"message": "Item added", "cart": carts[user_id]}
+async def add_to_cart(user_id: int, item: CartItem, return_cart: bool = False):
+    async with user_lock(user_id):
+        existed = await cart_store.get(user_id, item.product_id) is not None
+        quantity = await cart_store.update(user_id, item.product_id, add_quantity(item.quantity))
+        message = "Item quantity updated" if existed else "Item added"
+        return await write_response(user_id, message, return_cart,
+                                    item={"product_id": item.product_id, "quantity": quantity or 0})
+
+@app.post("/cart/{user_id}/bulk-add")
+async def bulk_add_to_cart(user_id: int, request: BulkAddRequest, return_cart: bool = False):
+    totals: Dict[int, int] = {}
+    for item in request.items:
+        totals[item.product_id] = totals.get(item.product_id, 0) + item.quantity
+    async with user_lock(user_id):
+        # Issued together so a persistent backend commits them in one batch
+        await asyncio.gather(*(cart_store.update(user_id, pid, add_quantity(qty)) for pid, qty in totals.items()))
+        return await write_response(user_id, "Items added", return_cart, added=len(request.items))
+
+@app.put("/cart/{user_id}/items/{product_id}")
+async def set_item_quantity(user_id: int, product_id: int, update: QuantityUpdate, return_cart: bool = False):
+    async with user_lock(user_id):
+        if update.quantity == 0:
+            await cart_store.delete(user_id, product_id)
+        else:
+            await cart_store.put(user_id, product_id, update.quantity)
+        return await write_response(user_id, "Item quantity set", return_cart,
+                                    item={"product_id": product_id, "quantity": update.quantity})
+
+@app.delete("/cart/{user_id}/items/{product_id}")
+async def remove_item(user_id: int, product_id: int, return_cart: bool = False):
+    async with user_lock(user_id):
+        if not await cart_store.delete(user_id, product_id):
+            raise HTTPException(status_code=404, detail="Item not in cart")
+        return await write_response(user_id, "Item removed", return_cart)
 
 @app.delete("/cart/{user_id}/clear")
 async def clear_cart(user_id: int):
-    if user_id in carts:
-        carts[user_id] = []
+    async with user_lock(user_id):
+        await cart_store.clear(user_id)
     return {"message": "Cart cleared"}
@@ -7,7 +7,7 @@ def test_add_to_cart():
     snapshot = {k: v.copy() for k, v in carts.items()}
     try:
         user_id = 1
-        r = client.post(f"/cart/{user_id}/add", json={"product_id": 1, "quantity": 2})
+        r = client.post(f"/cart/{user_id}/add", params={"return_cart": True}, json={"product_id": 1, "quantity": 2})
         assert r.status_code == 200
         data = r.json()
         assert data["message"] in ("Item added", "Item quantity updated")
@@ -43,4 +43,33 @@ def test_clear_cart():
         assert r.status_code == 200
         assert r.json() == []
     finally:
-        carts.clear(); carts.update(snapshot)
\ No newline at end of file
+        carts.clear(); carts.update(snapshot)
+
+def test_add_merges_quantity_without_echoing_cart():
+    snapshot = {k: v.copy() for k, v in carts.items()}
+    try:
+        user_id = 4
+        client.post(f"/cart/{user_id}/add", json={"product_id": 5, "quantity": 1})
+        r = client.post(f"/cart/{user_id}/add", json={"product_id": 5, "quantity": 2})
+        data = r.json()
+        assert data["message"] == "Item quantity updated"
+        assert data["item"] == {"product_id": 5, "quantity": 3}
+        assert data["cart_size"] == 1
+        assert "cart" not in data
+    finally:
+        carts.clear(); carts.update(snapshot)
+
+def test_bulk_add_set_quantity_and_remove():
+    snapshot = {k: v.copy() for k, v in carts.items()}
+    try:
+        user_id = 5
+        r = client.post(f"/cart/{user_id}/bulk-add", json={"items": [
+            {"product_id": 1, "quantity": 1}, {"product_id": 2, "quantity": 4}, {"product_id": 1, "quantity": 1}]})
+        assert r.json()["cart_size"] == 2
+        r = client.put(f"/cart/{user_id}/items/2", params={"return_cart": True}, json={"quantity": 7})
+        assert r.json()["cart"] == [{"product_id": 1, "quantity": 2}, {"product_id": 2, "quantity": 7}]
+        assert client.delete(f"/cart/{user_id}/items/1").status_code == 200
+        assert client.delete(f"/cart/{user_id}/items/1").status_code == 404
+        assert client.get(f"/cart/{user_id}").json() == [{"product_id": 2, "quantity": 7}]
+    finally:
+        carts.clear(); carts.update(snapshot)
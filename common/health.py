@@ -0,0 +1,81 @@
+"""Liveness and readiness endpoints, and an OpenAPI document rendered once.
+
+`install_health(app, checks)` adds:
+
+    GET /healthz   200 while the process is serving requests; touches nothing else
+    GET /readyz    200 when every readiness check passes, 503 naming the ones that fail
+
+A check is an async callable that returns when its dependency is usable
+and raises otherwise (a storage ping, the payment service's /healthz).
+Checks run concurrently, each within READY_CHECK_TIMEOUT seconds.
+
+Probes should use /healthz: it costs a dict lookup, where /openapi.json
+serializes the whole schema. That schema is still built lazily on the
+first request, so it adds nothing to startup, and the encoded bytes are
+kept and served as is afterwards.
+"""
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2"))
+
+Check = Callable[[], Awaitable[None]]
+
+
+async def _failure(check: Check, timeout: float) -> Optional[str]:
+    try:
+        async with asyncio.timeout(timeout):
+            await check()
+    except TimeoutError:
+        return f"no answer within {timeout}s"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def install_health(app, checks: Optional[Dict[str, Check]] = None, timeout: float = READY_CHECK_TIMEOUT):
+    """Add /healthz and /readyz to a FastAPI app and cache its OpenAPI document."""
+    checks = dict(checks or {})
+
+    async def healthz(request):
+        return JSONResponse({"status": "ok"})
+
+    async def readyz(request):
+        failures = await asyncio.gather(*(_failure(check, timeout) for check in checks.values()))
+        ready = not any(failures)
+        return JSONResponse({"status": "ready" if ready else "not ready",
+                             "checks": {name: failure or "ok" for name, failure in zip(checks, failures)}},
+                            status_code=200 if ready else 503)
+
+    app.add_route("/healthz", healthz, methods=["GET"], include_in_schema=False)
+    app.add_route("/readyz", readyz, methods=["GET"], include_in_schema=False)
+    cache_openapi(app)
+
+
+def cache_openapi(app):
+    """Serve app.openapi_url from bytes encoded on its first request."""
+    if not app.openapi_url:
+        return
+    # By root path, which FastAPI adds to the document's servers
+    rendered: Dict[str, bytes] = {}
+
+    async def openapi(request):
+        root_path = request.scope.get("root_path", "").rstrip("/")
+        body = rendered.get(root_path)
+        if body is None:
+            schema = app.openapi()
+            if root_path and app.root_path_in_servers and \
+                    root_path not in {server.get("url") for server in schema.get("servers", [])}:
+                schema = dict(schema, servers=[{"url": root_path}] + schema.get("servers", []))
+            body = rendered[root_path] = json.dumps(schema, ensure_ascii=False, separators=(",", ":")).encode()
+        return Response(body, media_type="application/json")
+
+    routes = app.router.routes
+    for index, route in enumerate(routes):
+        if isinstance(route, Route) and route.path == app.openapi_url:
+            routes[index] = Route(app.openapi_url, openapi, methods=["GET"], include_in_schema=False)
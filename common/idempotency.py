@@ -0,0 +1,103 @@
+"""Idempotency-Key support for non-idempotent endpoints.
+
+A client (or the gateway) that retries a POST sends the same
+``Idempotency-Key`` header each time. The first request runs the handler;
+later ones with that key get the stored result back instead of running it
+again. A repeat that arrives while the first is still running waits for
+its result.
+
+Results are kept in a bounded LRU that also evicts entries older than
+``ttl`` seconds. Failed executions are not stored, so a retry after an
+error runs again.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Tuple
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body."""
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "expires")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future, expires: float):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.expires = expires
+
+
+class IdempotencyCache:
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def _evict(self, now: float, limit: int):
+        # Entries are kept in insertion order, so expired ones sit at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            # A request still running is never dropped for capacity; the cache overshoots instead
+            if entry.expires > now and (len(self._entries) <= limit or not entry.future.done()):
+                break
+            del self._entries[key]
+
+    async def run(self, key: str, fingerprint: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run `fn` once per key; returns (result, replayed)."""
+        now = time.monotonic()
+        self._evict(now, self.max_entries)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            self.hits += 1
+            return await asyncio.shield(entry.future), True
+
+        self.misses += 1
+        self._evict(now, self.max_entries - 1)
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = _Entry(fingerprint, future, now + self.ttl)
+        try:
+            result = await fn()
+        except BaseException as e:
+            # Waiting duplicates see the same error; later retries run again
+            if key in self._entries and self._entries[key].future is future:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception retrieved in case nobody else was waiting
+                future.exception()
+            raise
+        future.set_result(result)
+        return result, False
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "conflicts": self.conflicts,
+        }
@@ -0,0 +1,191 @@
+"""Request metrics in the Prometheus text format, without extra dependencies.
+
+`install_metrics(app, service)` adds an ASGI middleware that records, per
+route template (``/cart/{user_id}``, never the raw path):
+
+    http_requests_total{method,route,status}
+    http_request_duration_seconds{method,route}   histogram
+    http_requests_in_flight                       gauge
+
+and serves everything in the process registry on ``GET /metrics``.
+Outbound calls are timed with `observe_upstream` or `timed_upstream`:
+
+    upstream_request_duration_seconds{upstream,method,outcome}   histogram
+
+Recording a request is a few dict lookups and one bisection, so the
+middleware is cheap enough to leave on everywhere.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from starlette.responses import PlainTextResponse
+
+# Upper bounds in seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = ['%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters, gauges and histograms keyed by metric name and label values."""
+
+    def __init__(self):
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        # Guards creation of new series; updates from worker threads are rare
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._help[name] = (kind, help_text)
+        if kind == "histogram":
+            self._histograms.setdefault(name, {})
+            self._buckets[name] = buckets
+        else:
+            self._values.setdefault(name, {})
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1.0):
+        series = self._values[name]
+        series[labels] = series.get(labels, 0.0) + amount
+
+    def set(self, name: str, value: float, labels: Labels = ()):
+        self._values[name][labels] = value
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        series = self._histograms[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(labels, Histogram(self._buckets[name]))
+        histogram.observe(value)
+
+    def samples(self, name: str) -> Dict[Labels, float]:
+        return dict(self._values.get(name, {}))
+
+    def histogram(self, name: str, labels: Labels) -> Histogram:
+        return self._histograms[name][labels]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, (kind, help_text) in self._help.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                for labels, value in list(self._values[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            for labels, histogram in list(self._histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, 'le="%g"' % bound)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{bucket_labels} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def describe_defaults(metrics: Registry):
+    """Declare the series recorded by this module; safe to call more than once."""
+    metrics.describe("http_requests_total", "counter", "HTTP requests handled, by route and status")
+    metrics.describe("http_request_duration_seconds", "histogram", "Time to handle an HTTP request, by route")
+    metrics.describe("http_requests_in_flight", "gauge", "HTTP requests being handled")
+    metrics.describe("upstream_request_duration_seconds", "histogram", "Time spent in calls to other services")
+    if () not in metrics.samples("http_requests_in_flight"):
+        metrics.set("http_requests_in_flight", 0)
+
+
+registry = Registry()
+describe_defaults(registry)
+
+
+def observe_upstream(upstream: str, method: str, outcome, seconds: float, metrics: Registry = registry):
+    """Record one outbound call; `outcome` is the status code or an error name."""
+    metrics.observe("upstream_request_duration_seconds", seconds,
+                    (("upstream", upstream), ("method", method), ("outcome", str(outcome))))
+
+
+async def timed_upstream(upstream: str, method: str, call, metrics: Registry = registry):
+    """Await `call()` (returning an httpx response) and record how long it took."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await call()
+        outcome = response.status_code
+        return response
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        observe_upstream(upstream, method, outcome, time.perf_counter() - start, metrics)
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Registry = registry):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.inc("http_requests_in_flight")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.inc("http_requests_in_flight", amount=-1)
+            # The router leaves the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            self.metrics.inc("http_requests_total", (("method", method), ("route", template), ("status", str(status))))
+            self.metrics.observe("http_request_duration_seconds", elapsed, (("method", method), ("route", template)))
+
+
+def install_metrics(app, service: str, metrics: Registry = registry):
+    """Instrument a FastAPI app and expose GET /metrics."""
+    describe_defaults(metrics)
+    metrics.describe("service_info", "gauge", "Service name")
+    metrics.set("service_info", 1, (("service", service),))
+
+    async def metrics_endpoint(request):
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
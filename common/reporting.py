@@ -0,0 +1,100 @@
+"""Sales aggregates kept up to date as orders settle.
+
+Each settled order is added to the record of its day (UTC):
+
+    {"confirmed": 3, "payment_failed": 1, "units": 7, "revenue_cents": 4250,
+     "products": {"1": [5, 3000], "2": [2, 1250]}}   # product id -> [units, cents]
+
+so a report is a sum over a handful of day records instead of a pass over
+every order. Money is counted in integer cents to keep sums exact. Reports
+from several shards are combined with ``merge_reports``.
+"""
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+CONFIRMED = "confirmed"
+PAYMENT_FAILED = "payment_failed"
+
+
+def day_of(timestamp: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def cents(amount: float) -> int:
+    return round(amount * 100)
+
+
+def new_record() -> dict:
+    return {CONFIRMED: 0, PAYMENT_FAILED: 0, "units": 0, "revenue_cents": 0, "products": {}}
+
+
+def tally(record: Optional[dict], order: dict) -> dict:
+    """Add one settled order to a day record; usable as a storage update()."""
+    record = record or new_record()
+    record[order["status"]] += 1
+    if order["status"] == CONFIRMED:
+        record["revenue_cents"] += cents(order["total_amount"])
+        for item in order["items"]:
+            product = record["products"].setdefault(str(item["product_id"]), [0, 0])
+            product[0] += item["quantity"]
+            product[1] += cents(item.get("unit_price", 0)) * item["quantity"]
+            record["units"] += item["quantity"]
+    return record
+
+
+def _add(total: dict, record: dict) -> dict:
+    for field in (CONFIRMED, PAYMENT_FAILED, "units", "revenue_cents"):
+        total[field] += record[field]
+    _add_products(total["products"], record["products"].items())
+    return total
+
+
+def _add_products(total: Dict[str, list], products: Iterable[Tuple[str, list]]):
+    for product_id, (units, amount) in products:
+        product = total.setdefault(product_id, [0, 0])
+        product[0] += units
+        product[1] += amount
+
+
+def _render(record: dict) -> dict:
+    return {CONFIRMED: record[CONFIRMED], PAYMENT_FAILED: record[PAYMENT_FAILED],
+            "units": record["units"], "revenue": record["revenue_cents"] / 100}
+
+
+def _report(days: Dict[str, dict], products: Dict[str, list]) -> dict:
+    total = new_record()
+    for record in days.values():
+        _add(total, dict(record, products={}))
+    ranked = sorted(products.items(), key=lambda entry: (-entry[1][1], int(entry[0])))
+    return {
+        **_render(total),
+        "products": [{"product_id": int(product_id), "units": units, "revenue": amount / 100}
+                     for product_id, (units, amount) in ranked],
+        "days": {day: _render(days[day]) for day in sorted(days)},
+    }
+
+
+def build_report(days: Dict[str, dict], since: Optional[date] = None, until: Optional[date] = None) -> dict:
+    """Totals, per product (best sellers first) and per day over the day records in range."""
+    first = since.isoformat() if since else ""
+    last = until.isoformat() if until else "9999-12-31"
+    selected = {day: record for day, record in days.items() if first <= day <= last}
+    products: Dict[str, list] = {}
+    for record in selected.values():
+        _add_products(products, record["products"].items())
+    return _report(selected, products)
+
+
+def merge_reports(reports: Iterable[dict]) -> dict:
+    """Combine reports built from disjoint sets of orders (one per shard)."""
+    days: Dict[str, dict] = {}
+    products: Dict[str, list] = {}
+    for report in reports:
+        for day, totals in report["days"].items():
+            _add(days.setdefault(day, new_record()), {
+                CONFIRMED: totals[CONFIRMED], PAYMENT_FAILED: totals[PAYMENT_FAILED], "units": totals["units"],
+                "revenue_cents": cents(totals["revenue"]), "products": {}})
+        _add_products(products, ((str(p["product_id"]), [p["units"], cents(p["revenue"])])
+                                 for p in report["products"]))
+    return _report(days, products)
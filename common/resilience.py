@@ -0,0 +1,237 @@
+"""Deadlines, retries, circuit breaking and load shedding for upstream calls.
+
+Each upstream gets one `Resilience` guard. A call through the guard:
+
+1. is rejected with `Overloaded` if `max_in_flight` calls are already running;
+2. is rejected with `CircuitOpen` while the upstream's breaker is open;
+3. must finish within `deadline` seconds, retries included;
+4. is retried on connection errors and 502/503/504 when the caller marks it
+   safe to repeat, with full-jitter exponential backoff, as long as the
+   retry budget allows.
+
+The retry budget caps retries at a fraction of recent calls, so a failing
+upstream sees at most `1 + retry_ratio` times its normal load instead of
+`max_attempts` times.
+
+The breaker opens after `failure_threshold` consecutive failures (connection
+errors, timeouts and 5xx responses). After `reset_timeout` seconds it lets
+`half_open_calls` probes through; if they succeed it closes, otherwise it
+opens again.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """The call was not attempted, or ran out of time, because the upstream is unhealthy."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class Overloaded(UpstreamUnavailable):
+    pass
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+class Policy(NamedTuple):
+    deadline: float = 10.0
+    max_attempts: int = 3
+    backoff_base: float = 0.05
+    backoff_max: float = 1.0
+    retry_ratio: float = 0.2
+    failure_threshold: int = 5
+    reset_timeout: float = 10.0
+    half_open_calls: int = 1
+    max_in_flight: int = 100
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = self._probe_successes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_calls:
+            self._probes += 1
+            return True
+        return False
+
+    def record_success(self):
+        if self._state == HALF_OPEN:
+            self._probe_successes += 1
+            if self._probe_successes < self.half_open_calls:
+                return
+        self._state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.times_opened += 1
+            self._state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # A probe that ended without an outcome (the caller went away)
+        if self._state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def reset(self):
+        self._state = CLOSED
+        self.failures = 0
+
+    def stats(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "retry_after": round(self.retry_after(), 3) if state == OPEN else 0.0,
+        }
+
+
+class RetryBudget:
+    """Token bucket: every call deposits `ratio` tokens, every retry spends one."""
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Resilience:
+    def __init__(self, name: str, policy: Policy = Policy()):
+        self.name = name
+        self.policy = policy
+        self.breaker = CircuitBreaker(policy.failure_threshold, policy.reset_timeout, policy.half_open_calls)
+        self.budget = RetryBudget(policy.retry_ratio)
+        self.in_flight = 0
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.shed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]], retry: bool = False) -> httpx.Response:
+        """Run `send` under the policy; `retry` marks the request safe to repeat."""
+        policy = self.policy
+        if self.in_flight >= policy.max_in_flight:
+            self.shed += 1
+            raise Overloaded(self.name, "too many requests in flight", retry_after=1.0)
+        self.calls += 1
+        self.budget.deposit()
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                if not self.breaker.allow():
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, "circuit open", retry_after=self.breaker.retry_after())
+                self.attempts += 1
+                response, error = None, None
+                try:
+                    # Unlike wait_for, timeout_at never swallows a cancellation that
+                    # races with the response, so workers stop cleanly on shutdown
+                    async with asyncio.timeout_at(deadline):
+                        response = await send()
+                except TimeoutError:
+                    self.timeouts += 1
+                    self.breaker.record_failure()
+                    raise DeadlineExceeded(self.name, f"no response within {policy.deadline}s")
+                except httpx.RequestError as e:
+                    self.breaker.record_failure()
+                    error = e
+                except BaseException:
+                    self.breaker.release()
+                    raise
+                else:
+                    if response.status_code < 500:
+                        self.breaker.record_success()
+                        return response
+                    self.breaker.record_failure()
+                    if response.status_code not in RETRYABLE_STATUS:
+                        return response
+
+                # Exponential backoff with full jitter, never past the deadline
+                delay = random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** (attempt - 1)))
+                if (not retry or attempt >= policy.max_attempts
+                        or loop.time() + delay >= deadline or not self.budget.withdraw()):
+                    if error is not None:
+                        raise error
+                    return response
+                if response is not None:
+                    await response.aclose()
+                self.retries += 1
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            **self.breaker.stats(),
+            "deadline": self.policy.deadline,
+            "max_in_flight": self.policy.max_in_flight,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "retry_tokens": round(self.budget.tokens, 2),
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
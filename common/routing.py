@@ -0,0 +1,138 @@
+"""Declarative proxy route tables, compiled into a prefix trie.
+
+A route sends every path under ``prefix`` to an upstream:
+
+    - prefix: /products
+      upstream: product
+      methods: [GET, POST, PUT, DELETE]
+      rewrite: /products        # upstream path prefix replacing `prefix` (default: unchanged)
+      cache_ttl: 30             # GETs are served from the response cache
+      invalidates: /products    # writes flush this cached collection
+      shard: false              # first segment after the prefix is the user id of a sharded upstream
+
+Tables are read from YAML (with PyYAML installed) or JSON, either a list of
+routes or ``{"routes": [...]}``. Matching walks the trie one path segment
+at a time and picks the longest prefix that allows the method, so a more
+specific route (``/products/batch``) overrides a broader one only for the
+methods it lists.
+"""
+import json
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+ROUTE_FIELDS = frozenset({"prefix", "upstream", "methods", "rewrite", "cache_ttl", "invalidates", "shard"})
+
+
+class RouteLabel(NamedTuple):
+    # Stands in for the router's route in the ASGI scope, so metrics and
+    # traces are labelled by template rather than by raw path
+    path: str
+
+
+class Route:
+    __slots__ = ("prefix", "upstream", "methods", "rewrite", "cache_ttl", "invalidates", "shard",
+                 "_root_label", "_nested_label")
+
+    def __init__(self, prefix: str, upstream: str, methods: Iterable[str], rewrite: Optional[str] = None,
+                 cache_ttl: Optional[float] = None, invalidates: Optional[str] = None, shard: bool = False):
+        if not prefix.startswith("/") or (prefix != "/" and prefix.endswith("/")):
+            raise ValueError(f"Route prefix must start and not end with '/': {prefix!r}")
+        methods = frozenset(method.upper() for method in methods)
+        if not methods or not methods <= HTTP_METHODS:
+            raise ValueError(f"Invalid methods for {prefix}: {sorted(methods)}")
+        if "GET" in methods:
+            methods |= {"HEAD"}
+        self.prefix = "" if prefix == "/" else prefix
+        self.upstream = upstream
+        self.methods: FrozenSet[str] = methods
+        self.rewrite = self.prefix if rewrite is None else rewrite.rstrip("/")
+        self.cache_ttl = None if cache_ttl is None else float(cache_ttl)
+        self.invalidates = invalidates
+        self.shard = bool(shard)
+        self._root_label = RouteLabel(self.prefix or "/")
+        self._nested_label = RouteLabel(self.prefix + "/{path:path}")
+
+    def label(self, rest: str) -> RouteLabel:
+        return self._nested_label if rest else self._root_label
+
+    def __repr__(self) -> str:
+        return f"Route({self.prefix or '/'!r} -> {self.upstream}, {sorted(self.methods)})"
+
+
+def parse_routes(entries) -> List[Route]:
+    if isinstance(entries, dict):
+        entries = entries.get("routes")
+    if not isinstance(entries, list):
+        raise ValueError("A route table is a list of routes")
+    routes = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not {"prefix", "upstream", "methods"} <= entry.keys():
+            raise ValueError(f"A route needs prefix, upstream and methods: {entry!r}")
+        unknown = entry.keys() - ROUTE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown route fields {sorted(unknown)} in {entry['prefix']}")
+        routes.append(Route(**entry))
+    return routes
+
+
+def read_routes(path: str) -> List[Route]:
+    """Load a route table from a .yaml/.yml or .json file."""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError(f"PyYAML is needed to read {path}; install it or use JSON")
+        return parse_routes(yaml.safe_load(text))
+    return parse_routes(json.loads(text))
+
+
+class _Node:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # method -> route ending at this node
+        self.routes: Dict[str, Route] = {}
+
+
+class RouteTable:
+    """Routes compiled into a trie keyed by path segment."""
+
+    def __init__(self, routes: Iterable[Route]):
+        self.routes = list(routes)
+        self._root = _Node()
+        for route in self.routes:
+            node = self._root
+            for segment in route.prefix.split("/")[1:]:
+                node = node.children.setdefault(segment, _Node())
+            for method in route.methods:
+                if method in node.routes:
+                    raise ValueError(f"Two routes for {method} {route.prefix or '/'}")
+                node.routes[method] = route
+
+    def match(self, method: str, path: str) -> Optional[Tuple[Route, str]]:
+        """Return (route, rest of the path after its prefix) or None."""
+        node = self._root
+        best, best_end = node.routes.get(method), 0
+        end = 0
+        length = len(path)
+        while end < length:
+            start = end + 1
+            end = path.find("/", start)
+            if end == -1:
+                end = length
+            node = node.children.get(path[start:end])
+            if node is None:
+                break
+            route = node.routes.get(method)
+            if route is not None:
+                best, best_end = route, end
+        if best is None:
+            return None
+        return best, path[best_end:]
+
+    def allowed(self, path: str) -> FrozenSet[str]:
+        """Methods some route accepts for `path`; empty when no prefix matches."""
+        return frozenset(method for method in HTTP_METHODS if self.match(method, path) is not None)
@@ -0,0 +1,100 @@
+"""Partitioning per-user services across several processes.
+
+cart_service and order_service keep each user's data in one process. To
+use more than one core they run as N shards, one uvicorn process each, and
+the gateway sends every request for a user to that user's shard with a
+consistent-hash ring, so adding a shard moves only about 1/N of the users.
+
+Start the shards with
+
+    python -m common.sharding main:app --host 0.0.0.0 --port 8003 --shards 4
+
+which serves shard i on port 8003 + i (the same as plain uvicorn when
+``--shards`` is 1). ``{shard}`` in ``STORAGE_URL`` is replaced by the
+shard index, so each shard can have its own SQLite file.
+
+With the in-memory store, data of users that move to another shard after
+the shard count changes is not carried over.
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import signal
+import subprocess
+import sys
+from typing import Iterable, List
+from urllib.parse import urlsplit, urlunsplit
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, with virtual nodes for balance."""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key) -> str:
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._owners[index]
+
+
+def shard_urls(base_url: str, count: int) -> List[str]:
+    """URLs of `count` shards listening on consecutive ports from `base_url`'s."""
+    if count == 1:
+        return [base_url]
+    parts = urlsplit(base_url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return [urlunsplit(parts._replace(netloc=f"{parts.hostname}:{port + i}")) for i in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an app as N uvicorn shards on consecutive ports")
+    parser.add_argument("app", help="ASGI app, e.g. main:app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARDS", "1")))
+    args, uvicorn_args = parser.parse_known_args(argv)
+
+    def command(index: int) -> List[str]:
+        return [sys.executable, "-m", "uvicorn", args.app, "--host", args.host,
+                "--port", str(args.port + index), *uvicorn_args]
+
+    def environment(index: int) -> dict:
+        env = dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(args.shards))
+        if "STORAGE_URL" in env:
+            env["STORAGE_URL"] = env["STORAGE_URL"].replace("{shard}", str(index))
+        return env
+
+    if args.shards == 1:
+        os.execve(sys.executable, command(0), environment(0))
+
+    children = [subprocess.Popen(command(i), env=environment(i)) for i in range(args.shards)]
+
+    def stop(signum, frame):
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # One shard exiting takes the others down, so the container restarts as a whole
+    status = os.wait()[1]
+    stop(None, None)
+    for child in children:
+        child.wait()
+    sys.exit(1 if status else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Key-value persistence shared by the services.
+
+Data is organised in collections of partitions: a partition groups the
+records of one user or product (``carts[user_id][product_id]``), so every
+lookup is by (partition, key) or by partition alone.
+
+Two backends are available, selected by URL:
+
+    memory://                 process-local dicts (the default)
+    sqlite:///path/to/file.db SQLite in WAL mode, shareable by several
+                              worker processes on one host
+
+All operations are coroutines. SQLite work runs on two dedicated threads,
+one connection for reads and one for writes. Writes are group-committed:
+every write queued while the previous transaction commits goes into the
+next one, so one fsync covers many requests.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# update() callbacks return this to delete the record
+DELETE = object()
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class Collection:
+    """Interface implemented by each backend."""
+
+    name: str
+
+    async def get(self, partition: Hashable, key: Hashable, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    async def items(self, partition: Hashable) -> Dict[Hashable, Any]:
+        """All records of a partition, in insertion order."""
+        raise NotImplementedError
+
+    async def page(self, partition: Hashable, after: Optional[Hashable] = None,
+                   limit: int = 100) -> List[Tuple[Hashable, Any]]:
+        """Up to `limit` (key, value) records of a partition that follow the
+        key `after` in insertion order; empty if `after` is not there."""
+        raise NotImplementedError
+
+    async def count(self, partition: Hashable) -> int:
+        raise NotImplementedError
+
+    async def partitions(self) -> List[Hashable]:
+        raise NotImplementedError
+
+    async def put(self, partition: Hashable, key: Hashable, value: Any) -> None:
+        raise NotImplementedError
+
+    async def add(self, partition: Hashable, key: Hashable, value: Any) -> bool:
+        """Insert unless the key exists; returns whether it was inserted."""
+        raise NotImplementedError
+
+    async def update(self, partition: Hashable, key: Hashable, fn: Callable[[Any], Any]) -> Any:
+        """Atomically replace the value with fn(current value or None).
+
+        Returning DELETE removes the record. Returns the new value.
+        """
+        raise NotImplementedError
+
+    async def delete(self, partition: Hashable, key: Hashable) -> bool:
+        raise NotImplementedError
+
+    async def clear(self, partition: Hashable) -> None:
+        raise NotImplementedError
+
+
+class Storage:
+    def collection(self, name: str, data: Optional[Dict[Hashable, Dict[Hashable, Any]]] = None) -> Collection:
+        """Open a collection.
+
+        `data` is the backing dict for the memory backend, so module-level
+        stores keep working as before; for SQLite it is inserted as initial
+        rows where missing.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+    async def ping(self) -> None:
+        """Raise if the backend cannot serve reads; used by readiness checks."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+# --- Memory backend ---
+
+class MemoryCollection(Collection):
+    def __init__(self, name: str, data: Dict[Hashable, Dict[Hashable, Any]]):
+        self.name = name
+        self.data = data
+
+    async def get(self, partition, key, default=None):
+        return self.data.get(partition, {}).get(key, default)
+
+    async def items(self, partition):
+        return dict(self.data.get(partition, {}))
+
+    async def page(self, partition, after=None, limit=100):
+        records = self.data.get(partition, {})
+        keys = iter(records)
+        if after is not None:
+            if after not in records:
+                return []
+            for key in keys:
+                if key == after:
+                    break
+        return [(key, records[key]) for key in islice(keys, limit)]
+
+    async def count(self, partition):
+        return len(self.data.get(partition, {}))
+
+    async def partitions(self):
+        return [p for p, records in self.data.items() if records]
+
+    async def put(self, partition, key, value):
+        self.data.setdefault(partition, {})[key] = value
+
+    async def add(self, partition, key, value):
+        records = self.data.setdefault(partition, {})
+        if key in records:
+            return False
+        records[key] = value
+        return True
+
+    async def update(self, partition, key, fn):
+        records = self.data.setdefault(partition, {})
+        value = fn(records.get(key))
+        if value is DELETE:
+            records.pop(key, None)
+            return None
+        records[key] = value
+        return value
+
+    async def delete(self, partition, key):
+        return self.data.get(partition, {}).pop(key, DELETE) is not DELETE
+
+    async def clear(self, partition):
+        if partition in self.data:
+            self.data[partition] = {}
+
+
+class MemoryStorage(Storage):
+    def collection(self, name, data=None):
+        return MemoryCollection(name, data if data is not None else {})
+
+
+# --- SQLite backend ---
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+class SQLiteCollection(Collection):
+    # Statement text is fixed per table, so sqlite3's statement cache keeps
+    # each one prepared for the life of the connection.
+    def __init__(self, storage: "SQLiteStorage", name: str):
+        self.storage = storage
+        self.name = name
+        self._get = f"SELECT value FROM {name} WHERE partition = ? AND key = ?"
+        self._items = f"SELECT key, value FROM {name} WHERE partition = ? ORDER BY rowid"
+        self._page = f"SELECT key, value FROM {name} WHERE partition = ? ORDER BY rowid LIMIT ?"
+        self._page_after = (f"SELECT key, value FROM {name} WHERE partition = ? AND rowid > "
+                            f"(SELECT rowid FROM {name} WHERE partition = ? AND key = ?) ORDER BY rowid LIMIT ?")
+        self._count = f"SELECT COUNT(*) FROM {name} WHERE partition = ?"
+        self._partitions = f"SELECT DISTINCT partition FROM {name}"
+        self._put = (f"INSERT INTO {name} (partition, key, value) VALUES (?, ?, ?) "
+                     f"ON CONFLICT (partition, key) DO UPDATE SET value = excluded.value")
+        self._add = f"INSERT OR IGNORE INTO {name} (partition, key, value) VALUES (?, ?, ?)"
+        self._delete = f"DELETE FROM {name} WHERE partition = ? AND key = ?"
+        self._clear = f"DELETE FROM {name} WHERE partition = ?"
+
+    async def get(self, partition, key, default=None):
+        rows = await self.storage.read(self._get, (_encode(partition), _encode(key)))
+        return json.loads(rows[0][0]) if rows else default
+
+    async def items(self, partition):
+        rows = await self.storage.read(self._items, (_encode(partition),))
+        return {json.loads(key): json.loads(value) for key, value in rows}
+
+    async def page(self, partition, after=None, limit=100):
+        p = _encode(partition)
+        if after is None:
+            rows = await self.storage.read(self._page, (p, limit))
+        else:
+            rows = await self.storage.read(self._page_after, (p, p, _encode(after), limit))
+        return [(json.loads(key), json.loads(value)) for key, value in rows]
+
+    async def count(self, partition):
+        rows = await self.storage.read(self._count, (_encode(partition),))
+        return rows[0][0]
+
+    async def partitions(self):
+        rows = await self.storage.read(self._partitions, ())
+        return [json.loads(partition) for (partition,) in rows]
+
+    async def put(self, partition, key, value):
+        params = (_encode(partition), _encode(key), _encode(value))
+
+        def op(conn):
+            conn.execute(self._put, params)
+
+        await self.storage.write(op)
+
+    async def add(self, partition, key, value):
+        params = (_encode(partition), _encode(key), _encode(value))
+        return await self.storage.write(lambda conn: conn.execute(self._add, params).rowcount == 1)
+
+    async def update(self, partition, key, fn):
+        p, k = _encode(partition), _encode(key)
+
+        def op(conn):
+            row = conn.execute(self._get, (p, k)).fetchone()
+            value = fn(json.loads(row[0]) if row else None)
+            if value is DELETE:
+                conn.execute(self._delete, (p, k))
+                return None
+            conn.execute(self._put, (p, k, _encode(value)))
+            return value
+
+        return await self.storage.write(op)
+
+    async def delete(self, partition, key):
+        params = (_encode(partition), _encode(key))
+        return await self.storage.write(lambda conn: conn.execute(self._delete, params).rowcount > 0)
+
+    async def clear(self, partition):
+        params = (_encode(partition),)
+
+        def op(conn):
+            conn.execute(self._clear, params)
+
+        await self.storage.write(op)
+
+
+class SQLiteStorage(Storage):
+    """SQLite backend with a read connection and a group-committing writer."""
+
+    def __init__(self, path: str, max_batch: int = 512, batch_window: float = 0.0):
+        self.path = path
+        self.max_batch = max_batch
+        # Optional extra wait before a commit to let more writes join it
+        self.batch_window = batch_window
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-read")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[Callable, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.writes = 0
+        self.max_batch_seen = 0
+        self._connect().close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def collection(self, name, data=None):
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        conn = self._connect()
+        try:
+            # The primary key doubles as the (partition, key) lookup index
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ("
+                         f"partition TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                         f"PRIMARY KEY (partition, key))")
+            # Entries of an index end with the rowid, so this one walks a
+            # partition in insertion order for items() and page()
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_by_partition ON {name} (partition)")
+            if data:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {name} (partition, key, value) VALUES (?, ?, ?)",
+                    [(_encode(p), _encode(k), _encode(v)) for p, records in data.items() for k, v in records.items()],
+                )
+                conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return SQLiteCollection(self, name)
+
+    # Reads run one at a time on the reader thread; WAL lets them proceed
+    # while the writer (in this or another process) holds its lock.
+    def _run_read(self, sql: str, params: tuple) -> list:
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader.execute(sql, params).fetchall()
+
+    async def read(self, sql: str, params: tuple) -> list:
+        return await asyncio.get_running_loop().run_in_executor(self._read_executor, self._run_read, sql, params)
+
+    async def ping(self):
+        await self.read("SELECT 1", ())
+
+    def _run_batch(self, ops: List[Callable]) -> List[Tuple[bool, Any]]:
+        if self._writer is None:
+            self._writer = self._connect()
+        conn = self._writer
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op in ops:
+                # A savepoint per op keeps one failing write from undoing the rest
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, op(conn)))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def write(self, op: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer_task is None or self._writer_task.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._writer_task = loop.create_task(self._write_loop())
+        future = loop.create_future()
+        self._pending.append((op, future))
+        self._wakeup.set()
+        return await future
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self.batches += 1
+                self.writes += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                try:
+                    results = await loop.run_in_executor(self._write_executor, self._run_batch, [op for op, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), (ok, value) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "path": self.path,
+            "writes": self.writes,
+            "commits": self.batches,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "pending": len(self._pending),
+        }
+
+    async def aclose(self):
+        while self._pending:
+            await asyncio.sleep(0.001)
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        for conn, executor in ((self._reader, self._read_executor), (self._writer, self._write_executor)):
+            if conn is not None:
+                await asyncio.get_running_loop().run_in_executor(executor, conn.close)
+        self._reader = self._writer = None
+
+
+def open_storage(url: str) -> Storage:
+    """Create a backend from a URL: memory:// or sqlite:///path/to/db."""
+    if url in ("", "memory://"):
+        return MemoryStorage()
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported storage URL: {url!r}")
@@ -0,0 +1,49 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from common.health import install_health
+
+
+def test_readyz_reports_each_check():
+    state = {"db": True}
+
+    async def db():
+        if not state["db"]:
+            raise RuntimeError("database is gone")
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    app = FastAPI()
+    install_health(app, {"db": db}, timeout=0.05)
+    client = TestClient(app)
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").json() == {"status": "ready", "checks": {"db": "ok"}}
+    state["db"] = False
+    r = client.get("/readyz")
+    assert r.status_code == 503
+    assert r.json()["checks"]["db"] == "RuntimeError: database is gone"
+
+    app = FastAPI()
+    install_health(app, {"slow": slow}, timeout=0.05)
+    r = TestClient(app).get("/readyz")
+    assert r.status_code == 503 and r.json()["checks"]["slow"] == "no answer within 0.05s"
+
+
+def test_openapi_is_encoded_once():
+    app = FastAPI(title="Shop")
+    install_health(app)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {}
+
+    client = TestClient(app)
+    first = client.get("/openapi.json")
+    assert first.status_code == 200 and first.headers["content-type"] == "application/json"
+    assert list(first.json()["paths"]) == ["/items/{item_id}"]
+    calls = []
+    app.openapi = lambda: calls.append(1) or {}
+    assert client.get("/openapi.json").content == first.content and calls == []
+    assert TestClient(app, root_path="/api").get("/openapi.json").json()["servers"] == [{"url": "/api"}]
+    assert calls == [1]
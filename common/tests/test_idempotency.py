@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from common.idempotency import IdempotencyCache, IdempotencyConflict
+
+
+def test_concurrent_duplicates_run_once():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": len(calls)}
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("k", "fp", handler) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [r for r, _ in results] == [{"id": 1}] * 5
+    assert sorted(replayed for _, replayed in results) == [False, True, True, True, True]
+
+
+def test_conflict_failure_and_eviction():
+    cache = IdempotencyCache(max_entries=2, ttl=60)
+
+    async def ok():
+        return "ok"
+
+    async def boom():
+        raise RuntimeError("downstream")
+
+    async def scenario():
+        await cache.run("a", "fp", ok)
+        with pytest.raises(IdempotencyConflict):
+            await cache.run("a", "other", ok)
+        with pytest.raises(RuntimeError):
+            await cache.run("b", "fp", boom)
+        # The failed attempt is not remembered
+        assert await cache.run("b", "fp", ok) == ("ok", False)
+        await cache.run("c", "fp", ok)
+        # Capacity 2: the oldest key was evicted and runs again
+        assert await cache.run("a", "fp", ok) == ("ok", False)
+
+    asyncio.run(scenario())
+    assert cache.stats()["entries"] == 2
+
+
+def test_ttl_expiry():
+    cache = IdempotencyCache(ttl=0)
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        await cache.run("a", "fp", ok)
+        return await cache.run("a", "fp", ok)
+
+    assert asyncio.run(scenario()) == ("ok", False)
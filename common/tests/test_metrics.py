@@ -0,0 +1,70 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from common.metrics import Registry, describe_defaults, install_metrics, timed_upstream
+
+
+def make_app(metrics):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="Not found")
+        return {"id": item_id}
+
+    install_metrics(app, "test", metrics=metrics)
+    return app
+
+
+def test_requests_are_labelled_by_route_template():
+    metrics = Registry()
+    with TestClient(make_app(metrics)) as client:
+        for item_id in (1, 2, 0):
+            client.get(f"/items/{item_id}")
+        client.get("/nowhere")
+        body = client.get("/metrics").text
+    totals = metrics.samples("http_requests_total")
+    assert totals[(("method", "GET"), ("route", "/items/{item_id}"), ("status", "200"))] == 2
+    assert totals[(("method", "GET"), ("route", "/items/{item_id}"), ("status", "404"))] == 1
+    assert totals[(("method", "GET"), ("route", "unmatched"), ("status", "404"))] == 1
+    assert metrics.histogram("http_request_duration_seconds",
+                             (("method", "GET"), ("route", "/items/{item_id}"))).count == 3
+    assert metrics.samples("http_requests_in_flight")[()] == 0
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",le="+Inf"} 3' in body
+    assert 'service_info{service="test"} 1' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Registry()
+    metrics.describe("latency", "histogram", "Test", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        metrics.observe("latency", value)
+    lines = metrics.render().splitlines()
+    assert 'latency_bucket{le="0.1"} 1' in lines
+    assert 'latency_bucket{le="1"} 3' in lines
+    assert 'latency_bucket{le="+Inf"} 4' in lines
+    assert "latency_count 4" in lines
+
+
+def test_timed_upstream_records_status_or_error():
+    metrics = Registry()
+    describe_defaults(metrics)
+
+    async def ok():
+        return httpx.Response(503)
+
+    async def broken():
+        raise httpx.ConnectError("refused")
+
+    async def run():
+        assert (await timed_upstream("payment", "POST", ok, metrics)).status_code == 503
+        with pytest.raises(httpx.ConnectError):
+            await timed_upstream("payment", "POST", broken, metrics)
+
+    asyncio.run(run())
+    for outcome in ("503", "ConnectError"):
+        labels = (("upstream", "payment"), ("method", "POST"), ("outcome", outcome))
+        assert metrics.histogram("upstream_request_duration_seconds", labels).count == 1
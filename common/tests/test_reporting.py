@@ -0,0 +1,31 @@
+from datetime import date
+from common.reporting import build_report, merge_reports, tally
+
+
+def order(status, *items):
+    return {"status": status, "total_amount": sum(q * p for _, q, p in items),
+            "items": [{"product_id": pid, "quantity": q, "unit_price": p} for pid, q, p in items]}
+
+
+def test_day_records_add_up_in_cents():
+    day = None
+    for _ in range(3):
+        day = tally(day, order("confirmed", (1, 1, 0.1), (2, 2, 0.2)))
+    day = tally(day, order("payment_failed", (1, 5, 0.1)))
+    report = build_report({"2026-01-02": day, "2025-12-31": tally(None, order("confirmed", (2, 1, 9.99)))})
+    # 0.1 + 2 * 0.2, three times, with no float drift
+    assert report["days"]["2026-01-02"] == {"confirmed": 3, "payment_failed": 1, "units": 9, "revenue": 1.5}
+    assert list(report["days"]) == ["2025-12-31", "2026-01-02"]
+    assert report["products"] == [{"product_id": 2, "units": 7, "revenue": 11.19},
+                                  {"product_id": 1, "units": 3, "revenue": 0.3}]
+    assert build_report({"2026-01-02": day}, since=date(2026, 1, 3))["confirmed"] == 0
+
+
+def test_shard_reports_merge():
+    first = build_report({"2026-01-01": tally(None, order("confirmed", (1, 1, 0.1)))})
+    second = build_report({"2026-01-01": tally(None, order("confirmed", (1, 2, 0.1))),
+                           "2026-01-02": tally(None, order("payment_failed", (2, 1, 5.0)))})
+    merged = merge_reports([first, second])
+    assert (merged["confirmed"], merged["payment_failed"], merged["units"], merged["revenue"]) == (2, 1, 3, 0.3)
+    assert merged["products"] == [{"product_id": 1, "units": 3, "revenue": 0.3}]
+    assert merged["days"]["2026-01-01"]["revenue"] == 0.3
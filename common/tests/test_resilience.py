@@ -0,0 +1,95 @@
+import asyncio
+import httpx
+import pytest
+from common.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, Policy, Resilience, RetryBudget
+
+FAST = dict(backoff_base=0.001, backoff_max=0.002)
+
+
+class FlakyUpstream:
+    """Fault-injecting stub: fails the first `failures` calls with `status` (or a connect error)."""
+
+    def __init__(self, failures=0, status=503, delay=0.0):
+        self.failures = failures
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            if self.status is None:
+                raise httpx.ConnectError("refused", request=httpx.Request("GET", "http://stub/"))
+            return httpx.Response(self.status)
+        return httpx.Response(200)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()  # a single probe
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.withdraw() and not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_retries_transient_errors_when_allowed():
+    for status in (503, None):
+        guard = Resilience("stub", Policy(**FAST))
+        upstream = FlakyUpstream(failures=2, status=status)
+        resp = asyncio.run(guard.call(upstream, retry=True))
+        assert resp.status_code == 200
+        assert upstream.calls == 3 and guard.retries == 2
+
+    guard = Resilience("stub", Policy(**FAST))
+    upstream = FlakyUpstream(failures=1)
+    assert asyncio.run(guard.call(upstream)).status_code == 503
+    assert upstream.calls == 1
+
+
+def test_open_circuit_fails_fast():
+    guard = Resilience("stub", Policy(failure_threshold=3, reset_timeout=60, max_attempts=1, **FAST))
+    upstream = FlakyUpstream(failures=100, status=None)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(httpx.ConnectError):
+                await guard.call(upstream)
+        with pytest.raises(CircuitOpen) as exc:
+            await guard.call(upstream)
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert upstream.calls == 3
+    assert 0 < error.retry_after <= 60
+    assert guard.stats()["state"] == OPEN
+
+
+def test_deadline_and_load_shedding():
+    guard = Resilience("stub", Policy(deadline=0.05, max_in_flight=2, **FAST))
+    slow = FlakyUpstream(delay=1.0)
+
+    async def scenario():
+        results = await asyncio.gather(*(guard.call(slow) for _ in range(3)), return_exceptions=True)
+        return sorted(type(r).__name__ for r in results)
+
+    assert asyncio.run(scenario()) == ["DeadlineExceeded", "DeadlineExceeded", "Overloaded"]
+    assert guard.in_flight == 0 and guard.timeouts == 2 and guard.shed == 1
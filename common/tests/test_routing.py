@@ -0,0 +1,62 @@
+import pytest
+from common.routing import Route, RouteTable, parse_routes, read_routes
+
+
+def table():
+    return RouteTable(parse_routes([
+        {"prefix": "/auth", "upstream": "auth", "methods": ["POST"], "rewrite": ""},
+        {"prefix": "/products", "upstream": "product", "methods": ["GET", "POST"], "cache_ttl": 30},
+        {"prefix": "/products/batch", "upstream": "product", "methods": ["POST"]},
+    ]))
+
+
+def test_longest_prefix_allowing_the_method_wins():
+    routes = table()
+    route, rest = routes.match("POST", "/products/batch")
+    assert (route.prefix, route.cache_ttl, rest) == ("/products/batch", None, "")
+    # The specific route only takes POST; GET falls back to the broader one
+    route, rest = routes.match("GET", "/products/batch")
+    assert (route.prefix, rest) == ("/products", "/batch")
+    route, rest = routes.match("HEAD", "/products/7")
+    assert (route.prefix, rest) == ("/products", "/7")
+    assert route.label(rest).path == "/products/{path:path}" and route.label("").path == "/products"
+
+
+def test_matches_whole_segments_only():
+    routes = table()
+    assert routes.match("GET", "/productsx") is None
+    assert routes.match("GET", "/") is None
+    route, rest = routes.match("POST", "/auth/login")
+    assert route.rewrite + rest == "/login"
+
+
+def test_allowed_methods():
+    routes = table()
+    assert routes.allowed("/auth/login") == {"POST"}
+    assert routes.allowed("/products/batch") == {"GET", "HEAD", "POST"}
+    assert routes.allowed("/nowhere") == frozenset()
+
+
+def test_invalid_tables_are_rejected():
+    with pytest.raises(ValueError):
+        parse_routes([{"prefix": "/a", "upstream": "a", "methods": ["GET"], "ttl": 5}])
+    with pytest.raises(ValueError):
+        parse_routes([{"prefix": "a/", "upstream": "a", "methods": ["GET"]}])
+    with pytest.raises(ValueError):
+        Route("/a", "a", ["FETCH"])
+    with pytest.raises(ValueError):
+        RouteTable([Route("/a", "a", ["GET"]), Route("/a", "b", ["GET", "POST"])])
+
+
+def test_read_routes_from_yaml_and_json(tmp_path):
+    pytest.importorskip("yaml")
+    yaml_file = tmp_path / "routes.yaml"
+    yaml_file.write_text("routes:\n  - prefix: /v2/shop\n    upstream: product\n    methods: [GET]\n"
+                         "    rewrite: /products\n")
+    json_file = tmp_path / "routes.json"
+    json_file.write_text('[{"prefix": "/", "upstream": "product", "methods": ["GET"]}]')
+
+    route, rest = RouteTable(read_routes(str(yaml_file))).match("GET", "/v2/shop/3")
+    assert route.rewrite + rest == "/products/3"
+    route, rest = RouteTable(read_routes(str(json_file))).match("GET", "/anything")
+    assert (route.upstream, rest) == ("product", "/anything")
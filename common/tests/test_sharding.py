@@ -0,0 +1,29 @@
+from collections import Counter
+from common.sharding import HashRing, shard_urls
+
+
+def test_ring_is_deterministic_and_balanced():
+    ring = HashRing(["cart", "cart-1", "cart-2", "cart-3"])
+    owners = [ring.node_for(user_id) for user_id in range(10000)]
+    rebuilt = HashRing(ring.nodes)
+    assert owners == [rebuilt.node_for(user_id) for user_id in range(10000)]
+    # Ids arrive as ints from bodies and as strings from paths
+    assert ring.node_for(42) == ring.node_for("42")
+    counts = Counter(owners)
+    assert set(counts) == set(ring.nodes)
+    assert max(counts.values()) < 1.5 * min(counts.values())
+
+
+def test_adding_a_shard_moves_few_users():
+    before = HashRing(["order", "order-1", "order-2"])
+    after = HashRing(["order", "order-1", "order-2", "order-3"])
+    moved = [user_id for user_id in range(10000) if before.node_for(user_id) != after.node_for(user_id)]
+    # Only users taken over by the new shard move
+    assert all(after.node_for(user_id) == "order-3" for user_id in moved)
+    assert len(moved) < 10000 * 0.35
+
+
+def test_shard_urls_use_consecutive_ports():
+    assert shard_urls("http://cart_service:8003", 1) == ["http://cart_service:8003"]
+    assert shard_urls("http://cart_service:8003", 3) == [
+        "http://cart_service:8003", "http://cart_service:8004", "http://cart_service:8005"]
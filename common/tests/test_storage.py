@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from common.storage import DELETE, MemoryStorage, SQLiteStorage, open_storage
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryStorage()
+    else:
+        backend = SQLiteStorage(str(tmp_path / "store.db"))
+        yield backend
+        asyncio.run(backend.aclose())
+
+
+def test_crud_and_ordering(storage):
+    carts = storage.collection("carts", data={1: {7: 2}})
+
+    async def scenario():
+        assert await carts.get(1, 7) == 2
+        await carts.put(1, 3, 1)
+        await carts.put(1, 7, 5)
+        assert await carts.items(1) == {7: 5, 3: 1}
+        assert list(await carts.items(1)) == [7, 3]
+        assert await carts.count(1) == 2
+        assert await carts.add(1, 3, 9) is False
+        assert await carts.update(1, 3, lambda q: (q or 0) + 4) == 5
+        assert await carts.update(1, 3, lambda q: DELETE) is None
+        assert await carts.delete(1, 7) is True
+        assert await carts.delete(1, 7) is False
+        await carts.put(2, 1, {"nested": [1, 2]})
+        assert await carts.get(2, 1) == {"nested": [1, 2]}
+        await carts.clear(2)
+        assert await carts.items(2) == {}
+        assert await carts.get(9, 9, default="missing") == "missing"
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_group_commit_and_persistence(tmp_path):
+    path = str(tmp_path / "orders.db")
+    storage = SQLiteStorage(path)
+    orders = storage.collection("orders")
+
+    async def write_many():
+        await asyncio.gather(*(orders.put(user % 10, f"order-{user}", {"n": user}) for user in range(200)))
+        await storage.aclose()
+
+    asyncio.run(write_many())
+    stats = storage.stats()
+    assert stats["writes"] == 200
+    assert stats["commits"] < 200
+
+    reopened = SQLiteStorage(path).collection("orders")
+    assert len(asyncio.run(reopened.items(3))) == 20
+
+
+def test_open_storage_urls(tmp_path):
+    assert isinstance(open_storage("memory://"), MemoryStorage)
+    assert isinstance(open_storage(f"sqlite:///{tmp_path}/x.db"), SQLiteStorage)
+    with pytest.raises(ValueError):
+        open_storage("redis://localhost")
+
+
+def test_pages_follow_insertion_order(storage):
+    orders = storage.collection("orders")
+
+    async def scenario():
+        for n in range(7):
+            await orders.put(1, f"o{n}", {"n": n})
+        # Updating a record keeps its place
+        await orders.put(1, "o2", {"n": 20})
+        first = await orders.page(1, limit=3)
+        assert [key for key, _ in first] == ["o0", "o1", "o2"] and first[2][1] == {"n": 20}
+        rest = await orders.page(1, after="o2", limit=10)
+        assert [key for key, _ in rest] == ["o3", "o4", "o5", "o6"]
+        assert await orders.page(1, after="o6") == []
+        assert await orders.page(1, after="missing") == []
+        assert await orders.page(2) == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,39 @@
+import pytest
+from common.tokens import InvalidToken, Keyring, TokenVerifier, decode_token, issue_token
+
+keyring = Keyring.parse("k1:secret-one,k0:secret-zero")
+
+
+def test_round_trip_and_tampering():
+    token = issue_token({"sub": "1", "role": "user"}, keyring, ttl=60)
+    claims, kid = decode_token(token, keyring)
+    assert claims["sub"] == "1" and kid == "k1"
+    header, payload, signature = token.split(".")
+    forged = issue_token({"sub": "2", "role": "admin"}, keyring, ttl=60).split(".")[1]
+    for bad in (f"{header}.{forged}.{signature}", token[:-2], "a.b", "", token + "x"):
+        with pytest.raises(InvalidToken):
+            decode_token(bad, keyring)
+    with pytest.raises(InvalidToken):
+        decode_token(issue_token({"sub": "1"}, Keyring.parse("k1:other"), ttl=60), keyring)
+    with pytest.raises(InvalidToken):
+        decode_token(issue_token({"sub": "1"}, keyring, ttl=-1), keyring)
+
+
+def test_keyring_parse():
+    assert keyring.active == "k1" and set(keyring.keys) == {"k1", "k0"}
+    for spec in ("", "nokey", ":secret", "kid:"):
+        with pytest.raises(ValueError):
+            Keyring.parse(spec)
+
+
+def test_verifier_caches_until_expiry_or_rotation():
+    verifier = TokenVerifier(keyring, max_entries=2)
+    token = issue_token({"sub": "1"}, Keyring.parse("k0:secret-zero"), ttl=60)
+    assert verifier.verify(token) == verifier.verify(token)
+    assert (verifier.hits, verifier.misses) == (1, 1)
+    verifier.rotate(Keyring.parse("k1:secret-one"))
+    with pytest.raises(InvalidToken):
+        verifier.verify(token)
+    for user in range(3):
+        verifier.verify(issue_token({"sub": str(user)}, keyring, ttl=60))
+    assert verifier.stats()["entries"] == 2
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from common.trace_report import build_tree, critical_path, format_trace, load_spans
+from common.tracing import (FileExporter, SpanContext, Tracer, TracingMiddleware, format_traceparent,
+                            parse_traceparent)
+
+PARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_traceparent_round_trip():
+    context = parse_traceparent(PARENT)
+    assert context == SpanContext("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True)
+    assert format_traceparent(context) == PARENT
+    assert parse_traceparent(PARENT[:-1] + "0").sampled is False
+    for bad in (None, "", "garbage", "00-xyz-b7ad6b7169203331-01", "00-" + "0" * 32 + "-b7ad6b7169203331-01",
+                "ff-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"):
+        assert parse_traceparent(bad) is None
+
+
+def test_spans_nest_and_propagate_into_tasks():
+    tracer = Tracer("test")
+
+    async def run():
+        with tracer.span("outer") as outer:
+            headers = tracer.inject({"Idempotency-Key": "k"})
+
+            async def child():
+                with tracer.span("child", kind="client"):
+                    pass
+            await asyncio.create_task(child())
+        assert tracer.current() is None
+        return outer, headers
+
+    outer, headers = asyncio.run(run())
+    assert headers["Idempotency-Key"] == "k"
+    assert parse_traceparent(headers["traceparent"]) == outer.context
+    child, parent = tracer.recent
+    assert child["trace_id"] == parent["trace_id"] == outer.context.trace_id
+    assert child["parent_id"] == parent["span_id"] and parent["parent_id"] is None
+
+
+def test_middleware_continues_incoming_trace(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer("svc", FileExporter(str(path)))
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        with tracer.span("lookup"):
+            return {"id": item_id}
+
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    with TestClient(app) as client:
+        r = client.get("/items/1", headers={"traceparent": PARENT})
+        fresh = client.get("/items/2")
+    assert r.headers["x-trace-id"] == "0af7651916cd43dd8448eb211c80319c"
+    assert fresh.headers["x-trace-id"] != r.headers["x-trace-id"]
+    # The server span ended last and flushed the whole request to the file
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    server = next(s for s in spans if s["kind"] == "server" and s["trace_id"] == r.headers["x-trace-id"])
+    assert server["name"] == "GET /items/{item_id}"
+    assert server["parent_id"] == "b7ad6b7169203331"
+    assert server["attributes"]["status_code"] == 200
+    assert len(spans) == 4
+
+
+def span(span_id, parent_id, name, start, duration, service="svc"):
+    return {"trace_id": "t", "span_id": span_id, "parent_id": parent_id, "name": name, "service": service,
+            "kind": "internal", "start": start, "duration": duration, "status": "ok", "attributes": {}}
+
+
+def test_critical_path_follows_latest_finishing_work():
+    spans = [
+        span("a", None, "POST /orders", 0.0, 0.010, "gateway"),
+        span("b", "a", "POST /orders", 0.002, 0.006, "order"),
+        span("c", "b", "order.process", 0.009, 0.100, "order"),   # background, after the 202
+        span("d", "c", "POST /pay", 0.010, 0.080, "payment"),
+        span("e", "c", "POST /send", 0.015, 0.020, "notification"),  # overlaps /pay, off the path
+    ]
+    roots, children = build_tree(spans)
+    assert [root["span_id"] for root in roots] == ["a"]
+    path = [(s["span_id"], kind, round(end - start, 3)) for s, kind, start, end in critical_path(roots[0], children)]
+    # /send overlaps /pay and finishes first, so it is not on the path
+    assert path == [("a", "self", 0.002), ("b", "self", 0.006), ("b", "wait", 0.001), ("c", "self", 0.001),
+                    ("d", "self", 0.08), ("c", "self", 0.019)]
+    report = format_trace("t", spans)
+    assert "critical path" in report and "payment: POST /pay" in report
+    assert load_spans([json.dumps(s) for s in spans] + ["{truncated"])["t"] == spans
@@ -0,0 +1,165 @@
+"""HMAC-signed JWTs (HS256) shared by auth_service and the gateway.
+
+Keys are configured as ``AUTH_SIGNING_KEYS="kid1:secret1,kid2:secret2"``,
+or the same text in the file named by ``AUTH_SIGNING_KEYS_FILE``. The first
+key signs new tokens; every listed key is accepted when verifying, which is
+how keys are rotated:
+
+1. add the new key after the current one and reload the verifiers;
+2. move it to the front and restart auth_service, which then signs with it;
+3. once tokens signed with the old key have expired, remove it.
+
+Verification is a local HMAC check, so no service needs to call auth to
+trust a token. `TokenVerifier` also remembers tokens it has already
+checked, so a repeat request costs one dict lookup.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+logger = logging.getLogger("tokens")
+
+DEV_SIGNING_KEYS = "dev:insecure-development-secret"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class Keyring:
+    def __init__(self, keys: Dict[str, bytes], active: str):
+        if active not in keys:
+            raise ValueError(f"Unknown active key: {active!r}")
+        self.keys = keys
+        self.active = active
+
+    @classmethod
+    def parse(cls, spec: str) -> "Keyring":
+        keys = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            kid, sep, secret = item.partition(":")
+            if not sep or not kid or not secret:
+                raise ValueError("Signing keys must look like kid:secret[,kid:secret...]")
+            keys[kid] = secret.encode()
+        if not keys:
+            raise ValueError("At least one signing key is required")
+        return cls(keys, next(iter(keys)))
+
+    @classmethod
+    def from_env(cls) -> "Keyring":
+        path = os.getenv("AUTH_SIGNING_KEYS_FILE")
+        if path:
+            with open(path) as f:
+                return cls.parse(f.read().replace("\n", ","))
+        spec = os.getenv("AUTH_SIGNING_KEYS")
+        if not spec:
+            logger.warning("AUTH_SIGNING_KEYS is not set; using the insecure development key")
+            spec = DEV_SIGNING_KEYS
+        return cls.parse(spec)
+
+
+def _sign(key: bytes, signing_input: bytes) -> bytes:
+    return hmac.new(key, signing_input, hashlib.sha256).digest()
+
+
+def issue_token(claims: dict, keyring: Keyring, ttl: float) -> str:
+    now = int(time.time())
+    header = {"alg": "HS256", "typ": "JWT", "kid": keyring.active}
+    payload = dict(claims, iat=now, exp=now + int(ttl))
+    signing_input = ".".join(
+        _b64encode(json.dumps(part, separators=(",", ":")).encode()) for part in (header, payload)
+    ).encode()
+    return signing_input.decode() + "." + _b64encode(_sign(keyring.keys[keyring.active], signing_input))
+
+
+def decode_token(token: str, keyring: Keyring) -> Tuple[dict, str]:
+    """Check signature and expiry; returns (claims, kid)."""
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        signature = _b64decode(signature_b64)
+    except (ValueError, TypeError):
+        raise InvalidToken("Malformed token")
+    if not isinstance(header, dict) or header.get("alg") != "HS256":
+        raise InvalidToken("Unsupported token algorithm")
+    kid = header.get("kid")
+    key = keyring.keys.get(kid) if isinstance(kid, str) else None
+    if key is None:
+        raise InvalidToken("Unknown signing key")
+    if not hmac.compare_digest(signature, _sign(key, f"{header_b64}.{payload_b64}".encode())):
+        raise InvalidToken("Bad signature")
+    try:
+        claims = json.loads(_b64decode(payload_b64))
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp"), (int, float)):
+        raise InvalidToken("Token has no expiry")
+    if claims["exp"] <= time.time():
+        raise InvalidToken("Token expired")
+    return claims, kid
+
+
+class TokenVerifier:
+    """Verifies tokens, remembering valid ones in an LRU until they expire."""
+
+    def __init__(self, keyring: Keyring, max_entries: int = 10000):
+        self.keyring = keyring
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[dict, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def verify(self, token: str) -> dict:
+        cached = self._cache.get(token)
+        if cached is not None:
+            claims, kid = cached
+            # Expiry and key removal still apply to remembered tokens
+            if claims["exp"] > time.time() and kid in self.keyring.keys:
+                self._cache.move_to_end(token)
+                self.hits += 1
+                return claims
+            del self._cache[token]
+        self.misses += 1
+        try:
+            claims, kid = decode_token(token, self.keyring)
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        self._cache[token] = (claims, kid)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return claims
+
+    def rotate(self, keyring: Keyring):
+        self.keyring = keyring
+        for token in [t for t, (_, kid) in self._cache.items() if kid not in keyring.keys]:
+            del self._cache[token]
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            "active_key": self.keyring.active,
+            "keys": list(self.keyring.keys),
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,139 @@
+"""Print where the time of a traced request went.
+
+    python -m common.trace_report /traces/spans.jsonl               # latest trace
+    python -m common.trace_report /traces/spans.jsonl --trace <id>  # id from X-Trace-Id
+    python -m common.trace_report /traces/spans.jsonl --slowest 5
+
+Shows the span tree with offsets and durations, then the critical path: the
+chain of spans that determined when the trace finished, with the time each
+one spent on it itself (not in children). Time after a span ended but before
+work it started in the background finished (e.g. payment after checkout has
+returned 202) is listed as waiting.
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+
+def load_spans(lines: Iterable[str]) -> Dict[str, List[dict]]:
+    """Group spans by trace id, skipping lines that are not complete spans."""
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    for line in lines:
+        try:
+            span = json.loads(line)
+            traces[span["trace_id"]].append(span)
+        except (ValueError, KeyError, TypeError):
+            continue
+    return traces
+
+
+def span_end(span: dict) -> float:
+    return span["start"] + span["duration"]
+
+
+def build_tree(spans: List[dict]) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    """Return (roots, children by span id). Spans whose parent was not
+    recorded (e.g. sampled out or still buffered) are treated as roots."""
+    ids = {span["span_id"] for span in spans}
+    children: Dict[str, List[dict]] = defaultdict(list)
+    roots = []
+    for span in sorted(spans, key=lambda s: s["start"]):
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+    return roots, children
+
+
+def critical_path(span: dict, children: Dict[str, List[dict]]) -> List[Tuple[dict, str, float, float]]:
+    """Segments (span, "self"|"wait", start, end) on the critical path below `span`, in time order."""
+    ends: Dict[str, float] = {}
+
+    def finish(s: dict) -> float:
+        # When the span and everything it started, even in the background, was done
+        if s["span_id"] not in ends:
+            ends[s["span_id"]] = max([span_end(s)] + [finish(c) for c in children[s["span_id"]]])
+        return ends[s["span_id"]]
+
+    def walk(s: dict, cursor: float) -> List[Tuple[dict, str, float, float]]:
+        segments = []
+
+        def own(start: float, end: float):
+            # Split a gap of `s` into time inside its own interval and after it
+            inside = min(end, span_end(s))
+            if end > max(start, inside):
+                segments.append((s, "wait", max(start, inside), end))
+            if inside > start:
+                segments.append((s, "self", start, inside))
+
+        for child in sorted(children[s["span_id"]], key=finish, reverse=True):
+            child_end = finish(child)
+            if child["start"] >= cursor or child_end > cursor:
+                # Overlaps a later child already on the path
+                continue
+            own(child_end, cursor)
+            segments.extend(reversed(walk(child, child_end)))
+            cursor = child["start"]
+        own(s["start"], cursor)
+        return list(reversed(segments))
+
+    return walk(span, finish(span))
+
+
+def format_trace(trace_id: str, spans: List[dict]) -> str:
+    roots, children = build_tree(spans)
+    origin = min(span["start"] for span in spans)
+    total = max(span_end(span) for span in spans) - origin
+    lines = [f"trace {trace_id}: {total * 1000:.1f} ms, {len(spans)} spans", "",
+             f"{'start ms':>9} {'dur ms':>9}  span"]
+
+    def tree(span: dict, depth: int):
+        status = "" if span["status"] == "ok" else f"  [{span['status']}]"
+        lines.append(f"{(span['start'] - origin) * 1000:9.1f} {span['duration'] * 1000:9.1f}  "
+                     f"{'  ' * depth}{span['service']}: {span['name']} ({span['kind']}){status}")
+        for child in children[span["span_id"]]:
+            tree(child, depth + 1)
+
+    for root in roots:
+        tree(root, 0)
+
+    path = [segment for root in roots for segment in critical_path(root, children)]
+    by_span: Dict[Tuple[str, str], float] = defaultdict(float)
+    for span, kind, start, end in path:
+        by_span[(f"{span['service']}: {span['name']}", kind)] += end - start
+    lines += ["", "critical path", f"{'ms':>9} {'share':>6}  span"]
+    for (name, kind), seconds in sorted(by_span.items(), key=lambda item: -item[1]):
+        label = name if kind == "self" else f"{name} (waiting on background work)"
+        lines.append(f"{seconds * 1000:9.1f} {seconds / total * 100 if total else 0:5.1f}%  {label}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSON-lines span file written via TRACE_EXPORT_PATH")
+    parser.add_argument("--trace", help="trace id, as returned in X-Trace-Id")
+    parser.add_argument("--slowest", type=int, default=0, help="report the N slowest traces instead")
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        traces = load_spans(f)
+    if not traces:
+        sys.exit(f"No spans in {args.path}")
+    if args.trace:
+        if args.trace not in traces:
+            sys.exit(f"Trace {args.trace} not found")
+        selected = [args.trace]
+    elif args.slowest:
+        def length(trace_id):
+            spans = traces[trace_id]
+            return max(map(span_end, spans)) - min(span["start"] for span in spans)
+        selected = sorted(traces, key=length, reverse=True)[:args.slowest]
+    else:
+        selected = [max(traces, key=lambda trace_id: max(map(span_end, traces[trace_id])))]
+    print("\n\n".join(format_trace(trace_id, traces[trace_id]) for trace_id in selected))
+
+
+if __name__ == "__main__":
+    main()
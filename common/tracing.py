@@ -0,0 +1,265 @@
+"""Request tracing with W3C ``traceparent`` propagation, without extra dependencies.
+
+`install_tracing(app, service)` adds an ASGI middleware that continues the
+trace named in an incoming ``traceparent`` header (or starts one), records a
+server span per request and returns the trace id in ``X-Trace-Id``. Outbound
+calls are wrapped in ``tracer.span(..., kind="client")`` and carry the
+context on with ``tracer.inject(headers)``.
+
+Finished spans are kept in a small in-memory ring and, when
+``TRACE_EXPORT_PATH`` is set, appended as JSON lines to that file. Every
+service can share one file (a volume in docker-compose), which then holds
+whole traces for ``python -m common.trace_report``.
+"""
+import atexit
+import contextvars
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Parse ``00-<32 hex trace id>-<16 hex span id>-<flags>``; None if malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or parts[0] == "ff":
+        return None
+    _, trace_id, span_id, flags = parts
+    if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id.lower(), span_id.lower(), sampled)
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+class Span:
+    __slots__ = ("context", "parent_id", "name", "service", "kind", "start", "duration",
+                 "attributes", "status", "_parent_span", "_t0")
+
+    def __init__(self, context: SpanContext, parent_id: Optional[str], name: str, service: str,
+                 kind: str, attributes: dict, parent_span: Optional["Span"] = None):
+        self.context = context
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.kind = kind
+        self.attributes = attributes
+        self.status = "ok"
+        self.duration: Optional[float] = None
+        self._parent_span = parent_span
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class FileExporter:
+    """Appends finished spans to a JSON-lines file.
+
+    Lines are written whole with one ``os.write`` on an O_APPEND descriptor,
+    so several processes can share the file without interleaving.
+    """
+
+    def __init__(self, path: str, max_buffered: int = 256):
+        self.path = path
+        self.max_buffered = max_buffered
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lines: List[str] = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def export(self, span: dict, flush: bool = False):
+        with self._lock:
+            self._lines.append(json.dumps(span, separators=(",", ":")) + "\n")
+            if flush or len(self._lines) >= self.max_buffered:
+                self._flush()
+
+    def _flush(self):
+        if self._lines and self._fd is not None:
+            os.write(self._fd, "".join(self._lines).encode())
+        self._lines = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+# The innermost open span of the running task; tasks inherit it when created
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, service: str, exporter: Optional[FileExporter] = None,
+                 sample_rate: float = 1.0, max_recent: int = 1000):
+        self.service = service
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.recent: deque = deque(maxlen=max_recent)
+
+    def current(self) -> Optional[SpanContext]:
+        span = _current.get()
+        return span.context if span is not None else None
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", parent: Optional[SpanContext] = None,
+             **attributes) -> Iterator[Span]:
+        """Record a span around the block; the parent defaults to the current span.
+
+        Pass `parent` to continue a context captured elsewhere, e.g. from a
+        request header or a queued job.
+        """
+        parent_span = _current.get() if parent is None else None
+        if parent is None and parent_span is not None:
+            parent = parent_span.context
+        if parent is None:
+            context = SpanContext(secrets.token_hex(16), secrets.token_hex(8), random.random() < self.sample_rate)
+        else:
+            context = SpanContext(parent.trace_id, secrets.token_hex(8), parent.sampled)
+        span = Span(context, parent.span_id if parent else None, name, self.service, kind, attributes, parent_span)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        span.duration = time.perf_counter() - span._t0
+        if not span.context.sampled:
+            return
+        record = span.to_dict()
+        self.recent.append(record)
+        if self.exporter is not None:
+            # Flush once the local part of the tree is done: the span is a local
+            # root, or it ran in a background task that outlived its parent
+            local_root = span._parent_span is None or span._parent_span.duration is not None
+            self.exporter.export(record, flush=local_root)
+        span._parent_span = None
+
+    def inject(self, headers: Union[dict, list, None] = None) -> Union[dict, list]:
+        """Return `headers` with the current span's traceparent added.
+
+        A list of raw (name, value) pairs stays a list; it must not already
+        carry a traceparent.
+        """
+        context = self.current()
+        if isinstance(headers, list):
+            if context is None:
+                return headers
+            return headers + [(TRACEPARENT_HEADER.encode(), format_traceparent(context).encode())]
+        headers = dict(headers or {})
+        if context is not None:
+            headers[TRACEPARENT_HEADER] = format_traceparent(context)
+        return headers
+
+    def trace(self, trace_id: str) -> List[dict]:
+        return [span for span in self.recent if span["trace_id"] == trace_id]
+
+
+_exporters = {}
+
+
+def exporter_from_env() -> Optional[FileExporter]:
+    path = os.getenv("TRACE_EXPORT_PATH")
+    if not path:
+        return None
+    # One descriptor per file, however many tracers share it
+    if path not in _exporters:
+        _exporters[path] = FileExporter(path)
+    return _exporters[path]
+
+
+class TracingMiddleware:
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        parent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        method = scope["method"]
+        with self.tracer.span(f"{method} {scope['path']}", kind="server", parent=parent,
+                              method=method, path=scope["path"]) as span:
+            trace_id = span.context.trace_id.encode()
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set("status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    headers = list(message.get("headers", []))
+                    # A proxied response may already carry the same id from upstream
+                    if not any(key.lower() == b"x-trace-id" for key, _ in headers):
+                        message = dict(message, headers=headers + [(b"x-trace-id", trace_id)])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Named by route template once the router has matched one
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.name = f"{method} {route}"
+
+
+def install_tracing(app, service: str) -> Tracer:
+    """Trace every request to a FastAPI app; returns the service's tracer."""
+    tracer = Tracer(service, exporter_from_env(), float(os.getenv("TRACE_SAMPLE_RATE", "1.0")))
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    return tracer
@@ -5,10 +5,13 @@ import './App.css';
 
 const API_URL = 'http://localhost:8000';
 
+// Cart and order routes require the token issued at login
+const authHeaders = (user) => ({ Authorization: `Bearer ${user.token}` });
+
 // Main App Component
 function App() {
     const [user, setUser] = useState(null);
-    const [cart, setCart] = useState([]);
+    const [cartCount, setCartCount] = useState(0);
     const [searchQuery, setSearchQuery] = useState('');
 
     const handleLogout = () => setUser(null);
@@ -18,12 +21,12 @@ function App() {
         try {
             const resp = await fetch(`${API_URL}/cart/${user.user_id}/add`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...authHeaders(user) },
                 body: JSON.stringify({ product_id: productId, quantity })
             });
             const data = await resp.json();
             if (resp.ok) {
-                setCart(data.cart || []);
+                setCartCount(data.cart_size || 0);
                 return true;
             }
         } catch (e) {
@@ -34,11 +37,11 @@ function App() {
 
     return (
         <Router>
-            <Navbar user={user} cartCount={cart.length} onLogout={handleLogout} searchQuery={searchQuery} setSearchQuery={setSearchQuery} />
+            <Navbar user={user} cartCount={cartCount} onLogout={handleLogout} searchQuery={searchQuery} setSearchQuery={setSearchQuery} />
             <main className="container">
                 <Routes>
                     <Route path="/" element={<Home onAddToCart={addToCart} user={user} searchQuery={searchQuery} />} />
-                    <Route path="/cart" element={<CartPage user={user} setCart={setCart} />} />
+                    <Route path="/cart" element={<CartPage user={user} setCartCount={setCartCount} />} />
                     <Route path="/orders" element={<OrdersPage user={user} />} />
                     <Route path="/login" element={<LoginPage setUser={setUser} />} />
                     <Route path="/register" element={<RegisterPage />} />
@@ -344,20 +347,17 @@ export default App;
 // Orders Page Component
 function OrdersPage({ user }) {
     const [orders, setOrders] = useState([]);
-    const [products, setProducts] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
     const navigate = useNavigate();
 
     useEffect(() => {
         if (!user) { navigate('/login'); return; }
-        // fetch orders
-        fetch(`${API_URL}/orders/${user.user_id}`)
+        // orders with product name/price already embedded by the gateway
+        fetch(`${API_URL}/orders/${user.user_id}/expanded`, { headers: authHeaders(user) })
             .then(res => res.json())
             .then(data => { setOrders(Array.isArray(data)? data:[]); setLoading(false); })
             .catch(() => { setError('Failed to load orders'); setLoading(false); });
-        // fetch products for name/price lookup
-        fetch(`${API_URL}/products`).then(res=>res.json()).then(setProducts).catch(()=>{});
     }, [user]);
 
     if (loading) return <div className="page-title">Loading orders...</div>;
@@ -374,7 +374,7 @@ function OrdersPage({ user }) {
                             <div>Order: {o.order_id} — {o.status}</div>
                             <ul style={{marginTop:'.5rem'}}>
                                 {(Array.isArray(o.items)? o.items: []).map((it, idx) => {
-                                    const p = products.find(pp => pp.id === it.product_id);
+                                    const p = it.product;
                                     const name = p ? p.name : `Product #${it.product_id}`;
                                     const price = p ? p.price : 0;
                                     return (
@@ -392,9 +392,8 @@ function OrdersPage({ user }) {
 }
 
 // Cart Page Component
-function CartPage({ user, setCart }) {
+function CartPage({ user, setCartCount }) {
     const [items, setItems] = useState([]);
-    const [products, setProducts] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
     const [message, setMessage] = useState('');
@@ -406,29 +405,22 @@ function CartPage({ user, setCart }) {
             navigate('/login');
             return;
         }
-        // Load cart
-        fetch(`${API_URL}/cart/${user.user_id}`)
+        // Load cart with product details and prices embedded by the gateway
+        fetch(`${API_URL}/cart/${user.user_id}/expanded`, { headers: authHeaders(user) })
             .then(res => res.json())
             .then(data => {
                 console.log('Cart items loaded:', data);
-                setItems(data || []);
+                setItems(data.items || []);
                 setLoading(false);
             })
             .catch(err => {
                 setError('Failed to load cart');
                 setLoading(false);
             });
-        // Load products for item details and prices
-        fetch(`${API_URL}/products`)
-            .then(res => res.json())
-            .then(data => {
-                setProducts(data || []);
-            })
-            .catch(() => {});
     }, [user]);
 
     // Helper: find product info
-    const getProduct = (id) => products.find(p => p.id === id);
+    const getProduct = (id) => (items.find(it => it.product_id === id) || {}).product;
     const total = items.reduce((sum, it) => {
         const p = getProduct(it.product_id);
         const price = p ? p.price : 0;
@@ -441,20 +433,20 @@ function CartPage({ user, setCart }) {
         try {
             const resp = await fetch(`${API_URL}/orders`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...authHeaders(user) },
                 body: JSON.stringify({
                     user_id: user.user_id,
-                    items: items,
+                    items: items.map(({ product_id, quantity }) => ({ product_id, quantity })),
                     total_amount: total
                 })
             });
             const data = await resp.json();
             if (resp.ok) {
-                setMessage(`Order confirmed! ID: ${data.order_id}`);
+                setMessage(`Order placed! ID: ${data.order_id} (${data.status})`);
                 setShowModal(true);
                 // clear cart in backend and local state, then redirect
-                try { await fetch(`${API_URL}/cart/${user.user_id}/clear`, { method: 'DELETE' }); } catch {}
-                setCart([]);
+                try { await fetch(`${API_URL}/cart/${user.user_id}/clear`, { method: 'DELETE', headers: authHeaders(user) }); } catch {}
+                setCartCount(0);
                 setTimeout(() => {
                     setShowModal(false);
                     navigate('/');
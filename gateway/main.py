@@ -1,11 +1,355 @@
 import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import math
 import os
+import ssl
+import time
 
-app = FastAPI(title="API Gateway")
+from common.health import install_health
+from common.metrics import install_metrics, observe_upstream
+from common.reporting import merge_reports
+from common.resilience import DeadlineExceeded, Policy, Resilience, UpstreamUnavailable
+from common.routing import HTTP_METHODS, RouteTable, parse_routes, read_routes
+from common.sharding import HashRing, shard_urls
+from common.tokens import InvalidToken, Keyring, TokenVerifier
+from common.tracing import install_tracing
 
+# Service URLs from environment variables or defaults
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth_service:8001")
+PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://product_service:8002")
+CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8003")
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8004")
+REVIEW_SERVICE_URL = os.getenv("REVIEW_SERVICE_URL", "http://review_service:8007")
+
+UPSTREAMS = {
+    "auth": AUTH_SERVICE_URL,
+    "product": PRODUCT_SERVICE_URL,
+    "cart": CART_SERVICE_URL,
+    "order": ORDER_SERVICE_URL,
+    "review": REVIEW_SERVICE_URL,
+}
+
+
+def build_shards(name: str) -> HashRing:
+    """Register the shards of a per-user service in UPSTREAMS and return their ring.
+
+    CART_SERVICE_URLS lists the shards; CART_SERVICE_SHARDS=N instead means N
+    shards on consecutive ports from CART_SERVICE_URL. Shard 0 keeps the
+    service's name, so a single shard behaves exactly like before.
+    """
+    explicit = os.getenv(f"{name.upper()}_SERVICE_URLS")
+    urls = [url.strip() for url in explicit.split(",") if url.strip()] if explicit else \
+        shard_urls(UPSTREAMS[name], int(os.getenv(f"{name.upper()}_SERVICE_SHARDS", "1")))
+    names = [name] + [f"{name}-{index}" for index in range(1, len(urls))]
+    UPSTREAMS.update(zip(names, urls))
+    return HashRing(names)
+
+
+# Per-user services, split into shards by user id: {service: ring of upstream names}
+SHARD_RINGS: Dict[str, HashRing] = {name: build_shards(name) for name in ("cart", "order")}
+
+
+def shard_for(service: str, user_id) -> str:
+    return SHARD_RINGS[service].node_for(user_id)
+
+# Connection pool limits, shared by every upstream client
+MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+DEFAULT_TIMEOUT = float(os.getenv("GATEWAY_DEFAULT_TIMEOUT", "10"))
+
+# Resilience settings, shared by every upstream
+RETRY_ATTEMPTS = int(os.getenv("GATEWAY_RETRY_ATTEMPTS", "3"))
+RETRY_BUDGET = float(os.getenv("GATEWAY_RETRY_BUDGET", "0.2"))
+BREAKER_FAILURES = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("GATEWAY_BREAKER_RESET", "10"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("GATEWAY_MAX_IN_FLIGHT", "200"))
+
+# Verified bearer tokens remembered by the auth middleware
+TOKEN_CACHE_SIZE = int(os.getenv("GATEWAY_TOKEN_CACHE_SIZE", "10000"))
+
+# Methods the gateway may repeat on its own; other requests need an Idempotency-Key
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Response cache for catalog reads
+CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1024"))
+PRODUCTS_CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL_PRODUCTS", "30"))
+REVIEWS_CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL_REVIEWS", "10"))
+
+# Plain proxy routes, see common.routing; the aggregated views and POST /orders
+# have handlers of their own below. GATEWAY_ROUTES_FILE (YAML or JSON)
+# replaces this table.
+DEFAULT_ROUTES = [
+    {"prefix": "/auth", "upstream": "auth", "methods": ["POST"], "rewrite": ""},
+    {"prefix": "/products", "upstream": "product", "methods": ["GET", "POST", "PUT", "DELETE"],
+     "cache_ttl": PRODUCTS_CACHE_TTL, "invalidates": "/products"},
+    # Batch lookup is a read sent as POST; it must not flush the catalog cache
+    {"prefix": "/products/batch", "upstream": "product", "methods": ["POST"]},
+    {"prefix": "/cart", "upstream": "cart", "methods": ["GET", "POST", "PUT", "DELETE"], "shard": True},
+    {"prefix": "/orders", "upstream": "order", "methods": ["GET"], "shard": True},
+    {"prefix": "/reviews", "upstream": "review", "methods": ["GET", "POST"],
+     "cache_ttl": REVIEWS_CACHE_TTL, "invalidates": "/reviews"},
+    # Bulk rating summaries, a read like /products/batch
+    {"prefix": "/reviews/summaries", "upstream": "review", "methods": ["POST"]},
+]
+GATEWAY_ROUTES_FILE = os.getenv("GATEWAY_ROUTES_FILE")
+
+
+def build_route_table(routes) -> RouteTable:
+    table = RouteTable(routes)
+    for route in table.routes:
+        if route.upstream not in (SHARD_RINGS if route.shard else UPSTREAMS):
+            raise ValueError(f"Route {route.prefix} names unknown upstream {route.upstream!r}")
+    return table
+
+
+route_table = build_route_table(read_routes(GATEWAY_ROUTES_FILE) if GATEWAY_ROUTES_FILE
+                                else parse_routes(DEFAULT_ROUTES))
+
+
+def upstream_timeout(name: str) -> float:
+    # Per-upstream override, e.g. REVIEW_SERVICE_TIMEOUT=2
+    return float(os.getenv(f"{name.upper()}_SERVICE_TIMEOUT", DEFAULT_TIMEOUT))
+
+
+def upstream_policy(name: str) -> Policy:
+    # The timeout is the deadline for the whole call, retries included
+    return Policy(
+        deadline=upstream_timeout(name),
+        max_attempts=RETRY_ATTEMPTS,
+        retry_ratio=RETRY_BUDGET,
+        failure_threshold=BREAKER_FAILURES,
+        reset_timeout=BREAKER_RESET,
+        max_in_flight=int(os.getenv(f"{name.upper()}_SERVICE_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)),
+    )
+
+
+# Every pool shares one TLS context: building one loads the CA bundle,
+# which took more startup time than anything else the gateway does
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+class UpstreamPool:
+    """Long-lived AsyncClient for one upstream service, with usage counters.
+
+    Every request goes through the upstream's resilience guard (deadline,
+    retries, circuit breaker, in-flight limit).
+    """
+
+    def __init__(self, name: str, base_url: str, timeout: float,
+                 limits: httpx.Limits, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 policy: Optional[Policy] = None):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limits = limits
+        self.transport = transport
+        self.guard = Resilience(name, policy or Policy(deadline=timeout))
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+        # Set once the upstream has answered a probe, see warm()
+        self.warmed = False
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.transport,
+                verify=ssl_context(),
+            )
+        return self._client
+
+    async def request(self, method: str, path: str, stream: bool = False,
+                      retry: Optional[bool] = None, **kwargs) -> httpx.Response:
+        # With stream=True the body is left unread; the caller must aclose() the response.
+        # `retry` defaults to idempotent methods; a streamed body can never be replayed.
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        retry = retry and not isinstance(kwargs.get("content"), AsyncIterator)
+
+        async def send() -> httpx.Response:
+            if stream:
+                return await self.client.send(self.client.build_request(method, path, **kwargs), stream=True)
+            return await self.client.request(method, path, **kwargs)
+
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        outcome = "error"
+        # For streamed responses the span ends when the upstream's headers arrive
+        with tracer.span(f"{method} {self.name}", kind="client", upstream=self.name, path=path) as span:
+            kwargs["headers"] = tracer.inject(kwargs.get("headers"))
+            try:
+                response = await self.guard.call(send, retry=retry)
+                outcome = response.status_code
+                span.set("status_code", outcome)
+                return response
+            except (httpx.RequestError, UpstreamUnavailable) as e:
+                self.errors += 1
+                outcome = type(e).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.in_flight -= 1
+                self.total_seconds += elapsed
+                observe_upstream(self.name, method, outcome, elapsed)
+
+    async def warm(self):
+        """Open a pooled connection by fetching the upstream's /healthz.
+
+        Bypasses the resilience guard, so probes never trip the breaker.
+        """
+        resp = await self.client.get("/healthz")
+        resp.raise_for_status()
+        self.warmed = True
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "timeout": self.timeout,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "open": self._client is not None and not self._client.is_closed,
+            "warmed": self.warmed,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "avg_latency_ms": round(self.total_seconds / self.requests * 1000, 3) if self.requests else 0.0,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# One pool per upstream: {name: UpstreamPool}
+pools: Dict[str, UpstreamPool] = {}
+
+
+def get_pool(name: str) -> UpstreamPool:
+    pool = pools.get(name)
+    if pool is None:
+        # Shards ("cart-1") share their service's settings
+        service = name.partition("-")[0]
+        pool = UpstreamPool(
+            name,
+            UPSTREAMS[name],
+            timeout=upstream_timeout(service),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            policy=upstream_policy(service),
+        )
+        pools[name] = pool
+    return pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for name in UPSTREAMS:
+        get_pool(name).client
+    # Connect to every upstream in the background; /readyz reports when all have answered
+    warming = asyncio.gather(*(get_pool(name).warm() for name in UPSTREAMS), return_exceptions=True)
+    yield
+    warming.cancel()
+    for pool in pools.values():
+        await pool.aclose()
+
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
+
+token_verifier = TokenVerifier(Keyring.from_env(), TOKEN_CACHE_SIZE)
+
+# Routes whose next path segment is the id of the user who owns the resource
+USER_SCOPED_PREFIXES = ("/cart/", "/orders/")
+# Gateway internals: stats and controls that change gateway state
+ADMIN_PREFIX = "/gateway/"
+
+
+def protected_route(path: str) -> Tuple[bool, Optional[str]]:
+    """Return (needs a token, owning user id from the path if any)."""
+    if path == "/orders" or path.startswith(ADMIN_PREFIX):
+        return True, None
+    for prefix in USER_SCOPED_PREFIXES:
+        if path.startswith(prefix):
+            return True, path[len(prefix):].split("/", 1)[0]
+    return False, None
+
+
+def may_access(user: dict, owner) -> bool:
+    return user.get("role") == "admin" or str(owner) == user.get("sub")
+
+
+class AuthMiddleware:
+    """Require a valid bearer token on cart, order and /gateway/ routes.
+
+    Tokens are verified locally against the shared signing keys, so this
+    adds no network call. Users may only reach their own
+    /cart/{user_id} and /orders/{user_id} resources unless they are admins,
+    and /gateway/ is for admins only; the token claims are left in
+    request.state.user for the routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        protected, owner = protected_route(scope["path"])
+        if not protected:
+            return await self.app(scope, receive, send)
+
+        authorization = next((value for key, value in scope["headers"] if key == b"authorization"), b"")
+        scheme, _, token = authorization.decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            response = JSONResponse({"detail": "Not authenticated"}, status_code=401,
+                                    headers={"WWW-Authenticate": "Bearer"})
+            return await response(scope, receive, send)
+        try:
+            user = token_verifier.verify(token.strip())
+        except InvalidToken as e:
+            response = JSONResponse({"detail": f"Invalid token: {e}"}, status_code=401,
+                                    headers={"WWW-Authenticate": 'Bearer error="invalid_token"'})
+            return await response(scope, receive, send)
+        if (owner is not None and not may_access(user, owner)) or \
+                (scope["path"].startswith(ADMIN_PREFIX) and user.get("role") != "admin"):
+            return await JSONResponse({"detail": "Forbidden"}, status_code=403)(scope, receive, send)
+        scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
+
+
+# Added first so CORS wraps it and 401/403 responses carry CORS headers
+app.add_middleware(AuthMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -13,76 +357,409 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+tracer = install_tracing(app, "gateway")
+# Outermost, so it times everything including auth and CORS
+install_metrics(app, "gateway")
 
-# Service URLs from environment variables or defaults
-AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth_service:8001")
-PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://product_service:8002")
-CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8003")
-ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8004")
-REVIEW_SERVICE_URL = os.getenv("REVIEW_SERVICE_URL", "http://review_service:8007")
+
+def pool_warmed(name: str):
+    async def check():
+        pool = get_pool(name)
+        if not pool.warmed:
+            await pool.warm()
+    return check
+
+install_health(app, {name: pool_warmed(name) for name in UPSTREAMS})
+
+
+# Hop-by-hop headers (RFC 7230 section 6.1) must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = frozenset({'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+                                'te', 'trailer', 'transfer-encoding', 'upgrade'})
+# Compared with raw header names as received (lowercase bytes), so forwarding
+# needs no decoding or dict building. Every upstream call gets the gateway's
+# own traceparent.
+DROPPED_REQUEST_HEADERS = frozenset(name.encode() for name in HOP_BY_HOP_HEADERS | {'host', 'traceparent'})
+DROPPED_RESPONSE_HEADERS = frozenset(name.encode() for name in HOP_BY_HOP_HEADERS)
+BODYLESS_METHODS = frozenset({"GET", "HEAD"})
 
 
-async def proxy_request(url: str, method: str, request: Request):
-    async with httpx.AsyncClient() as client:
+def unavailable(e: Exception) -> HTTPException:
+    if isinstance(e, UpstreamUnavailable):
+        # Fast-fail responses tell the client when it is worth trying again
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+        status_code = 504 if isinstance(e, DeadlineExceeded) else 503
+        return HTTPException(status_code=status_code, detail=f"Service unavailable: {e}", headers=headers)
+    return HTTPException(status_code=503, detail=f"Service unavailable: {e.request.url}")
+
+
+def has_body(request: Request) -> bool:
+    return request.headers.get("content-length", "0") != "0" or "transfer-encoding" in request.headers
+
+
+async def proxy_request(upstream: str, path: str, request: Request):
+    pool = get_pool(upstream)
+    headers = [(key, value) for key, value in request.scope["headers"] if key not in DROPPED_REQUEST_HEADERS]
+    retry = request.method in IDEMPOTENT_METHODS or "idempotency-key" in request.headers
+    kwargs = {}
+    if request.method not in BODYLESS_METHODS and has_body(request):
+        # Pipe the request body through without buffering it in the gateway,
+        # unless it may have to be sent again
+        kwargs["content"] = await request.body() if retry else request.stream()
+    if request.scope["query_string"]:
+        # Merging even empty params makes httpx re-parse the URL
+        kwargs["params"] = request.query_params
+    try:
+        resp = await pool.request(request.method, path, stream=True, retry=retry, headers=headers, **kwargs)
+    except (httpx.RequestError, UpstreamUnavailable) as e:
+        raise unavailable(e)
+
+    # Upstream errors that are not JSON (plain-text 500s, proxy pages) are
+    # wrapped so clients can always read `detail` from an error
+    content_type = resp.headers.get("content-type", "")
+    if resp.status_code >= 400 and "json" not in content_type:
         try:
-            headers = {key: value for key, value in request.headers.items() if key.lower() not in ['host', 'content-length']}
-            
-            data = await request.body()
-            
-            resp = await client.request(method, url, content=data, headers=headers)
-            
-            # Try to parse as JSON, fallback to text if it fails
-            try:
-                content = resp.json()
-            except:
-                content = {"detail": resp.text}
-            
-            response_headers = {key: value for key, value in resp.headers.items() if key.lower() not in ['content-encoding', 'transfer-encoding']}
-            
-            return JSONResponse(content=content, status_code=resp.status_code, headers=response_headers)
-
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {e.request.url}")
+            await resp.aread()
+        finally:
+            await resp.aclose()
+        return JSONResponse(content={"detail": resp.text}, status_code=resp.status_code)
+
+    # Raw bytes go out unchanged, so Content-Length/Content-Encoding stay valid
+    response = StreamingResponse(resp.aiter_raw(), status_code=resp.status_code,
+                                 background=BackgroundTask(resp.aclose))
+    response.raw_headers = [(key, value) for key, value in resp.headers.raw
+                            if key.lower() not in DROPPED_RESPONSE_HEADERS]
+    return response
+
+
+class CachedResponse(NamedTuple):
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    etag: Optional[str]
+    expires: float
+
+
+class ResponseCache:
+    """LRU cache of upstream GET responses with TTLs and request coalescing.
+
+    Keys are grouped by collection ("/products", "/reviews"); a write to a
+    collection drops its entries and bumps its generation so that fetches
+    already in flight when the write happened are not stored.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, collection: str):
+        self.invalidations += 1
+        self._generations[collection] = self._generations.get(collection, 0) + 1
+        for key in [key for key in self._entries if key.startswith(collection)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    async def fetch(self, key: str, collection: str,
+                    loader: Callable[[], Awaitable[CachedResponse]]) -> Tuple[CachedResponse, str]:
+        """Return (entry, "HIT" | "MISS" | "COALESCED"), loading at most once per key."""
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry, "HIT"
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending), "COALESCED"
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on the future; don't log its exception as unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[key] = future
+        generation = self._generations.get(collection, 0)
+        try:
+            entry = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
-
-# --- Auth Routes ---
-@app.api_route("/auth/{path:path}", methods=["POST"], operation_id="auth_service_proxy")
-async def auth_proxy(path: str, request: Request):
-    return await proxy_request(f"{AUTH_SERVICE_URL}/{path}", request.method, request)
-
-# --- Product Routes ---
-@app.api_route("/products/{path:path}", methods=["GET", "POST", "PUT", "DELETE"], operation_id="products_proxy_with_path")
-@app.api_route("/products", methods=["GET", "POST"], operation_id="products_proxy_root")
-async def products_proxy(request: Request, path: str = ""):
-    url = f"{PRODUCT_SERVICE_URL}/products"
-    if path:
-        url += f"/{path}"
-    return await proxy_request(url, request.method, request)
+            future.set_exception(e)
+            raise
+        finally:
+            self._pending.pop(key, None)
+        future.set_result(entry)
+        if entry.status_code == 200 and self._generations.get(collection, 0) == generation:
+            self.put(key, entry)
+        return entry, "MISS"
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES)
+
+# Headers that describe the upstream transfer rather than the cached body;
+# x-trace-id belongs to the request that filled the entry
+UNCACHED_HEADERS = HOP_BY_HOP_HEADERS | {'content-length', 'content-encoding', 'date', 'server', 'etag', 'x-trace-id'}
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def cached_get(upstream: str, path: str, params, ttl: float) -> Tuple[CachedResponse, str]:
+    collection = "/" + path.strip("/").split("/")[0]
+    key = path + "?" + "&".join(sorted(f"{k}={v}" for k, v in httpx.QueryParams(params).multi_items()))
+
+    async def load() -> CachedResponse:
+        try:
+            resp = await get_pool(upstream).request("GET", path, params=params)
+        except (httpx.RequestError, UpstreamUnavailable) as e:
+            raise unavailable(e)
+        body = resp.content
+        etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest() if resp.status_code == 200 else None
+        headers = {key: value for key, value in resp.headers.items() if key.lower() not in UNCACHED_HEADERS}
+        return CachedResponse(resp.status_code, headers, body, etag, time.monotonic() + ttl)
+
+    return await response_cache.fetch(key, collection, load)
+
+
+async def cached_proxy(upstream: str, path: str, request: Request, ttl: float):
+    entry, cache_status = await cached_get(upstream, path, request.query_params, ttl)
+    headers = dict(entry.headers, **{"x-cache": cache_status})
+    if entry.etag:
+        headers.update({"etag": entry.etag, "cache-control": "no-cache"})
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, status_code=entry.status_code, headers=headers)
+
+
+async def invalidating_proxy(upstream: str, path: str, request: Request, collection: str):
+    response = await proxy_request(upstream, path, request)
+    response_cache.invalidate(collection)
+    return response
+
+
+# --- Aggregation helpers ---
+# Product fields embedded into cart/order views
+PRODUCT_SUMMARY_FIELDS = ("id", "name", "price")
+PRODUCT_BATCH_SIZE = int(os.getenv("GATEWAY_PRODUCT_BATCH_SIZE", "200"))
+
+
+async def fetch(upstream: str, path: str, **kwargs) -> httpx.Response:
+    try:
+        resp = await get_pool(upstream).request("GET", path, **kwargs)
+    except (httpx.RequestError, UpstreamUnavailable) as e:
+        raise unavailable(e)
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=f"Downstream service error: {resp.text}")
+    return resp
+
+
+async def fetch_json(upstream: str, path: str, **kwargs):
+    return (await fetch(upstream, path, **kwargs)).json()
+
+
+async def fetch_products(product_ids) -> Dict[int, dict]:
+    """Resolve product ids with batch lookups, run concurrently and served from the catalog cache."""
+    ids = sorted({pid for pid in product_ids if isinstance(pid, int)})
+    chunks = [ids[i:i + PRODUCT_BATCH_SIZE] for i in range(0, len(ids), PRODUCT_BATCH_SIZE)]
+    results = await asyncio.gather(*(
+        cached_get("product", "/products", {"ids": ",".join(map(str, chunk))}, PRODUCTS_CACHE_TTL)
+        for chunk in chunks
+    ))
+    products = {}
+    for entry, _ in results:
+        if entry.status_code != 200:
+            raise HTTPException(status_code=entry.status_code, detail=f"Downstream service error: {entry.body.decode(errors='replace')}")
+        for product in json.loads(entry.body):
+            products[product["id"]] = {field: product.get(field) for field in PRODUCT_SUMMARY_FIELDS}
+    return products
+
+
+def hydrate_items(items: list, products: Dict[int, dict]) -> list:
+    return [dict(item, product=products.get(item.get("product_id"))) if isinstance(item, dict) else item
+            for item in items]
+
+
+def item_product_ids(items: list):
+    return (item.get("product_id") for item in items if isinstance(item, dict))
 
 # --- Cart Routes ---
-@app.api_route("/cart/{path:path}", methods=["GET", "POST", "DELETE"], operation_id="cart_service_proxy")
-async def cart_proxy(path: str, request: Request):
-    return await proxy_request(f"{CART_SERVICE_URL}/cart/{path}", request.method, request)
+@app.get("/cart/{user_id}/expanded", operation_id="cart_expanded")
+async def cart_expanded(user_id: int):
+    items = await fetch_json(shard_for("cart", user_id), f"/cart/{user_id}")
+    products = await fetch_products(item_product_ids(items))
+    hydrated = hydrate_items(items, products)
+    total = sum(item["quantity"] * item["product"]["price"] for item in hydrated if item.get("product"))
+    return {"user_id": user_id, "items": hydrated, "total": round(total, 2)}
 
 # --- Order Routes ---
 @app.post("/orders", operation_id="create_order")
 async def orders_proxy_post(request: Request):
-    return await proxy_request(f"{ORDER_SERVICE_URL}/orders", request.method, request)
+    # The order's owner is in the body; malformed bodies are left for order_service to reject
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        body = None
+    owner = body.get("user_id") if isinstance(body, dict) else None
+    if owner is not None and not may_access(request.state.user, owner):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return await proxy_request(shard_for("order", owner), "/orders", request)
+
+def require_admin(request: Request):
+    if request.state.user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/orders/export", operation_id="orders_export")
+async def orders_export(request: Request):
+    # Every order shard's NDJSON export, one after another. All shards are
+    # asked up front so a failing one is reported before anything is sent.
+    require_admin(request)
+    params = request.query_params if request.scope["query_string"] else None
+    results = await asyncio.gather(*(get_pool(shard).request("GET", "/orders/export", stream=True, params=params)
+                                     for shard in SHARD_RINGS["order"].nodes), return_exceptions=True)
+    responses = [result for result in results if isinstance(result, httpx.Response)]
+    try:
+        for result in results:
+            if isinstance(result, (httpx.RequestError, UpstreamUnavailable)):
+                raise unavailable(result)
+            if isinstance(result, BaseException):
+                raise result
+            if result.status_code != 200:
+                await result.aread()
+                raise HTTPException(status_code=502, detail=f"Downstream service error: {result.text}")
+    except BaseException:
+        for resp in responses:
+            await resp.aclose()
+        raise
+
+    async def lines():
+        try:
+            for resp in responses:
+                async for chunk in resp.aiter_bytes():
+                    yield chunk
+        finally:
+            for resp in responses:
+                await resp.aclose()
 
-@app.api_route("/orders/{path:path}", methods=["GET"], operation_id="get_orders")
-async def orders_proxy_get(path: str, request: Request):
-    return await proxy_request(f"{ORDER_SERVICE_URL}/orders/{path}", request.method, request)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-# --- Review Routes ---
-@app.api_route("/reviews/{path:path}", methods=["GET", "POST"], operation_id="reviews_proxy_with_path")
-async def reviews_proxy(path: str, request: Request):
-    return await proxy_request(f"{REVIEW_SERVICE_URL}/reviews/{path}", request.method, request)
+@app.get("/orders/report", operation_id="orders_report")
+async def orders_report(request: Request):
+    require_admin(request)
+    params = request.query_params if request.scope["query_string"] else None
+    reports = await asyncio.gather(*(fetch_json(shard, "/orders/report", params=params)
+                                     for shard in SHARD_RINGS["order"].nodes))
+    return merge_reports(reports)
 
-@app.api_route("/reviews", methods=["POST"], operation_id="create_review")
-async def reviews_root_post(request: Request):
-    return await proxy_request(f"{REVIEW_SERVICE_URL}/reviews", request.method, request)
+@app.get("/orders/{user_id}/expanded", operation_id="orders_expanded")
+async def orders_expanded(user_id: int, request: Request, response: Response):
+    # Same paging parameters as GET /orders/{user_id}, passed through
+    resp = await fetch(shard_for("order", user_id), f"/orders/{user_id}",
+                       params=request.query_params if request.scope["query_string"] else None)
+    if "x-next-cursor" in resp.headers:
+        response.headers["X-Next-Cursor"] = resp.headers["x-next-cursor"]
+    orders = resp.json()
+    product_ids = [pid for order in orders for pid in item_product_ids(order.get("items") or [])]
+    products = await fetch_products(product_ids)
+    return [dict(order, items=hydrate_items(order.get("items") or [], products)) for order in orders]
+
+# --- Gateway internals ---
+@app.get("/gateway/pools", operation_id="gateway_pool_stats")
+async def pool_stats():
+    return {name: pool.stats() for name, pool in pools.items()}
+
+@app.get("/gateway/upstreams", operation_id="gateway_upstream_health")
+async def upstream_health():
+    return {name: pool.guard.stats() for name, pool in pools.items()}
+
+@app.post("/gateway/upstreams/{name}/reset", operation_id="gateway_upstream_reset")
+async def reset_upstream(name: str):
+    if name not in pools:
+        raise HTTPException(status_code=404, detail="Unknown upstream")
+    pools[name].guard.breaker.reset()
+    return pools[name].guard.stats()
+
+@app.get("/gateway/auth", operation_id="gateway_auth_stats")
+async def auth_stats():
+    return token_verifier.stats()
+
+@app.post("/gateway/auth/reload", operation_id="gateway_auth_reload")
+async def reload_signing_keys():
+    # Picks up rotated keys from AUTH_SIGNING_KEYS_FILE without a restart
+    try:
+        token_verifier.rotate(Keyring.from_env())
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not load signing keys: {e}")
+    return token_verifier.stats()
+
+@app.get("/gateway/cache", operation_id="gateway_cache_stats")
+async def cache_stats():
+    return response_cache.stats()
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the API Gateway"}
+
+# --- Table-driven proxy routes ---
+async def dispatch(request: Request):
+    scope = request.scope
+    method, path = scope["method"], scope["path"]
+    found = route_table.match(method, path)
+    if found is None:
+        allowed = route_table.allowed(path)
+        if allowed:
+            raise HTTPException(status_code=405, detail="Method Not Allowed",
+                                headers={"Allow": ", ".join(sorted(allowed))})
+        raise HTTPException(status_code=404, detail="Not Found")
+    route, rest = found
+    scope["route"] = route.label(rest)
+    upstream = route.upstream
+    if route.shard:
+        user_id = rest[1:].partition("/")[0]
+        if not user_id:
+            raise HTTPException(status_code=404, detail="Not Found")
+        upstream = shard_for(upstream, user_id)
+    target = route.rewrite + rest
+    if route.cache_ttl is not None and method == "GET":
+        return await cached_proxy(upstream, target, request, route.cache_ttl)
+    if route.invalidates is not None and method not in BODYLESS_METHODS:
+        return await invalidating_proxy(upstream, target, request, route.invalidates)
+    return await proxy_request(upstream, target, request)
+
+# Added last, so the handlers above and FastAPI's own routes are matched first
+app.add_route("/{path:path}", dispatch, methods=sorted(HTTP_METHODS), include_in_schema=False)
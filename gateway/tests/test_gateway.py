@@ -0,0 +1,441 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import gateway.main as gw
+from gateway.main import app, pools, response_cache, token_verifier, CachedResponse, ResponseCache, UpstreamPool
+from common.tokens import Keyring, issue_token
+
+
+class Chunks(httpx.AsyncByteStream):
+    # Unread streaming body, like a real transport returns
+    def __init__(self, *chunks: bytes):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def json_response(status_code, *chunks, headers=None):
+    return httpx.Response(status_code, headers={"content-type": "application/json", **(headers or {})},
+                          stream=Chunks(*chunks))
+
+
+def fake_upstream(request: httpx.Request):
+    # Echo enough of the request back to assert on what the gateway forwarded
+    body = '{"path": "%s", "query": "%s"}' % (request.url.path, str(request.url.query, "ascii"))
+    return json_response(200, body.encode())
+
+
+def bearer(user_id, role="user", keyring=None, ttl=60):
+    token = issue_token({"sub": str(user_id), "role": role}, keyring or token_verifier.keyring, ttl)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(autouse=True)
+def stub_pools():
+    pools.clear()
+    for name, url in gw.UPSTREAMS.items():
+        pools[name] = UpstreamPool(name, url, timeout=1.0, limits=httpx.Limits(),
+                                   transport=httpx.MockTransport(fake_upstream))
+    response_cache.clear()
+    yield
+    pools.clear()
+    response_cache.clear()
+
+
+def test_proxy_reuses_pooled_client():
+    with TestClient(app) as client:
+        first = pools["product"].client
+        r = client.get("/products/1", params={"x": "1"})
+        assert r.status_code == 200
+        assert r.json() == {"path": "/products/1", "query": "x=1"}
+        client.get("/products")
+        assert pools["product"].client is first
+        assert pools["product"].requests == 2
+
+
+def test_pool_stats_endpoint():
+    with TestClient(app) as client:
+        client.get("/reviews/1")
+        r = client.get("/gateway/pools", headers=bearer(9, role="admin"))
+        assert r.status_code == 200
+        data = r.json()
+        assert set(gw.UPSTREAMS) <= set(data)
+        assert data["review"]["requests"] == 1
+        assert data["review"]["in_flight"] == 0
+
+
+def test_metrics_endpoint_reports_routes_and_upstreams():
+    with TestClient(app) as client:
+        client.get("/products/7")
+        r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/products/{path:path}",status="200"}' in r.text
+    assert 'upstream_request_duration_seconds_count{upstream="product",method="GET",outcome="200"}' in r.text
+
+def test_trace_context_is_forwarded_upstream():
+    seen = []
+
+    def record(request):
+        # The startup probe that warms the pool carries no trace
+        if request.url.path != "/healthz":
+            seen.append(request.headers.get("traceparent"))
+        return fake_upstream(request)
+
+    pools["product"] = UpstreamPool("product", gw.UPSTREAMS["product"], timeout=1.0, limits=httpx.Limits(),
+                                    transport=httpx.MockTransport(record))
+    with TestClient(app) as client:
+        r = client.get("/products/3", headers={"traceparent": "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"})
+    assert r.headers["x-trace-id"] == "ab" * 16
+    # A fresh span id for the gateway's hop, same trace
+    _, trace_id, span_id, _ = seen[0].split("-")
+    assert trace_id == "ab" * 16 and span_id != "cd" * 8
+    client_span = next(s for s in gw.tracer.recent if s["span_id"] == span_id)
+    assert client_span["kind"] == "client" and client_span["attributes"]["status_code"] == 200
+
+def test_user_requests_stick_to_their_shard(monkeypatch):
+    ring = gw.HashRing(["cart", "cart-1"])
+    monkeypatch.setitem(gw.SHARD_RINGS, "cart", ring)
+    monkeypatch.setitem(gw.UPSTREAMS, "cart-1", "http://cart-shard-1")
+    hits = {"cart": [], "cart-1": []}
+
+    def shard(name):
+        def upstream(request):
+            if request.url.path != "/healthz":
+                hits[name].append(request.url.path)
+            return json_response(200, b"[]")
+        return upstream
+
+    for name in hits:
+        pools[name] = UpstreamPool(name, gw.UPSTREAMS[name], timeout=1.0, limits=httpx.Limits(),
+                                   transport=httpx.MockTransport(shard(name)))
+    users = [next(u for u in range(100) if ring.node_for(u) == shard) for shard in ("cart", "cart-1")]
+    with TestClient(app) as client:
+        for user_id in users:
+            assert client.get(f"/cart/{user_id}", headers=bearer(user_id)).status_code == 200
+            assert client.get(f"/cart/{user_id}/expanded", headers=bearer(user_id)).status_code == 200
+    assert hits == {"cart": [f"/cart/{users[0]}"] * 2, "cart-1": [f"/cart/{users[1]}"] * 2}
+
+def test_upstream_unavailable_returns_503():
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    pools["cart"] = UpstreamPool("cart", gw.CART_SERVICE_URL, timeout=1.0, limits=httpx.Limits(),
+                                 transport=httpx.MockTransport(refuse))
+    with TestClient(app) as client:
+        r = client.get("/cart/1", headers=bearer(1))
+        assert r.status_code == 503
+        assert pools["cart"].errors == 1
+
+
+def test_streams_body_and_headers_through():
+    seen = {}
+
+    def upstream(request: httpx.Request):
+        seen["body"] = request.read()
+        return json_response(201, b'{"id": ', b'11}', headers={"x-upstream": "product"})
+
+    pools["product"] = UpstreamPool("product", gw.PRODUCT_SERVICE_URL, timeout=1.0, limits=httpx.Limits(),
+                                    transport=httpx.MockTransport(upstream))
+    with TestClient(app) as client:
+        r = client.post("/products", json={"name": "Cable", "price": 5.0})
+        assert r.status_code == 201
+        assert r.content == b'{"id": 11}'
+        assert r.headers["x-upstream"] == "product"
+        assert seen["body"] == b'{"name":"Cable","price":5.0}'
+
+
+def test_non_json_error_is_wrapped():
+    pools["order"] = UpstreamPool("order", gw.ORDER_SERVICE_URL, timeout=1.0, limits=httpx.Limits(),
+                                  transport=httpx.MockTransport(lambda request: httpx.Response(502, text="Bad Gateway")))
+    with TestClient(app) as client:
+        r = client.get("/orders/1", headers=bearer(1))
+        assert r.status_code == 502
+        assert r.json() == {"detail": "Bad Gateway"}
+
+
+def test_catalog_get_is_cached_with_etag():
+    with TestClient(app) as client:
+        first = client.get("/products")
+        assert first.headers["x-cache"] == "MISS"
+        etag = first.headers["etag"]
+        second = client.get("/products")
+        assert second.headers["x-cache"] == "HIT"
+        assert second.content == first.content
+        assert pools["product"].requests == 1
+
+        r = client.get("/products", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        assert r.content == b""
+
+
+def test_cache_hit_carries_its_own_trace_id():
+    def traced(request):
+        # Upstream services echo the trace id of the request they served
+        trace_id = (request.headers.get("traceparent") or "00-none").split("-")[1]
+        return json_response(200, b"[]", headers={"x-trace-id": trace_id})
+
+    pools["product"] = UpstreamPool("product", gw.UPSTREAMS["product"], timeout=1.0, limits=httpx.Limits(),
+                                    transport=httpx.MockTransport(traced))
+    with TestClient(app) as client:
+        miss = client.get("/products", headers={"traceparent": "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"})
+        hit = client.get("/products", headers={"traceparent": "00-" + "ef" * 16 + "-" + "cd" * 8 + "-01"})
+    assert hit.headers["x-cache"] == "HIT"
+    assert miss.headers["x-trace-id"] == "ab" * 16
+    assert hit.headers.get_list("x-trace-id") == ["ef" * 16]
+
+
+def test_write_invalidates_collection():
+    with TestClient(app) as client:
+        client.get("/reviews/1")
+        client.post("/reviews", json={"product_id": 1, "comment": "ok"})
+        r = client.get("/reviews/1")
+        assert r.headers["x-cache"] == "MISS"
+        assert pools["review"].requests == 3
+
+
+def test_bulk_summaries_do_not_flush_review_cache():
+    with TestClient(app) as client:
+        client.get("/reviews/1")
+        invalidations = response_cache.stats()["invalidations"]
+        r = client.post("/reviews/summaries", json={"ids": [1, 2]})
+        assert r.json()["path"] == "/reviews/summaries"
+        assert client.get("/reviews/1").headers["x-cache"] == "HIT"
+        assert response_cache.stats()["invalidations"] == invalidations
+
+
+def test_concurrent_misses_coalesce():
+    cache = ResponseCache(max_entries=2)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return CachedResponse(200, {}, b"[]", '"x"', float("inf"))
+
+    async def main():
+        return await asyncio.gather(*(cache.fetch("/products?", "/products", load) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ["COALESCED"] * 4 + ["MISS"]
+    assert cache.stats()["entries"] == 1
+
+
+def test_cart_expanded_hydrates_products():
+    def upstream(request: httpx.Request):
+        if request.url.path == "/cart/7":
+            return json_response(200, b'[{"product_id": 1, "quantity": 2}, {"product_id": 3, "quantity": 1}]')
+        if request.url.path == "/products":
+            assert request.url.params["ids"] == "1,3"
+            return json_response(200, b'[{"id": 1, "name": "Laptop", "price": 10.0, "description": "long"},'
+                                      b' {"id": 3, "name": "Headphones", "price": 2.5}]')
+        return httpx.Response(404)
+
+    for name in ("cart", "product"):
+        pools[name] = UpstreamPool(name, gw.UPSTREAMS[name], timeout=1.0, limits=httpx.Limits(),
+                                   transport=httpx.MockTransport(upstream))
+    with TestClient(app) as client:
+        r = client.get("/cart/7/expanded", headers=bearer(7))
+        assert r.status_code == 200
+        data = r.json()
+        assert data["total"] == 22.5
+        assert data["items"][0]["product"] == {"id": 1, "name": "Laptop", "price": 10.0}
+
+
+def flaky_pool(name, handler, **policy):
+    return UpstreamPool(name, gw.UPSTREAMS[name], timeout=1.0, limits=httpx.Limits(),
+                        transport=httpx.MockTransport(handler),
+                        policy=gw.Policy(backoff_base=0.001, backoff_max=0.002, **policy))
+
+
+def test_idempotent_requests_are_retried():
+    calls = []
+
+    def upstream(request):
+        calls.append(request.method)
+        if len(calls) % 2:
+            return httpx.Response(503, text="warming up")
+        return json_response(200, b'{"ok": true}')
+
+    pools["review"] = flaky_pool("review", upstream)
+    with TestClient(app) as client:
+        assert client.get("/reviews/1").json() == {"ok": True}
+        assert calls == ["GET", "GET"]
+        calls.clear()
+        # A POST without an Idempotency-Key is never repeated
+        r = client.post("/reviews", json={"product_id": 1})
+        assert r.status_code == 503
+        assert calls == ["POST"]
+        calls.clear()
+        r = client.post("/reviews", json={"product_id": 1}, headers={"Idempotency-Key": "r-1"})
+        assert r.status_code == 200
+        assert calls == ["POST", "POST"]
+
+
+def test_open_circuit_fast_fails_with_retry_after():
+    calls = []
+
+    def hung(request):
+        if request.url.path == "/healthz":
+            return json_response(200, b"{}")
+        calls.append(1)
+        raise httpx.ReadTimeout("stalled", request=request)
+
+    pools["review"] = flaky_pool("review", hung, failure_threshold=2, reset_timeout=30, max_attempts=1)
+    with TestClient(app) as client:
+        assert client.get("/reviews/1").status_code == 503
+        assert client.get("/reviews/2").status_code == 503
+        r = client.get("/reviews/3")
+        assert r.status_code == 503
+        assert "circuit open" in r.json()["detail"]
+        assert 0 < int(r.headers["retry-after"]) <= 30
+        assert len(calls) == 2
+        # The rest of the shop is unaffected
+        assert client.get("/products/1").status_code == 200
+
+        health = client.get("/gateway/upstreams", headers=bearer(9, role="admin")).json()
+        assert health["review"]["state"] == "open"
+        assert health["review"]["rejected"] == 1
+        assert health["product"]["state"] == "closed"
+        assert client.post("/gateway/upstreams/review/reset", headers=bearer(9, role="admin")).json()["state"] == "closed"
+        assert client.post("/gateway/upstreams/nope/reset", headers=bearer(9, role="admin")).status_code == 404
+
+
+def test_deadline_returns_504():
+    async def slow(request):
+        await asyncio.sleep(1)
+        return json_response(200, b"{}")
+
+    pools["review"] = flaky_pool("review", slow, deadline=0.05)
+    with TestClient(app) as client:
+        r = client.get("/reviews/1")
+        assert r.status_code == 504
+
+
+def test_cart_and_order_routes_require_a_token():
+    with TestClient(app) as client:
+        r = client.get("/cart/1")
+        assert r.status_code == 401
+        assert r.headers["www-authenticate"] == "Bearer"
+        assert client.get("/cart/1", headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert client.get("/cart/1", headers=bearer(1, ttl=-1)).status_code == 401
+        # Only the owner (or an admin) may reach a user's resources
+        assert client.get("/cart/2", headers=bearer(1)).status_code == 403
+        assert client.get("/cart/2", headers=bearer(9, role="admin")).status_code == 200
+        assert client.get("/orders/1/expanded", headers=bearer(2)).status_code == 403
+        order = {"user_id": 2, "items": [], "total_amount": 1.0}
+        assert client.post("/orders", json=order, headers=bearer(1)).status_code == 403
+        assert client.post("/orders", json=order, headers=bearer(2)).status_code == 200
+        # Public routes are untouched
+        assert client.get("/products").status_code == 200
+        stats = client.get("/gateway/auth", headers=bearer(9, role="admin")).json()
+        assert stats["hits"] >= 1 and stats["rejected"] == 2
+        # Gateway internals are for admins only
+        assert client.post("/gateway/auth/reload").status_code == 401
+        assert client.post("/gateway/upstreams/review/reset", headers=bearer(1)).status_code == 403
+        assert client.get("/gateway/cache", headers=bearer(1)).status_code == 403
+
+
+def test_signing_key_rotation(monkeypatch):
+    original, old = token_verifier.keyring, Keyring.parse("old:s1")
+    token_verifier.rotate(old)
+    token_verifier.clear()
+    try:
+        issued_before = bearer(1, keyring=old)
+        with TestClient(app) as client:
+            assert client.get("/cart/1", headers=issued_before).status_code == 200
+            # New key added alongside the old one: both verify
+            monkeypatch.setenv("AUTH_SIGNING_KEYS", "new:s2,old:s1")
+            admin = bearer(9, role="admin", keyring=old)
+            assert client.post("/gateway/auth/reload", headers=admin).json()["keys"] == ["new", "old"]
+            assert client.get("/cart/1", headers=issued_before).status_code == 200
+            assert client.get("/cart/1", headers=bearer(1, keyring=Keyring.parse("new:s2"))).status_code == 200
+            # Old key retired: its cached tokens stop working too
+            monkeypatch.setenv("AUTH_SIGNING_KEYS", "new:s2")
+            client.post("/gateway/auth/reload", headers=bearer(9, role="admin", keyring=Keyring.parse("new:s2")))
+            assert client.get("/cart/1", headers=issued_before).status_code == 401
+    finally:
+        token_verifier.rotate(original)
+        token_verifier.clear()
+
+
+def test_route_table_from_file_and_405(tmp_path, monkeypatch):
+    routes = tmp_path / "routes.json"
+    routes.write_text('[{"prefix": "/catalog", "upstream": "product", "methods": ["GET"], "rewrite": "/products"}]')
+    monkeypatch.setattr(gw, "route_table", gw.build_route_table(gw.read_routes(str(routes))))
+    with TestClient(app) as client:
+        r = client.get("/catalog/5", params={"fields": "name"})
+        assert r.json() == {"path": "/products/5", "query": "fields=name"}
+        r = client.delete("/catalog/5")
+        assert r.status_code == 405 and r.headers["allow"] == "GET, HEAD"
+        assert client.get("/products/5").status_code == 404
+    with pytest.raises(ValueError):
+        gw.build_route_table(gw.parse_routes([{"prefix": "/x", "upstream": "nowhere", "methods": ["GET"]}]))
+
+
+def test_repeated_response_headers_are_kept():
+    pools["auth"] = UpstreamPool("auth", gw.AUTH_SERVICE_URL, timeout=1.0, limits=httpx.Limits(),
+                                 transport=httpx.MockTransport(lambda request: httpx.Response(
+                                     200, headers=[("content-type", "application/json"), ("set-cookie", "a=1"),
+                                                   ("set-cookie", "b=2"), ("connection", "close")],
+                                     stream=Chunks(b"{}"))))
+    with TestClient(app) as client:
+        r = client.post("/auth/login", json={})
+    assert r.headers.get_list("set-cookie") == ["a=1", "b=2"]
+    assert "connection" not in r.headers
+
+
+def test_order_export_and_report_span_every_shard(monkeypatch):
+    monkeypatch.setitem(gw.SHARD_RINGS, "order", gw.HashRing(["order", "order-1"]))
+    monkeypatch.setitem(gw.UPSTREAMS, "order-1", "http://order-shard-1")
+    day = {"confirmed": 1, "payment_failed": 0, "units": 2, "revenue": 0.1}
+
+    def shard(name):
+        def upstream(request: httpx.Request):
+            if request.url.path == "/orders/export":
+                assert request.url.params["status"] == "confirmed"
+                return httpx.Response(200, headers={"content-type": "application/x-ndjson"},
+                                      stream=Chunks(b'{"shard": "%s", "n": 1}\n' % name.encode(),
+                                                    b'{"shard": "%s", "n": 2}\n' % name.encode()))
+            return json_response(200, json.dumps({**day, "products": [{"product_id": 1, "units": 2, "revenue": 0.1}],
+                                                  "days": {"2026-01-01": day}}).encode())
+        return UpstreamPool(name, gw.UPSTREAMS[name], timeout=1.0, limits=httpx.Limits(),
+                            transport=httpx.MockTransport(upstream))
+
+    pools["order"], pools["order-1"] = shard("order"), shard("order-1")
+    with TestClient(app) as client:
+        assert client.get("/orders/export", headers=bearer(1)).status_code == 403
+        r = client.get("/orders/export", params={"status": "confirmed"}, headers=bearer(1, role="admin"))
+        assert r.status_code == 200
+        assert [(line["shard"], line["n"]) for line in map(json.loads, r.text.splitlines())] == \
+            [("order", 1), ("order", 2), ("order-1", 1), ("order-1", 2)]
+        report = client.get("/orders/report", headers=bearer(1, role="admin")).json()
+        assert (report["confirmed"], report["units"], report["revenue"]) == (2, 4, 0.2)
+        assert report["products"] == [{"product_id": 1, "units": 4, "revenue": 0.2}]
+        assert report["days"]["2026-01-01"]["confirmed"] == 2
+
+
+def test_ready_once_every_upstream_pool_answers():
+    def down(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    with TestClient(app) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+        r = client.get("/readyz")
+        assert r.status_code == 200 and set(r.json()["checks"]) == set(gw.UPSTREAMS)
+        assert client.get("/gateway/pools", headers=bearer(9, role="admin")).json()["product"]["warmed"] is True
+
+    pools["review"] = UpstreamPool("review", gw.UPSTREAMS["review"], timeout=1.0, limits=httpx.Limits(),
+                                   transport=httpx.MockTransport(down))
+    with TestClient(app) as client:
+        # Liveness does not depend on the upstreams
+        assert client.get("/healthz").status_code == 200
+        r = client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["checks"]["review"].startswith("ConnectError")
+        assert r.json()["checks"]["product"] == "ok"
@@ -1,14 +1,281 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
 
-app = FastAPI(title="Notification Service")
+from common.health import install_health
+from common.metrics import install_metrics
+from common.tracing import install_tracing
+
+logger = logging.getLogger("notification_service")
+
+# Delivery queue settings
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "2"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_BATCH_WAIT = float(os.getenv("NOTIFY_BATCH_WAIT", "0.05"))  # linger for a fuller batch
+NOTIFY_DELIVERY_ATTEMPTS = int(os.getenv("NOTIFY_DELIVERY_ATTEMPTS", "3"))
+NOTIFY_DRAIN_TIMEOUT = float(os.getenv("NOTIFY_DRAIN_TIMEOUT", "5"))
+NOTIFY_MAX_BATCH_REQUEST = int(os.getenv("NOTIFY_MAX_BATCH_REQUEST", "1000"))
+# stdout:// | file:///path/to/notifications.jsonl | smtp://host:port
+NOTIFY_SINK = os.getenv("NOTIFY_SINK", "stdout://")
+NOTIFY_SMTP_SENDER = os.getenv("NOTIFY_SMTP_SENDER", "shop@localhost")
+NOTIFY_SMTP_DOMAIN = os.getenv("NOTIFY_SMTP_DOMAIN", "localhost")
 
 class NotificationRequest(BaseModel):
     user_id: int
     message: str
 
-@app.post("/send")
+class NotificationBatch(BaseModel):
+    messages: List[NotificationRequest] = Field(..., min_length=1, max_length=NOTIFY_MAX_BATCH_REQUEST)
+
+
+class StdoutSink:
+    async def deliver(self, batch: List[dict]):
+        # One write per batch instead of a print per message
+        sys.stdout.write("".join(f"NOTIFICATION FOR USER {n['user_id']}: {n['message']}\n" for n in batch))
+        sys.stdout.flush()
+
+    async def close(self):
+        pass
+
+
+class FileSink:
+    """Appends notifications as JSON lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: str):
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+    async def deliver(self, batch: List[dict]):
+        lines = "".join(json.dumps(n, separators=(",", ":")) + "\n" for n in batch)
+        await asyncio.to_thread(self._write, lines)
+
+    async def close(self):
+        pass
+
+
+class SmtpSink:
+    """Mails each notification to user-<id>@NOTIFY_SMTP_DOMAIN over one SMTP session per batch.
+
+    Meant for a local catcher (MailHog, `aiosmtpd`) in development.
+    """
+
+    def __init__(self, host: str, port: int, sender: str, domain: str):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.domain = domain
+
+    def _send(self, batch: List[dict]):
+        # Imported here so services not mailing anything skip loading smtplib
+        import smtplib
+        from email.message import EmailMessage
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            for n in batch:
+                mail = EmailMessage()
+                mail["From"] = self.sender
+                mail["To"] = f"user-{n['user_id']}@{self.domain}"
+                mail["Subject"] = "ElectroShop notification"
+                mail.set_content(n["message"])
+                smtp.send_message(mail)
+
+    async def deliver(self, batch: List[dict]):
+        await asyncio.to_thread(self._send, batch)
+
+    async def close(self):
+        pass
+
+
+def open_sink(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "stdout":
+        return StdoutSink()
+    if parsed.scheme == "file":
+        return FileSink(parsed.path)
+    if parsed.scheme == "smtp":
+        return SmtpSink(parsed.hostname or "localhost", parsed.port or 25, NOTIFY_SMTP_SENDER, NOTIFY_SMTP_DOMAIN)
+    raise ValueError(f"Unsupported notification sink: {url!r}")
+
+
+class NotificationQueue:
+    """Bounded queue of accepted notifications, delivered by workers in batches.
+
+    /send only enqueues; when the queue is full requests are refused with
+    429 so callers back off instead of piling up memory. Workers take up to
+    `batch_size` messages at a time, waiting at most `batch_wait` for a
+    batch to fill, and retry a failed batch before dropping it.
+    """
+
+    def __init__(self, sink, workers: int, queue_size: int, batch_size: int, batch_wait: float,
+                 attempts: int = NOTIFY_DELIVERY_ATTEMPTS):
+        self.sink = sink
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.attempts = attempts
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.delivered = 0
+        self.failed = 0
+        self.batches = 0
+        # Enqueue-to-delivered times of recent messages, in seconds
+        self.latencies: deque = deque(maxlen=1000)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self.queue is not None:
+            return
+        self._loop = loop
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def submit(self, notifications: List[dict]):
+        """Enqueue all of `notifications` or none of them."""
+        self.start()
+        if self.queue_size - self.queue.qsize() < len(notifications):
+            self.rejected += len(notifications)
+            raise asyncio.QueueFull
+        now = time.perf_counter()
+        for notification in notifications:
+            self.queue.put_nowait((now, notification))
+        self.accepted += len(notifications)
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.deliver(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def deliver(self, batch: list):
+        notifications = [notification for _, notification in batch]
+        for attempt in range(1, self.attempts + 1):
+            try:
+                await self.sink.deliver(notifications)
+                break
+            except Exception:
+                if attempt == self.attempts:
+                    logger.exception("Dropping %d notifications after %d attempts", len(batch), attempt)
+                    self.failed += len(batch)
+                    return
+                await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+        now = time.perf_counter()
+        self.latencies.extend(now - enqueued for enqueued, _ in batch)
+        self.delivered += len(batch)
+        self.batches += 1
+
+    async def stop(self, timeout: float = NOTIFY_DRAIN_TIMEOUT):
+        # Accepted notifications are delivered before shutting down, within `timeout`
+        if self.queue is not None and self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Shutting down with %d notifications undelivered", self.queue.qsize())
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.sink.close()
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(pct):
+            return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 3) \
+                if latencies else None
+
+        return {
+            "sink": type(self.sink).__name__,
+            "workers": len(self.workers),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "batch_size": self.batch_size,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "batches": self.batches,
+            "mean_batch": round(self.delivered / self.batches, 2) if self.batches else None,
+            "latency_p50_ms": percentile(50),
+            "latency_p99_ms": percentile(99),
+        }
+
+
+notifications = NotificationQueue(open_sink(NOTIFY_SINK), NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE,
+                                  NOTIFY_BATCH_SIZE, NOTIFY_BATCH_WAIT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    notifications.start()
+    yield
+    await notifications.stop()
+
+
+app = FastAPI(title="Notification Service", lifespan=lifespan)
+install_tracing(app, "notification_service")
+install_metrics(app, "notification_service")
+
+
+async def workers_running():
+    if not any(not task.done() for task in notifications.workers):
+        raise RuntimeError("no delivery workers running")
+
+install_health(app, {"workers": workers_running})
+
+
+def enqueue(requests: List[NotificationRequest]):
+    try:
+        notifications.submit([request.model_dump() for request in requests])
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Notification queue is full, try again later",
+                            headers={"Retry-After": "1"})
+
+@app.post("/send", status_code=202)
 async def send_notification(notif: NotificationRequest):
-    # In a real app, this would send an email, push notification, etc.
-    print(f"NOTIFICATION FOR USER {notif.user_id}: {notif.message}")
-    return {"status": "sent"}
+    # Accepted now, delivered by a worker; see GET /queue
+    enqueue([notif])
+    return {"status": "queued"}
+
+@app.post("/send/batch", status_code=202)
+async def send_notifications(batch: NotificationBatch):
+    enqueue(batch.messages)
+    return {"status": "queued", "count": len(batch.messages)}
+
+@app.get("/queue")
+async def queue_stats():
+    return notifications.stats()
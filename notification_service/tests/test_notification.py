@@ -0,0 +1,78 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+import notification_service.main as service
+from notification_service.main import FileSink, NotificationQueue, app
+
+
+class CollectingSink:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    async def deliver(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sink down")
+        self.batches.append(list(batch))
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    sink = CollectingSink()
+    monkeypatch.setattr(service, "notifications", NotificationQueue(sink, workers=1, queue_size=5,
+                                                                     batch_size=3, batch_wait=0.01))
+    return sink
+
+
+def test_send_is_accepted_then_delivered(sink):
+    with TestClient(app) as client:
+        r = client.post("/send", json={"user_id": 1, "message": "Order placed"})
+        assert r.status_code == 202
+        assert r.json() == {"status": "queued"}
+    # Shutdown drains the queue
+    assert sink.batches == [[{"user_id": 1, "message": "Order placed"}]]
+    stats = service.notifications.stats()
+    assert stats["delivered"] == 1 and stats["queued"] == 0 and stats["latency_p50_ms"] is not None
+
+
+def test_batch_endpoint_and_backpressure(monkeypatch):
+    # No workers, so accepted messages stay queued
+    monkeypatch.setattr(service, "notifications", NotificationQueue(CollectingSink(), workers=0, queue_size=5,
+                                                                     batch_size=3, batch_wait=0.01))
+    messages = [{"user_id": i, "message": f"promo {i}"} for i in range(5)]
+    with TestClient(app) as client:
+        r = client.post("/send/batch", json={"messages": messages})
+        assert r.status_code == 202 and r.json()["count"] == 5
+        full = client.post("/send", json={"user_id": 9, "message": "one too many"})
+        assert full.status_code == 429
+        assert full.headers["retry-after"] == "1"
+        # A batch is accepted whole or not at all
+        assert client.post("/send/batch", json={"messages": messages[:1]}).status_code == 429
+        assert client.post("/send/batch", json={"messages": []}).status_code == 422
+        stats = client.get("/queue").json()
+        assert (stats["queued"], stats["accepted"], stats["rejected"]) == (5, 5, 2)
+
+
+def test_workers_deliver_in_batches_and_retry():
+    async def run():
+        sink = CollectingSink(failures=1)
+        queue = NotificationQueue(sink, workers=1, queue_size=100, batch_size=3, batch_wait=0.05)
+        queue.start()
+        queue.submit([{"user_id": i, "message": "hi"} for i in range(7)])
+        await queue.stop()
+        return sink, queue
+
+    sink, queue = asyncio.run(run())
+    assert [len(batch) for batch in sink.batches] == [3, 3, 1]
+    assert queue.stats()["delivered"] == 7 and queue.stats()["batches"] == 3
+
+
+def test_file_sink_appends_json_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    asyncio.run(FileSink(str(path)).deliver([{"user_id": 1, "message": "a"}, {"user_id": 2, "message": "b"}]))
+    assert [json.loads(line)["user_id"] for line in path.read_text().splitlines()] == [1, 2]
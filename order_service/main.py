@@ -1,17 +1,69 @@
 import httpx
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, List, Optional, Set
+import asyncio
+import json
+import logging
 import os
+import random
+import time
+import uuid
 
-app = FastAPI(title="Order Service")
+from common.idempotency import (IDEMPOTENCY_HEADER, IdempotencyCache, IdempotencyConflict, MAX_KEY_LENGTH,
+                                REPLAYED_HEADER, fingerprint)
+from common.health import install_health
+from common.metrics import install_metrics, timed_upstream
+from common.reporting import build_report, day_of, tally
+from common.resilience import Policy, Resilience, UpstreamUnavailable
+from common.storage import open_storage
+from common.tracing import install_tracing
 
+logger = logging.getLogger("order_service")
+
+PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://product_service:8002")
 PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment_service:8005")
 NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://notification_service:8006")
 
+# Checkout pipeline settings
+ORDER_WORKERS = int(os.getenv("ORDER_WORKERS", "4"))
+ORDER_QUEUE_SIZE = int(os.getenv("ORDER_QUEUE_SIZE", "1000"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "0.5"))
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "30"))
+# Payments with an unknown outcome and stock commits of paid orders are
+# retried until they get a definite answer
+SETTLE_BACKOFF_BASE = float(os.getenv("SETTLE_BACKOFF_BASE", "1"))
+SETTLE_BACKOFF_MAX = float(os.getenv("SETTLE_BACKOFF_MAX", "60"))
+ORDER_IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("ORDER_IDEMPOTENCY_MAX_ENTRIES", "100000"))
+ORDER_IDEMPOTENCY_TTL = float(os.getenv("ORDER_IDEMPOTENCY_TTL", "86400"))
+PRODUCT_SERVICE_TIMEOUT = float(os.getenv("PRODUCT_SERVICE_TIMEOUT", "5"))
+PAYMENT_SERVICE_TIMEOUT = float(os.getenv("PAYMENT_SERVICE_TIMEOUT", "10"))
+NOTIFICATION_SERVICE_TIMEOUT = float(os.getenv("NOTIFICATION_SERVICE_TIMEOUT", "5"))
+
+# Order history paging
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Orders read from storage at a time by GET /orders/export
+EXPORT_BATCH_SIZE = int(os.getenv("ORDER_EXPORT_BATCH_SIZE", "500"))
+
+# Order statuses
+PENDING = "pending"
+CONFIRMED = "confirmed"
+PAYMENT_FAILED = "payment_failed"
+
+class OrderItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=1)
+
 class OrderRequest(BaseModel):
     user_id: int
-    items: list
-    total_amount: float
+    items: List[OrderItem] = Field(..., min_length=1, max_length=100)
+    # Accepted for older clients but ignored: the total is priced by product_service
+    total_amount: Optional[float] = None
 
 class StoredOrder(BaseModel):
     order_id: str
@@ -19,42 +71,405 @@ class StoredOrder(BaseModel):
     items: list
     total_amount: float
     status: str
+    created_at: float
 
-# In-memory store: {user_id: [orders]}
+# Store: {user_id: {order_id: order}}, in placement order.
+# With the default memory:// backend `orders_db` is the live store.
 orders_db = {}
+# Sales aggregates: {"daily": {"YYYY-MM-DD": record}}, see common.reporting
+order_reports_db = {}
+storage = open_storage(os.getenv("STORAGE_URL", "memory://"))
+order_store = storage.collection("orders", data=orders_db)
+report_store = storage.collection("order_reports", data=order_reports_db)
 
-@app.post("/orders")
-async def create_order(order: OrderRequest):
-    # 1. Process Payment
-    try:
-        async with httpx.AsyncClient() as client:
-            payment_resp = await client.post(
-                f"{PAYMENT_SERVICE_URL}/pay",
-                json={
-                    "amount": order.total_amount,
-                    "user_id": str(order.user_id)
-                }
-            )
-            payment_resp.raise_for_status()
-            
-            # 2. Send Notification
-            await client.post(f"{NOTIFICATION_SERVICE_URL}/send", json={"user_id": order.user_id, "message": f"Order placed successfully! Total: ${order.total_amount}"})
 
+class OrderPipeline:
+    """Bounded job queue drained by worker tasks.
+
+    Checkout only enqueues the order; workers take payment and record the
+    outcome, and notifications are sent in background tasks with retries so
+    a slow notification service never holds up a worker. The stock reserved
+    at checkout is committed once payment succeeds and released otherwise;
+    a commit that cannot reach product_service is retried in the background
+    until it lands, since a paid reservation left to expire would put the
+    sold units back on sale. A payment whose outcome is unknown (the request
+    may have reached payment_service) leaves the order pending and is
+    retried under the same Idempotency-Key until the answer is definite.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.background: Set[asyncio.Task] = set()
+        # Orders whose payment outcome is unknown, and paid orders whose
+        # reservation is still being committed
+        self.uncharged: Set[str] = set()
+        self.uncommitted: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0)
+        return self._client
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self.workers:
+            return
+        self._loop = loop
+        self._client = None
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def submit(self, order: dict):
+        self.start()
+        # The job carries the trace context of the request that placed it
+        self.queue.put_nowait((order, tracer.current(), time.perf_counter()))
+
+    async def stop(self):
+        for task in self.workers + list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.workers, *self.background, return_exceptions=True)
+        self.workers = []
+        self.background.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _worker(self):
+        while True:
+            order, trace_context, enqueued = await self.queue.get()
+            try:
+                with tracer.span("order.process", parent=trace_context, order_id=order["order_id"],
+                                 queue_wait_ms=round((time.perf_counter() - enqueued) * 1000, 3)):
+                    await self.process(order)
+            except Exception:
+                logger.exception("Order %s failed in the pipeline", order["order_id"])
+            finally:
+                self.queue.task_done()
+
+    async def process(self, order: dict):
+        if not await self.charge(order):
+            self.uncharged.add(order["order_id"])
+            self._spawn(self.charge_until_settled(order))
+            return
+        await self.complete(order)
+
+    async def charge(self, order: dict, reached: bool = False) -> bool:
+        """Take payment, recording the outcome in the order; False while it is unknown.
+
+        Only a 4xx answer, or no attempt ever getting past connecting, shows
+        the customer was not charged. A timeout or 5xx may come after the
+        charge. `reached` carries over earlier attempts that may have landed.
+        """
+
+        async def send():
+            nonlocal reached
+            try:
+                return await self.client.post(
+                    f"{PAYMENT_SERVICE_URL}/pay",
+                    json={
+                        "amount": order["total_amount"],
+                        "user_id": str(order["user_id"])
+                    },
+                    headers=tracer.inject({IDEMPOTENCY_HEADER: order["order_id"]})
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                raise
+            except BaseException:
+                reached = True
+                raise
+
+        try:
+            # Keyed by order id, so retries and re-delivered jobs are never charged twice
+            with tracer.span("POST payment", kind="client", upstream="payment", path="/pay"):
+                payment_resp = await timed_upstream("payment", "POST", lambda: payment_guard.call(send, retry=True))
+        except (httpx.RequestError, UpstreamUnavailable) as e:
+            if reached:
+                logger.warning("Payment of order %s has an unknown outcome, retrying: %s", order["order_id"], e)
+                return False
+            target = e.request.url if isinstance(e, httpx.RequestError) else e
+            order.update(status=PAYMENT_FAILED, failure_reason=f"Service unavailable: {target}")
+            return True
+        if payment_resp.status_code >= 500:
+            logger.warning("Payment of order %s has an unknown outcome, retrying: HTTP %d",
+                           order["order_id"], payment_resp.status_code)
+            return False
+        if 200 <= payment_resp.status_code < 300:
+            order["status"] = CONFIRMED
+        else:
+            order.update(status=PAYMENT_FAILED, failure_reason=f"Downstream service error: {payment_resp.text}")
+        return True
+
+    async def charge_until_settled(self, order: dict):
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                await asyncio.sleep(settle_delay(attempt))
+                if await self.charge(order, reached=True):
+                    break
+        finally:
+            self.uncharged.discard(order["order_id"])
+        await self.complete(order)
+
+    async def complete(self, order: dict):
+        await self.settle_reservation(order)
+        await order_store.put(order["user_id"], order["order_id"], order)
+        # Counted once per order, on the day it settled
+        await report_store.update("daily", day_of(), lambda record: tally(record, order))
+
+        if order["status"] == CONFIRMED:
+            message = f"Order placed successfully! Total: ${order['total_amount']}"
+            self._spawn(self.notify(order["user_id"], message))
+
+    async def settle_reservation(self, order: dict):
+        action = "commit" if order["status"] == CONFIRMED else "release"
+        try:
+            await self._settle(order["order_id"], action)
+        except (httpx.RequestError, httpx.HTTPStatusError, UpstreamUnavailable) as e:
+            if action == "commit" and transient(e):
+                logger.warning("Could not commit stock reservation of order %s, retrying: %s", order["order_id"], e)
+                self.uncommitted.add(order["order_id"])
+                self._spawn(self.commit_until_settled(order["order_id"]))
+            else:
+                # An unsettled release is done by product_service when the reservation expires
+                logger.error("Could not %s stock reservation of order %s: %s", action, order["order_id"], e)
+
+    async def _settle(self, order_id: str, action: str):
+        with tracer.span(f"POST product {action}", kind="client", upstream="product",
+                         path=f"/inventory/reservations/{{id}}/{action}"):
+            resp = await timed_upstream("product", "POST", lambda: inventory_guard.call(lambda: self.client.post(
+                f"{PRODUCT_SERVICE_URL}/inventory/reservations/{order_id}/{action}",
+                headers=tracer.inject()), retry=True))
+            resp.raise_for_status()
+
+    async def commit_until_settled(self, order_id: str):
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                await asyncio.sleep(settle_delay(attempt))
+                try:
+                    await self._settle(order_id, "commit")
+                    logger.info("Committed stock reservation of order %s after %d retries", order_id, attempt)
+                    return True
+                except (httpx.RequestError, httpx.HTTPStatusError, UpstreamUnavailable) as e:
+                    if not transient(e):
+                        logger.error("Stock reservation of paid order %s cannot be committed: %s", order_id, e)
+                        return False
+        finally:
+            self.uncommitted.discard(order_id)
+
+    def _spawn(self, coro):
+        # Keep a reference so fire-and-forget tasks are not garbage collected mid-flight
+        task = asyncio.get_running_loop().create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def notify(self, user_id: int, message: str):
+        for attempt in range(1, NOTIFY_MAX_ATTEMPTS + 1):
+            try:
+                with tracer.span("POST notification", kind="client", upstream="notification", path="/send",
+                                 attempt=attempt):
+                    resp = await timed_upstream("notification", "POST", lambda: notification_guard.call(
+                        lambda: self.client.post(f"{NOTIFICATION_SERVICE_URL}/send", headers=tracer.inject(),
+                                                 json={"user_id": user_id, "message": message})))
+                    resp.raise_for_status()
+                return True
+            except (httpx.RequestError, httpx.HTTPStatusError, UpstreamUnavailable) as e:
+                if attempt == NOTIFY_MAX_ATTEMPTS:
+                    logger.warning("Giving up on notification for user %s: %s", user_id, e)
+                    return False
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, min(NOTIFY_BACKOFF_MAX, NOTIFY_BACKOFF_BASE * 2 ** (attempt - 1))))
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "notifications_in_flight": len(self.background) - len(self.uncharged) - len(self.uncommitted),
+            "payments_retrying": len(self.uncharged),
+            "commits_retrying": len(self.uncommitted),
+        }
+
+
+def settle_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter, without a cap on attempts
+    return random.uniform(0, min(SETTLE_BACKOFF_MAX, SETTLE_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def transient(e: Exception) -> bool:
+    # 4xx answers are definite (unknown or already released reservation); anything else may pass
+    return not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+
+
+# Reservation calls are idempotent by order id and retried like payment
+inventory_guard = Resilience("product", Policy(deadline=PRODUCT_SERVICE_TIMEOUT))
+# Payment calls are retried by the guard; notify() runs its own slower retry loop
+payment_guard = Resilience("payment", Policy(deadline=PAYMENT_SERVICE_TIMEOUT, max_in_flight=ORDER_WORKERS * 2))
+notification_guard = Resilience("notification", Policy(deadline=NOTIFICATION_SERVICE_TIMEOUT, max_attempts=1))
+pipeline = OrderPipeline(ORDER_WORKERS, ORDER_QUEUE_SIZE)
+# Responses to POST /orders by Idempotency-Key
+idempotency = IdempotencyCache(ORDER_IDEMPOTENCY_MAX_ENTRIES, ORDER_IDEMPOTENCY_TTL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pipeline.start()
+    yield
+    await pipeline.stop()
+    await storage.aclose()
+
+
+app = FastAPI(title="Order Service", lifespan=lifespan)
+tracer = install_tracing(app, "order_service")
+install_metrics(app, "order_service")
+
+
+async def pipeline_running():
+    if not any(not task.done() for task in pipeline.workers):
+        raise RuntimeError("no pipeline workers running")
+
+def reachable(base_url: str):
+    # Orders can be taken only while product_service (stock) and paid for while payment_service answer
+    async def check():
+        resp = await pipeline.client.get(f"{base_url}/healthz")
+        resp.raise_for_status()
+    return check
+
+install_health(app, {"storage": storage.ping, "pipeline": pipeline_running,
+                     "product": reachable(PRODUCT_SERVICE_URL), "payment": reachable(PAYMENT_SERVICE_URL)})
+
+async def reserve_stock(order_id: str, items: List[OrderItem]) -> dict:
+    """Hold the items in product_service; returns the reservation, priced from the catalog."""
+    try:
+        with tracer.span("POST product reserve", kind="client", upstream="product", path="/inventory/reservations"):
+            resp = await timed_upstream("product", "POST", lambda: inventory_guard.call(lambda: pipeline.client.post(
+                f"{PRODUCT_SERVICE_URL}/inventory/reservations",
+                json={"reservation_id": order_id, "items": [item.model_dump() for item in items]},
+                headers=tracer.inject()), retry=True))
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Service unavailable: {e.request.url}")
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(status_code=e.response.status_code, detail=f"Downstream service error: {e.response.text}")
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {e}")
+    if resp.status_code in (404, 409):
+        # Unknown products or not enough stock: nothing was reserved
+        raise HTTPException(status_code=resp.status_code, detail=resp.json()["detail"])
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=502, detail=f"Downstream service error: {resp.text}")
+    return resp.json()
 
+async def place_order(order: OrderRequest) -> dict:
+    # Stock is reserved and priced first; the order is then stored as pending
+    # and paid for by a pipeline worker. Poll GET /orders/{user_id}/{order_id}
+    # for the outcome.
+    order_id = uuid.uuid4().hex
+    reservation = await reserve_stock(order_id, order.items)
     new_order = {
-        "order_id": "some-random-id",
+        "order_id": order_id,
         "user_id": order.user_id,
-        "items": order.items,
-        "total_amount": order.total_amount,
-        "status": "confirmed"
+        "items": reservation["items"],
+        "total_amount": reservation["total_amount"],
+        "status": PENDING,
+        "created_at": round(time.time(), 3),
     }
-    orders_db.setdefault(order.user_id, []).append(new_order)
+    await order_store.put(order.user_id, new_order["order_id"], new_order)
+    try:
+        pipeline.submit(dict(new_order))
+    except asyncio.QueueFull:
+        await order_store.delete(order.user_id, new_order["order_id"])
+        await pipeline.settle_reservation(dict(new_order, status=PAYMENT_FAILED))
+        raise HTTPException(status_code=503, detail="Order queue is full, try again later")
     return new_order
 
+@app.post("/orders", status_code=202)
+async def create_order(order: OrderRequest, response: Response,
+                       idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH)):
+    if idempotency_key is None:
+        return await place_order(order)
+    # A retry with the same key gets the original order back instead of a duplicate
+    try:
+        result, replayed = await idempotency.run(f"{order.user_id}:{idempotency_key}",
+                                                 fingerprint(order.model_dump()), lambda: place_order(order))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+@app.get("/orders/pipeline")
+async def pipeline_stats():
+    return {
+        **pipeline.stats(),
+        "idempotency": idempotency.stats(),
+        "upstreams": {"product": inventory_guard.stats(), "payment": payment_guard.stats(), "notification": notification_guard.stats()},
+    }
+
+async def order_pages(user_id, after: Optional[str] = None, size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[list]:
+    """Yield a user's (order_id, order) records in placement order, `size` at a time."""
+    while True:
+        page = await order_store.page(user_id, after=after, limit=size)
+        if page:
+            yield page
+        if len(page) < size:
+            return
+        after = page[-1][0]
+
+def matches(order: dict, since: Optional[float], status: Optional[str]) -> bool:
+    # Orders stored before created_at existed count as older than any `since`
+    return (since is None or order.get("created_at", 0) >= since) and (status is None or order["status"] == status)
+
+@app.get("/orders/export")
+async def export_orders(since: Optional[float] = None, status: Optional[str] = None):
+    # Admin reporting feed: every order, one JSON object per line, read from
+    # storage a batch at a time while the response streams out
+    async def lines():
+        for user_id in await order_store.partitions():
+            async for page in order_pages(user_id, size=EXPORT_BATCH_SIZE):
+                chunk = "".join(json.dumps(order, separators=(",", ":")) + "\n"
+                                for _, order in page if matches(order, since, status))
+                if chunk:
+                    yield chunk.encode()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/orders/report")
+async def sales_report(since: Optional[date] = None, until: Optional[date] = None):
+    # Kept up to date by the pipeline, so this reads one record per day
+    return build_report(await report_store.items("daily"), since, until)
+
 @app.get("/orders/{user_id}")
-async def list_orders(user_id: int):
-    return orders_db.get(user_id, [])
+async def list_orders(
+    user_id: int,
+    response: Response,
+    since: Optional[float] = Query(None, description="Only orders created at or after this Unix time"),
+    status: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    # The body stays a plain list in placement order; the next page is
+    # advertised in a header. The cursor is the id of the last order returned.
+    if cursor is not None and await order_store.get(user_id, cursor) is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    orders = []
+    async for page in order_pages(user_id, after=cursor, size=limit + 1):
+        orders.extend(order for _, order in page if matches(order, since, status))
+        if len(orders) > limit:
+            break
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers["X-Next-Cursor"] = orders[-1]["order_id"]
+    return orders
+
+@app.get("/orders/{user_id}/{order_id}")
+async def get_order(user_id: int, order_id: str):
+    order = await order_store.get(user_id, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
@@ -1,6 +1,19 @@
+import time
 import pytest
 from fastapi.testclient import TestClient
-from order_service.main import app, orders_db
+import json
+from order_service.main import PAYMENT_SERVICE_URL, app, idempotency, order_reports_db, orders_db
+
+
+# Outbound calls recorded by the fake client, and the status /pay answers with
+sent = []
+pay_headers = []
+fake_payment = {"status": 200, "unavailable": 0, "down": False, "refused": 0, "timeout_after_charge": 0}
+# Injected fault: the next N reservation commits fail to connect
+fake_inventory = {"commit_down": 0}
+# Catalog prices and stock behind the fake /inventory/reservations
+PRICES = {1: 10.0, 2: 2.5}
+fake_stock = {}
 
 
 @pytest.fixture(autouse=True)
@@ -9,36 +22,92 @@ def mock_httpx(monkeypatch):
     import httpx
     #test branch
     class FakeResponse:
-        def __init__(self, status_code=200, text="OK"):
+        def __init__(self, status_code=200, text="OK", payload=None):
             self.status_code = status_code
             self.text = text
+            self.payload = payload
+
+        def json(self):
+            return self.payload
+
+        async def aclose(self):
+            pass
 
         def raise_for_status(self):
             if not (200 <= self.status_code < 300):
                 raise httpx.HTTPStatusError("error", request=None, response=self)
 
     class FakeClient:
+        def __init__(self, **kwargs):
+            pass
+
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, exc_type, exc, tb):
             return False
 
-        async def post(self, url, json=None):
-            return FakeResponse(200, "OK")
+        async def post(self, url, json=None, headers=None):
+            sent.append((url, json))
+            if url.endswith("/inventory/reservations"):
+                items = {item["product_id"]: item["quantity"] for item in json["items"]}
+                short = [pid for pid, quantity in items.items() if fake_stock.get(pid, 0) < quantity]
+                if short:
+                    return FakeResponse(409, "Conflict", {"detail": {"message": "Insufficient stock", "product_ids": short}})
+                for pid, quantity in items.items():
+                    fake_stock[pid] -= quantity
+                lines = [{"product_id": pid, "quantity": q, "unit_price": PRICES[pid]} for pid, q in items.items()]
+                return FakeResponse(201, "Created", {"reservation_id": json["reservation_id"], "items": lines,
+                                                     "total_amount": sum(PRICES[pid] * q for pid, q in items.items())})
+            if url.endswith("/commit") and fake_inventory["commit_down"]:
+                fake_inventory["commit_down"] -= 1
+                raise httpx.ConnectError("Connection refused")
+            if url.endswith("/pay") and fake_payment["refused"]:
+                # Injected fault: the next N payment calls never connect
+                fake_payment["refused"] -= 1
+                raise httpx.ConnectError("Connection refused", request=httpx.Request("POST", url))
+            if url.endswith("/pay"):
+                pay_headers.append(headers or {})
+            if url.endswith("/pay") and fake_payment["timeout_after_charge"]:
+                # Injected fault: the next N payments are charged, then the response is lost
+                fake_payment["timeout_after_charge"] -= 1
+                raise httpx.ReadTimeout("timed out", request=httpx.Request("POST", url))
+            if url.endswith("/pay") and fake_payment["unavailable"]:
+                # Injected fault: the next N payment calls get a 503
+                fake_payment["unavailable"] -= 1
+                return FakeResponse(503, "Service Unavailable")
+            return FakeResponse(fake_payment["status"] if url.endswith("/pay") else 200, "OK")
+
+        async def get(self, url, headers=None):
+            # Readiness probes of product and payment
+            if url.startswith(PAYMENT_SERVICE_URL) and fake_payment["down"]:
+                raise httpx.ConnectError("Connection refused")
+            return FakeResponse(200, "OK", {"status": "ok"})
+
+        async def aclose(self):
+            pass
 
     monkeypatch.setattr("order_service.main.httpx.AsyncClient", FakeClient)
+    sent.clear()
+    pay_headers.clear()
+    fake_payment.update(status=200, unavailable=0, down=False, refused=0, timeout_after_charge=0)
+    fake_inventory.update(commit_down=0)
+    fake_stock.clear()
+    fake_stock.update({1: 100, 2: 100})
 
 
 @pytest.fixture(autouse=True)
 def isolate_orders_state():
+    idempotency.clear()
     # Snapshot and restore in-memory DB to keep tests isolated
-    snapshot = {k: [o.copy() for o in v] for k, v in orders_db.items()}
+    snapshot = {k: {oid: o.copy() for oid, o in v.items()} for k, v in orders_db.items()}
+    order_reports_db.clear()
     try:
         yield
     finally:
         orders_db.clear()
         orders_db.update(snapshot)
+        order_reports_db.clear()
 
 client = TestClient(app)
 
@@ -47,11 +116,12 @@ def test_create_order():
         "/orders",
         json={"user_id": 1, "items": [{"product_id": 1, "quantity": 2}], "total_amount": 20.0},
     )
-    # Service returns 200 and full order body
-    assert r.status_code == 200
+    # Service accepts the order and returns it as pending
+    assert r.status_code == 202
     data = r.json()
     assert "order_id" in data
     assert data["user_id"] == 1
+    assert data["status"] == "pending"
 
 def test_get_order():
     client.post(
@@ -69,4 +139,202 @@ def test_get_order_404():
     # Service returns empty list (200) for users without orders
     r = client.get("/orders/99999")
     assert r.status_code == 200
-    assert r.json() == []
\ No newline at end of file
+    assert r.json() == []
+
+def wait_for_status(client, user_id, order_id, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        order = client.get(f"/orders/{user_id}/{order_id}").json()
+        if order["status"] != "pending" or time.monotonic() > deadline:
+            return order
+        time.sleep(0.01)
+
+def test_pipeline_confirms_and_notifies():
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 3, "items": [{"product_id": 2, "quantity": 2}], "total_amount": 5.0})
+        order = wait_for_status(c, 3, r.json()["order_id"])
+        assert order["status"] == "confirmed"
+        deadline = time.monotonic() + 2
+        while not any(url.endswith("/send") for url, _ in sent) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [url.rsplit("/", 1)[-1] for url, _ in sent] == ["reservations", "pay", "commit", "send"]
+
+def test_payment_failure_is_recorded():
+    fake_payment["status"] = 402
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 4, "items": [{"product_id": 2, "quantity": 2}], "total_amount": 5.0})
+        order = wait_for_status(c, 4, r.json()["order_id"])
+        assert order["status"] == "payment_failed"
+        assert not any(url.endswith("/send") for url, _ in sent)
+        # The stock held for the order goes back
+        assert sent[-1][0].endswith(f"/inventory/reservations/{order['order_id']}/release")
+        assert c.get("/orders/4/unknown").status_code == 404
+
+def test_commit_of_paid_order_is_retried_until_it_lands(monkeypatch):
+    import order_service.main as om
+    from common.resilience import Policy, Resilience
+    monkeypatch.setattr(om, "inventory_guard", Resilience("product", Policy(max_attempts=1, failure_threshold=100)))
+    monkeypatch.setattr(om, "SETTLE_BACKOFF_BASE", 0.01)
+    # More failures than the guard's own attempts, so the commit outlives the order's processing
+    fake_inventory["commit_down"] = 3
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 6, "items": [{"product_id": 2, "quantity": 1}]})
+        order = wait_for_status(c, 6, r.json()["order_id"])
+        assert order["status"] == "confirmed"
+        deadline = time.monotonic() + 2
+        while c.get("/orders/pipeline").json()["commits_retrying"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        commits = [url for url, _ in sent if url.endswith("/commit")]
+        assert len(commits) == 4 and fake_inventory["commit_down"] == 0
+        assert c.get("/orders/pipeline").json()["commits_retrying"] == 0
+
+def test_payment_timing_out_after_the_charge_keeps_the_order_pending(monkeypatch):
+    import order_service.main as om
+    from common.resilience import Policy, Resilience
+    monkeypatch.setattr(om, "payment_guard", Resilience("payment", Policy(max_attempts=1, failure_threshold=100)))
+    monkeypatch.setattr(om, "SETTLE_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(om, "SETTLE_BACKOFF_MAX", 0.05)
+    fake_payment["timeout_after_charge"] = 1000
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 15, "items": [{"product_id": 1, "quantity": 1}]})
+        order_id = r.json()["order_id"]
+        deadline = time.monotonic() + 2
+        while len(pay_headers) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # The customer may have been charged: the stock stays held and the order pending
+        assert c.get("/orders/pipeline").json()["payments_retrying"] == 1
+        assert c.get(f"/orders/15/{order_id}").json()["status"] == "pending"
+        assert not any(url.endswith("/release") for url, _ in sent)
+        fake_payment["timeout_after_charge"] = 0
+        order = wait_for_status(c, 15, order_id)
+        assert order["status"] == "confirmed"
+        assert len(pay_headers) >= 4
+        assert {h["Idempotency-Key"] for h in pay_headers} == {order_id}
+        assert [url.rsplit("/", 1)[-1] for url, _ in sent if "/inventory/" in url] == ["reservations", "commit"]
+        assert c.get("/orders/pipeline").json()["payments_retrying"] == 0
+
+def test_payment_that_never_connects_fails_the_order(monkeypatch):
+    import order_service.main as om
+    from common.resilience import Policy, Resilience
+    monkeypatch.setattr(om, "payment_guard", Resilience("payment", Policy(max_attempts=1, failure_threshold=100)))
+    fake_payment["refused"] = 1
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 16, "items": [{"product_id": 1, "quantity": 1}]})
+        order = wait_for_status(c, 16, r.json()["order_id"])
+        assert order["status"] == "payment_failed"
+        assert order["failure_reason"].startswith("Service unavailable")
+        assert sent[-1][0].endswith(f"/inventory/reservations/{order['order_id']}/release")
+
+def test_idempotent_retry_returns_original_order():
+    body = {"user_id": 5, "items": [{"product_id": 1, "quantity": 1}], "total_amount": 7.0}
+    with TestClient(app) as c:
+        first = c.post("/orders", json=body, headers={"Idempotency-Key": "checkout-1"})
+        retry = c.post("/orders", json=body, headers={"Idempotency-Key": "checkout-1"})
+        assert retry.status_code == 202
+        assert retry.json()["order_id"] == first.json()["order_id"]
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        assert len(c.get("/orders/5").json()) == 1
+        # The same key with a different body is rejected
+        changed = c.post("/orders", json={**body, "total_amount": 8.0}, headers={"Idempotency-Key": "checkout-1"})
+        assert changed.status_code == 422
+        # Payment is keyed by order id
+        wait_for_status(c, 5, first.json()["order_id"])
+        assert len(pay_headers) == 1
+        assert pay_headers[0]["Idempotency-Key"] == first.json()["order_id"]
+        # The payment call continues the trace of the request that placed the order
+        assert pay_headers[0]["traceparent"].split("-")[1] == first.headers["x-trace-id"]
+
+def test_orders_without_key_are_distinct():
+    body = {"user_id": 6, "items": [{"product_id": 2, "quantity": 2}], "total_amount": 3.0}
+    ids = {client.post("/orders", json=body).json()["order_id"] for _ in range(3)}
+    assert len(ids) == 3
+
+def test_transient_payment_errors_are_retried():
+    fake_payment["unavailable"] = 2
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 7, "items": [{"product_id": 2, "quantity": 2}], "total_amount": 4.0})
+        order = wait_for_status(c, 7, r.json()["order_id"])
+        assert order["status"] == "confirmed"
+        # Every attempt carried the same key, so the payment service charges once
+        assert len(pay_headers) == 3
+        assert {h["Idempotency-Key"] for h in pay_headers} == {order["order_id"]}
+        assert c.get("/orders/pipeline").json()["upstreams"]["payment"]["retries"] >= 2
+
+def test_total_is_priced_server_side():
+    with TestClient(app) as c:
+        r = c.post("/orders", json={"user_id": 8, "items": [{"product_id": 1, "quantity": 3},
+                                                            {"product_id": 2, "quantity": 1}],
+                                    "total_amount": 0.01})
+        assert r.status_code == 202
+        assert r.json()["total_amount"] == 32.5
+        assert r.json()["items"][0] == {"product_id": 1, "quantity": 3, "unit_price": 10.0}
+        wait_for_status(c, 8, r.json()["order_id"])
+        assert [body for url, body in sent if url.endswith("/pay")][0]["amount"] == 32.5
+
+def test_out_of_stock_order_is_refused():
+    fake_stock[1] = 1
+    r = client.post("/orders", json={"user_id": 9, "items": [{"product_id": 1, "quantity": 2}]})
+    assert r.status_code == 409
+    assert r.json()["detail"]["product_ids"] == [1]
+    assert client.get("/orders/9").json() == []
+    assert not any(url.endswith("/pay") for url, _ in sent)
+
+def test_empty_order_is_rejected():
+    assert client.post("/orders", json={"user_id": 10, "items": []}).status_code == 422
+
+def test_order_history_pages_with_a_cursor():
+    ids = [client.post("/orders", json={"user_id": 11, "items": [{"product_id": 1, "quantity": 1}]}).json()["order_id"]
+           for _ in range(5)]
+    first = client.get("/orders/11", params={"limit": 2})
+    assert [o["order_id"] for o in first.json()] == ids[:2]
+    second = client.get("/orders/11", params={"limit": 2, "cursor": first.headers["x-next-cursor"]})
+    assert [o["order_id"] for o in second.json()] == ids[2:4]
+    last = client.get("/orders/11", params={"limit": 2, "cursor": second.headers["x-next-cursor"]})
+    assert [o["order_id"] for o in last.json()] == ids[4:]
+    assert "x-next-cursor" not in last.headers
+    assert client.get("/orders/11", params={"cursor": "nope"}).status_code == 400
+
+    # `since` filters on created_at; older orders without it are left out
+    for n, order_id in enumerate(ids):
+        orders_db[11][order_id]["created_at"] = 1000.0 + n
+    del orders_db[11][ids[0]]["created_at"]
+    assert [o["order_id"] for o in client.get("/orders/11", params={"since": 1003}).json()] == ids[3:]
+    assert len(client.get("/orders/11", params={"since": 1}).json()) == 4
+
+def test_export_streams_every_users_orders_as_ndjson():
+    for user_id in (12, 13, 13):
+        client.post("/orders", json={"user_id": user_id, "items": [{"product_id": 2, "quantity": 1}]})
+    r = client.get("/orders/export")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted(o["user_id"] for o in exported if o["user_id"] in (12, 13)) == [12, 13, 13]
+    assert client.get("/orders/export", params={"status": "refunded"}).text == ""
+
+def test_report_is_updated_as_orders_settle():
+    with TestClient(app) as c:
+        placed = [c.post("/orders", json={"user_id": 14, "items": [{"product_id": 1, "quantity": 2},
+                                                                   {"product_id": 2, "quantity": 1}]}).json()
+                  for _ in range(2)]
+        for order in placed:
+            wait_for_status(c, 14, order["order_id"])
+        fake_payment["status"] = 402
+        failed = c.post("/orders", json={"user_id": 14, "items": [{"product_id": 1, "quantity": 1}]}).json()
+        wait_for_status(c, 14, failed["order_id"])
+        report = c.get("/orders/report").json()
+        assert (report["confirmed"], report["payment_failed"], report["units"], report["revenue"]) == (2, 1, 6, 45.0)
+        assert report["products"] == [{"product_id": 1, "units": 4, "revenue": 40.0},
+                                       {"product_id": 2, "units": 2, "revenue": 5.0}]
+        assert list(report["days"].values()) == [{"confirmed": 2, "payment_failed": 1, "units": 6, "revenue": 45.0}]
+        assert c.get("/orders/report", params={"until": "2000-01-01"}).json()["confirmed"] == 0
+
+def test_ready_when_pipeline_runs_and_payment_answers():
+    with TestClient(app) as c:
+        assert c.get("/healthz").status_code == 200
+        r = c.get("/readyz")
+        assert r.status_code == 200
+        assert r.json()["checks"] == {"storage": "ok", "pipeline": "ok", "product": "ok", "payment": "ok"}
+        fake_payment["down"] = True
+        r = c.get("/readyz")
+        assert r.status_code == 503 and r.json()["checks"]["payment"].startswith("ConnectError")
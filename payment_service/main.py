@@ -1,22 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
 from pydantic import BaseModel
+from typing import Optional
+import os
+import uuid
+
+from common.idempotency import (IdempotencyCache, IdempotencyConflict, MAX_KEY_LENGTH,
+                                REPLAYED_HEADER, fingerprint)
+from common.health import install_health
+from common.metrics import install_metrics
+from common.tracing import install_tracing
 
 app = FastAPI(title="Payment Service")
+install_tracing(app, "payment_service")
+install_metrics(app, "payment_service")
+install_health(app)
 
-class PaymentRequest(BaseModel):
-    amount: float
+# Completed payments by Idempotency-Key, so a retried /pay never charges twice
+idempotency = IdempotencyCache(
+    max_entries=int(os.getenv("PAYMENT_IDEMPOTENCY_MAX_ENTRIES", "100000")),
+    ttl=float(os.getenv("PAYMENT_IDEMPOTENCY_TTL", "86400")),
+)
 
 class PaymentRequest(BaseModel):
     amount: float
     user_id: str
 
 
-@app.post("/pay")
-async def process_payment(payment: PaymentRequest):
+async def charge(payment: PaymentRequest) -> dict:
     # Basic validation
     if payment.amount <= 0:
         raise HTTPException(status_code=400, detail="Invalid amount")
     # Always succeed in development to avoid blocking checkout
-    return {"status": "success", "transaction_id": f"txn_{payment.user_id}_{int(payment.amount*100)}"}
-    
-    return {"status": "success", "transaction_id": f"tx_{random.randint(10000, 99999)}"}
+    return {"status": "success", "transaction_id": f"txn_{uuid.uuid4().hex}"}
+
+
+@app.post("/pay")
+async def process_payment(payment: PaymentRequest, response: Response,
+                          idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH)):
+    if idempotency_key is None:
+        return await charge(payment)
+    try:
+        result, replayed = await idempotency.run(f"{payment.user_id}:{idempotency_key}",
+                                                 fingerprint(payment.model_dump()), lambda: charge(payment))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+from payment_service.main import app, idempotency
+
+
+@pytest.fixture(autouse=True)
+def reset_idempotency():
+    idempotency.clear()
+    yield
+    idempotency.clear()
+
+client = TestClient(app)
+
+def test_pay_returns_unique_transaction_ids():
+    body = {"amount": 10.0, "user_id": "1"}
+    ids = {client.post("/pay", json=body).json()["transaction_id"] for _ in range(3)}
+    assert len(ids) == 3
+
+def test_pay_rejects_invalid_amount():
+    r = client.post("/pay", json={"amount": 0, "user_id": "1"}, headers={"Idempotency-Key": "k"})
+    assert r.status_code == 400
+    # Failures are not remembered, so a corrected retry goes through
+    r = client.post("/pay", json={"amount": 0, "user_id": "1"}, headers={"Idempotency-Key": "k"})
+    assert r.status_code == 400
+    assert idempotency.stats()["entries"] == 0
+
+def test_pay_idempotency_key_replays_transaction():
+    body = {"amount": 12.5, "user_id": "2"}
+    first = client.post("/pay", json=body, headers={"Idempotency-Key": "order-1"})
+    retry = client.post("/pay", json=body, headers={"Idempotency-Key": "order-1"})
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    # Keys are scoped per user
+    other = client.post("/pay", json={"amount": 12.5, "user_id": "3"}, headers={"Idempotency-Key": "order-1"})
+    assert other.json()["transaction_id"] != first.json()["transaction_id"]
+    conflict = client.post("/pay", json={"amount": 99.0, "user_id": "2"}, headers={"Idempotency-Key": "order-1"})
+    assert conflict.status_code == 422
@@ -1,14 +1,47 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import base64
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import time
+
+from common.health import install_health
+from common.metrics import install_metrics
+from common.tracing import install_tracing
 
 app = FastAPI(title="Product Service")
+install_tracing(app, "product_service")
+install_metrics(app, "product_service")
+install_health(app)
+
+# Units in stock of seeded products and of new ones created without a stock level
+DEFAULT_STOCK = int(os.getenv("PRODUCT_DEFAULT_STOCK", "100"))
+# Seconds a checkout may hold stock before it is returned unsold
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", "900"))
+MAX_RESERVATION_LINES = 100
 
 class Product(BaseModel):
     name: str
     price: float
+    description: Optional[str] = None
+    stock: Optional[int] = Field(None, ge=0)
+
+class ReservationLine(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=1)
 
-products_db = [
+class ReservationRequest(BaseModel):
+    # The caller's id for the checkout (order_service uses the order id), so retries are idempotent
+    reservation_id: str = Field(..., min_length=1, max_length=128)
+    items: List[ReservationLine] = Field(..., min_length=1, max_length=MAX_RESERVATION_LINES)
+
+SEED_PRODUCTS = [
     {"id": 1, "name": "Gaming Laptop ASUS ROG", "price": 1499.99, "description": "High-performance gaming laptop with RTX 4070, 16GB RAM, perfect for gaming and content creation."},
     {"id": 2, "name": "iPhone 15 Pro Max", "price": 1199.99, "description": "Latest iPhone with titanium design, A17 Pro chip, and professional camera system."},
     {"id": 3, "name": "Sony WH-1000XM5 Headphones", "price": 399.99, "description": "Industry-leading noise canceling wireless headphones with 30-hour battery life."},
@@ -21,37 +54,632 @@ products_db = [
     {"id": 10, "name": "MacBook Air M2", "price": 1199.99, "description": "Ultra-thin laptop with Apple M2 chip, all-day battery life, and stunning Retina display."},
 ]
 
+SORT_FIELDS = ("id", "price", "name")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _sort_key(field: str, product: dict):
+    if field == "name":
+        return product["name"].casefold()
+    return product[field]
+
+
+TOKEN_RE = re.compile(r"\w+")
+# Name matches count as this many occurrences of the term
+NAME_WEIGHT = 3
+# Typeahead: the last query token matches the most frequent terms it is a prefix of
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 16
+# Postings read per search at most, which bounds how long a search holds the
+# event loop; the best combinations come first, so a search cut short still
+# returns the best documents it found
+SEARCH_MAX_POSTINGS = int(os.getenv("PRODUCT_SEARCH_MAX_POSTINGS", "50000"))
+# Postings are read in chunks doubling from this size
+SEARCH_FIRST_CHUNK = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+class SearchIndex:
+    """Inverted index over product name and description with BM25 ranking.
+
+    A term's postings are grouped by (term frequency, document length), the
+    only per-document inputs of its BM25 score: postings maps
+    term -> {(tf, length): {product_id: None}}. A term has a few dozen such
+    groups, so a search can rank them and read the best-scoring documents
+    first, stopping once the top `limit` is settled instead of scoring every
+    match. The sorted vocabulary list serves prefix lookups by bisection.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Tuple[int, int], Dict[int, None]]] = {}
+        self._doc_freq: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._doc_terms: Dict[int, Dict[str, int]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    @staticmethod
+    def _term_frequencies(product: dict) -> Dict[str, int]:
+        tf: Dict[str, int] = {}
+        for term in tokenize(product.get("name") or ""):
+            tf[term] = tf.get(term, 0) + NAME_WEIGHT
+        for term in tokenize(product.get("description") or ""):
+            tf[term] = tf.get(term, 0) + 1
+        return tf
+
+    def add(self, product: dict, sort_terms: bool = True):
+        product_id = product["id"]
+        tf = self._term_frequencies(product)
+        self._doc_terms[product_id] = tf
+        length = sum(tf.values())
+        self._doc_lengths[product_id] = length
+        self._total_length += length
+        for term, count in tf.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._doc_freq[term] = 0
+                if sort_terms:
+                    bisect.insort(self._terms, term)
+            postings.setdefault((count, length), {})[product_id] = None
+            self._doc_freq[term] += 1
+
+    def remove(self, product_id: int):
+        tf = self._doc_terms.pop(product_id, None)
+        if tf is None:
+            return
+        length = self._doc_lengths.pop(product_id)
+        self._total_length -= length
+        for term, count in tf.items():
+            postings = self._postings[term]
+            group = postings[count, length]
+            del group[product_id]
+            if not group:
+                del postings[count, length]
+            self._doc_freq[term] -= 1
+            if not postings:
+                del self._postings[term], self._doc_freq[term]
+                i = bisect.bisect_left(self._terms, term)
+                del self._terms[i]
+
+    def rebuild(self, products: Iterable[dict]):
+        self.__init__()
+        for product in products:
+            self.add(product, sort_terms=False)
+        self._terms = sorted(self._postings)
+
+    def _expand(self, prefix: str) -> List[str]:
+        lo = bisect.bisect_left(self._terms, prefix)
+        hi = bisect.bisect_left(self._terms, prefix + "\U0010ffff", lo)
+        return heapq.nlargest(MAX_PREFIX_EXPANSIONS, self._terms[lo:hi], key=self._doc_freq.__getitem__)
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Tuple[float, int]]:
+        """Return up to `limit` (score, product_id) pairs, best first.
+
+        Every query token must match (AND semantics). With `prefix`, the last
+        token also matches longer terms, so partially typed words find results;
+        it scores by the best of them. Equal scores keep the document found first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self._doc_lengths:
+            return []
+        groups: List[List[str]] = []
+        for n, token in enumerate(tokens):
+            if prefix and n == len(tokens) - 1 and len(token) >= MIN_PREFIX_LENGTH:
+                terms = self._expand(token)
+            else:
+                terms = [token] if token in self._postings else []
+            if not terms:
+                return []
+            groups.append(terms)
+
+        n_docs = len(self._doc_lengths)
+        # BM25: weight * tf / (tf + norm), norm growing with the document length
+        base, per_token = BM25_K1 * (1 - BM25_B), BM25_K1 * BM25_B * n_docs / self._total_length
+        weights = {term: self._idf(n_docs, self._doc_freq[term]) * (BM25_K1 + 1)
+                   for terms in groups for term in terms}
+
+        # A document's score is fixed by its length and, for each token, the
+        # posting group it sits in. Combinations of one group per token at a
+        # common length are enumerated best first, lazily from a heap, and
+        # only their documents (an intersection of the groups) are looked at.
+        # The search stops once no combination left can beat the `limit`-th
+        # best document found.
+        options: Dict[int, List[list]] = {}
+        for n, terms in enumerate(groups):
+            for term in terms:
+                weight = weights[term]
+                for (tf, length), docs in self._postings[term].items():
+                    per_token_options = options.setdefault(length, [[] for _ in groups])[n]
+                    per_token_options.append((weight * tf / (tf + base + per_token * length), docs.keys()))
+        frontier = []
+        for length, per_token_options in options.items():
+            if all(per_token_options):
+                for entries in per_token_options:
+                    entries.sort(key=lambda entry: entry[0], reverse=True)
+                picks = (0,) * len(groups)
+                frontier.append((-self._total(per_token_options, picks), length, picks))
+        heapq.heapify(frontier)
+        queued = {(length, picks) for _, length, picks in frontier}
+
+        top: List[Tuple[float, int, int]] = []  # min-heap of (score, -visit, product_id)
+        # With prefix expansions a document can turn up under several terms; its first is its best
+        seen = set() if any(len(terms) > 1 for terms in groups) else None
+        visits = budget = 0
+        while frontier and budget < SEARCH_MAX_POSTINGS:
+            negative, length, picks = heapq.heappop(frontier)
+            score = -negative
+            if len(top) == limit and score <= top[0][0]:
+                break
+            per_token_options = options[length]
+            for n, pick in enumerate(picks):
+                if pick + 1 < len(per_token_options[n]):
+                    following = picks[:n] + (pick + 1,) + picks[n + 1:]
+                    if (length, following) not in queued:
+                        queued.add((length, following))
+                        heapq.heappush(frontier, (-self._total(per_token_options, following), length, following))
+            chosen = sorted((per_token_options[n][pick][1] for n, pick in enumerate(picks)), key=len)
+            budget += 1
+            # Read in growing chunks, so a combination is only read until the top is full
+            source, chunk_size = iter(chosen[0]), SEARCH_FIRST_CHUNK
+            while budget < SEARCH_MAX_POSTINGS and not (len(top) == limit and score <= top[0][0]):
+                chunk = list(itertools.islice(source, min(chunk_size, SEARCH_MAX_POSTINGS - budget)))
+                if not chunk:
+                    break
+                budget += len(chunk)
+                chunk_size *= 2
+                for keys in chosen[1:]:
+                    chunk = keys & chunk
+                for product_id in chunk:
+                    if seen is not None:
+                        if product_id in seen:
+                            continue
+                        seen.add(product_id)
+                    visits += 1
+                    if len(top) < limit:
+                        heapq.heappush(top, (score, -visits, product_id))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, -visits, product_id))
+                    else:
+                        break
+        return self._results(top)
+
+    @staticmethod
+    def _total(per_token_options: List[list], picks: Tuple[int, ...]) -> float:
+        return sum(per_token_options[n][pick][0] for n, pick in enumerate(picks))
+
+    @staticmethod
+    def _results(top: list) -> List[Tuple[float, int]]:
+        return [(score, product_id) for score, _, product_id in sorted(top, reverse=True)]
+
+    @staticmethod
+    def _idf(n_docs: int, doc_freq: int) -> float:
+        return math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+class ProductCatalog:
+    """In-memory product store.
+
+    Records are kept in an id -> record map. Each sortable field has a sorted
+    list of (key, id) pairs, so pages and price ranges are found by bisection
+    instead of scanning the catalog. A SearchIndex is kept in step with every
+    write.
+    """
+
+    def __init__(self, products: Iterable[dict] = ()):
+        self._by_id: Dict[int, dict] = {}
+        self._indexes: Dict[str, List[Tuple]] = {field: [] for field in SORT_FIELDS}
+        self.search_index = SearchIndex()
+        self._next_id = 1
+        self.load(products)
+
+    def load(self, products: Iterable[dict]):
+        """Replace the contents, building the indexes with one sort each."""
+        self._by_id = {p["id"]: dict(p) for p in products}
+        self._next_id = max(self._by_id, default=0) + 1
+        for field in SORT_FIELDS:
+            self._indexes[field] = sorted((_sort_key(field, p), p["id"]) for p in self._by_id.values())
+        self.search_index.rebuild(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._by_id.values())
+
+    def get(self, product_id: int) -> Optional[dict]:
+        return self._by_id.get(product_id)
+
+    def add(self, fields: dict) -> dict:
+        product = {"id": self._next_id, **fields}
+        self._next_id += 1
+        self._by_id[product["id"]] = product
+        self._index(product)
+        return product
+
+    def update(self, product_id: int, fields: dict) -> Optional[dict]:
+        product = self._by_id.get(product_id)
+        if product is None:
+            return None
+        self._unindex(product)
+        product.update(fields)
+        self._index(product)
+        return product
+
+    def delete(self, product_id: int) -> bool:
+        product = self._by_id.pop(product_id, None)
+        if product is None:
+            return False
+        self._unindex(product)
+        return True
+
+    def _index(self, product: dict):
+        for field, index in self._indexes.items():
+            bisect.insort(index, (_sort_key(field, product), product["id"]))
+        self.search_index.add(product)
+
+    def _unindex(self, product: dict):
+        self.search_index.remove(product["id"])
+        for field, index in self._indexes.items():
+            entry = (_sort_key(field, product), product["id"])
+            i = bisect.bisect_left(index, entry)
+            if i < len(index) and index[i] == entry:
+                del index[i]
+
+    def page(self, sort: str = "id", descending: bool = False, limit: int = DEFAULT_PAGE_SIZE,
+             cursor: Optional[Tuple] = None, min_price: Optional[float] = None,
+             max_price: Optional[float] = None) -> Tuple[List[dict], Optional[Tuple]]:
+        """Return up to `limit` products after `cursor` and the cursor of the next page.
+
+        A cursor is the (sort key, id) pair of the last item returned.
+        """
+        index = self._indexes[sort]
+        lo, hi = 0, len(index)
+        if sort == "price":
+            # The price index is the filter itself: narrow the slice to the range
+            if min_price is not None:
+                lo = bisect.bisect_left(index, (min_price,))
+            if max_price is not None:
+                hi = bisect.bisect_right(index, (max_price, float("inf")))
+        if descending:
+            if cursor is not None:
+                hi = min(hi, bisect.bisect_left(index, cursor))
+            positions = range(hi - 1, lo - 1, -1)
+        else:
+            if cursor is not None:
+                lo = max(lo, bisect.bisect_right(index, cursor))
+            positions = range(lo, hi)
+
+        items: List[dict] = []
+        last = None
+        for i in positions:
+            product = self._by_id[index[i][1]]
+            if min_price is not None and product["price"] < min_price:
+                continue
+            if max_price is not None and product["price"] > max_price:
+                continue
+            items.append(product)
+            last = index[i]
+            if len(items) == limit:
+                next_cursor = last if i != positions[-1] else None
+                return items, next_cursor
+        return items, None
+
+
+def encode_cursor(cursor: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+# Sort key types; a cursor from another sort would make bisect compare str with float
+CURSOR_KEY_TYPES = {"id": (int,), "price": (int, float), "name": (str,)}
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    try:
+        key, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(key, bool) or not isinstance(key, CURSOR_KEY_TYPES[sort]):
+            raise ValueError(key)
+        return (key, int(product_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids: List[int]):
+        super().__init__(f"Insufficient stock for products {product_ids}")
+        self.product_ids = product_ids
+
+
+class ReservationConflict(Exception):
+    pass
+
+
+class Inventory:
+    """Stock counters and the reservations checkouts hold against them.
+
+    A product's "stock" field is what is still available to reserve; units
+    held by open reservations are counted in `reserved`. A reservation is
+    committed when the order is paid and released when payment fails, or
+    expires after `ttl` seconds if neither happens. A commit arriving after
+    expiry (order_service keeps retrying those of paid orders) takes the
+    units back if they are still in stock.
+
+    Every operation checks and updates the counters without awaiting, so it
+    runs as a single step of the event loop: concurrent checkouts of the same
+    item cannot interleave between the stock check and the decrement, and a
+    multi-item reservation is all or nothing, without any locks.
+    """
+
+    def __init__(self, catalog: ProductCatalog, ttl: float = RESERVATION_TTL):
+        self.catalog = catalog
+        self.ttl = ttl
+        self.reservations: Dict[str, dict] = {}
+        self.reserved: Dict[int, int] = {}
+        # (deadline, reservation id) heap; closed reservations are kept for
+        # another ttl so late commit/release retries get a definite answer
+        self._deadlines: List[Tuple[float, str]] = []
+        self.counts = {"reserved": 0, "committed": 0, "released": 0, "expired": 0, "rejected": 0}
+
+    def reserve(self, reservation_id: str, items: Dict[int, int]) -> dict:
+        """Hold `items` ({product_id: quantity}) and price them from the catalog."""
+        self.expire()
+        existing = self.reservations.get(reservation_id)
+        if existing is not None:
+            if existing["items"] != items:
+                raise ReservationConflict(reservation_id)
+            return existing
+        products = {product_id: self.catalog.get(product_id) for product_id in items}
+        missing = [product_id for product_id, product in products.items() if product is None]
+        if missing:
+            raise KeyError(missing)
+        short = [product_id for product_id, quantity in items.items()
+                 if products[product_id].get("stock", 0) < quantity]
+        if short:
+            self.counts["rejected"] += 1
+            raise InsufficientStock(short)
+        lines = []
+        for product_id, quantity in items.items():
+            product = products[product_id]
+            product["stock"] -= quantity
+            self.reserved[product_id] = self.reserved.get(product_id, 0) + quantity
+            lines.append({"product_id": product_id, "quantity": quantity, "unit_price": product["price"]})
+        reservation = {
+            "reservation_id": reservation_id,
+            "items": items,
+            "lines": lines,
+            # Prices come from the catalog, never from the client
+            "total_amount": round(sum(line["unit_price"] * line["quantity"] for line in lines), 2),
+            "state": "held",
+            "expires_at": time.time() + self.ttl,
+        }
+        self.reservations[reservation_id] = reservation
+        heapq.heappush(self._deadlines, (time.monotonic() + self.ttl, reservation_id))
+        self.counts["reserved"] += 1
+        return reservation
+
+    def commit(self, reservation_id: str) -> dict:
+        """Turn held units into sold ones; committing twice is a no-op."""
+        self.expire()
+        reservation = self.reservations[reservation_id]
+        if reservation["state"] == "committed":
+            return reservation
+        if reservation["state"] == "expired":
+            self._reclaim(reservation)
+        elif reservation["state"] != "held":
+            raise ReservationConflict(reservation_id)
+        else:
+            for product_id, quantity in reservation["items"].items():
+                self._unreserve(product_id, quantity)
+        reservation["state"] = "committed"
+        self.counts["committed"] += 1
+        return reservation
+
+    def release(self, reservation_id: str, state: str = "released") -> dict:
+        """Return held units to stock; releasing twice is a no-op."""
+        if state == "released":
+            self.expire()
+        reservation = self.reservations[reservation_id]
+        if reservation["state"] in ("released", "expired"):
+            return reservation
+        if reservation["state"] != "held":
+            raise ReservationConflict(reservation_id)
+        for product_id, quantity in reservation["items"].items():
+            self._unreserve(product_id, quantity)
+            product = self.catalog.get(product_id)
+            if product is not None:
+                product["stock"] = product.get("stock", 0) + quantity
+        reservation["state"] = state
+        self.counts[state] += 1
+        return reservation
+
+    def _reclaim(self, reservation: dict):
+        # All or nothing, like reserve(); units sold since expiry cannot be taken back
+        products = {product_id: self.catalog.get(product_id) for product_id in reservation["items"]}
+        if any(product is None or product.get("stock", 0) < quantity
+               for product, quantity in zip(products.values(), reservation["items"].values())):
+            raise ReservationConflict(reservation["reservation_id"])
+        for product_id, quantity in reservation["items"].items():
+            products[product_id]["stock"] -= quantity
+
+    def _unreserve(self, product_id: int, quantity: int):
+        left = self.reserved[product_id] - quantity
+        if left:
+            self.reserved[product_id] = left
+        else:
+            del self.reserved[product_id]
+
+    def expire(self, now: Optional[float] = None):
+        """Release reservations past their deadline and forget old closed ones."""
+        now = time.monotonic() if now is None else now
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, reservation_id = heapq.heappop(self._deadlines)
+            reservation = self.reservations.get(reservation_id)
+            if reservation is None:
+                continue
+            if reservation["state"] == "held":
+                self.release(reservation_id, state="expired")
+                heapq.heappush(self._deadlines, (now + self.ttl, reservation_id))
+            else:
+                del self.reservations[reservation_id]
+
+    def stats(self) -> dict:
+        self.expire()
+        return {
+            **self.counts,
+            "held": sum(1 for r in self.reservations.values() if r["state"] == "held"),
+            "units_reserved": sum(self.reserved.values()),
+            "ttl": self.ttl,
+        }
+
+
+products_db = ProductCatalog({"stock": DEFAULT_STOCK, **p} for p in SEED_PRODUCTS)
+inventory = Inventory(products_db)
+
+
+def reservation_view(reservation: dict) -> dict:
+    return {
+        "reservation_id": reservation["reservation_id"],
+        "state": reservation["state"],
+        "items": reservation["lines"],
+        "total_amount": reservation["total_amount"],
+        "expires_at": reservation["expires_at"],
+    }
+
+
+class ProductIds(BaseModel):
+    ids: List[int]
+
+
+def lookup_products(ids: List[int]) -> List[dict]:
+    # Requested order is kept; unknown ids are skipped
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per lookup")
+    return [product for product in map(products_db.get, ids) if product is not None]
+
+
 @app.get("/products", response_model=List[dict])
-async def list_products():
-    return products_db
+async def list_products(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = Query("id", pattern="^(id|price|name)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    ids: Optional[str] = Query(None, description="Comma-separated ids to look up, e.g. 1,5,9"),
+):
+    if ids is not None:
+        try:
+            return lookup_products([int(part) for part in ids.split(",") if part.strip()])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    # The body stays a plain list; the next page is advertised in a header
+    items, next_cursor = products_db.page(
+        sort=sort,
+        descending=order == "desc",
+        limit=limit,
+        cursor=decode_cursor(cursor, sort) if cursor else None,
+        min_price=min_price,
+        max_price=max_price,
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_cursor)
+    return items
+
+@app.post("/products/batch", response_model=List[dict])
+async def batch_get_products(request: ProductIds):
+    return lookup_products(request.ids)
+
+# Declared before /products/{product_id} so "search" is not parsed as an id
+@app.get("/products/search", response_model=List[dict])
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    prefix: bool = True,
+):
+    results = products_db.search_index.search(q, limit=limit, prefix=prefix)
+    return [dict(products_db.get(product_id), score=round(score, 4)) for score, product_id in results]
 
 @app.get("/products/{product_id}")
 async def get_product(product_id: int):
-    for p in products_db:
-        if p["id"] == product_id:
-            return p
-    raise HTTPException(status_code=404, detail="Product not found")
+    product = products_db.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
 
 @app.post("/products", status_code=201)
 async def create_product(product: Product):
-    new_id = max(p["id"] for p in products_db) + 1 if products_db else 1
-    new_product = {"id": new_id, "name": product.name, "price": product.price}
-    products_db.append(new_product)
-    return new_product
+    return products_db.add({"name": product.name, "price": product.price, "description": product.description or "",
+                            "stock": DEFAULT_STOCK if product.stock is None else product.stock})
 
 @app.put("/products/{product_id}")
 async def update_product(product_id: int, product: Product):
-    for i, p in enumerate(products_db):
-        if p["id"] == product_id:
-            products_db[i]["name"] = product.name
-            products_db[i]["price"] = product.price
-            return products_db[i]
-    raise HTTPException(status_code=404, detail="Product not found")
+    fields = {"name": product.name, "price": product.price}
+    if product.description is not None:
+        fields["description"] = product.description
+    if product.stock is not None:
+        # Sets what is available to reserve; units already held stay held
+        fields["stock"] = product.stock
+    updated = products_db.update(product_id, fields)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return updated
 
 @app.delete("/products/{product_id}")
 async def delete_product(product_id: int):
-    for i, p in enumerate(products_db):
-        if p["id"] == product_id:
-            del products_db[i]
-            return {"message": "Product deleted"}
-    raise HTTPException(status_code=404, detail="Product not found")
+    if not products_db.delete(product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product deleted"}
+
+@app.post("/inventory/reservations", status_code=201)
+async def reserve_stock(request: ReservationRequest):
+    items: Dict[int, int] = {}
+    for line in request.items:
+        items[line.product_id] = items.get(line.product_id, 0) + line.quantity
+    try:
+        return reservation_view(inventory.reserve(request.reservation_id, items))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail={"message": "Product not found", "product_ids": e.args[0]})
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "product_ids": e.product_ids})
+    except ReservationConflict:
+        raise HTTPException(status_code=409, detail="Reservation id was already used with different items")
+
+@app.get("/inventory/reservations/{reservation_id}")
+async def get_reservation(reservation_id: str):
+    inventory.expire()
+    reservation = inventory.reservations.get(reservation_id)
+    if reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return reservation_view(reservation)
+
+@app.post("/inventory/reservations/{reservation_id}/commit")
+async def commit_reservation(reservation_id: str):
+    try:
+        return reservation_view(inventory.commit(reservation_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    except ReservationConflict:
+        raise HTTPException(status_code=409, detail="Reservation was released, or has expired and its stock was sold")
+
+@app.post("/inventory/reservations/{reservation_id}/release")
+async def release_reservation(reservation_id: str):
+    try:
+        return reservation_view(inventory.release(reservation_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    except ReservationConflict:
+        raise HTTPException(status_code=409, detail="Reservation is already committed")
+
+@app.get("/inventory")
+async def inventory_stats():
+    return inventory.stats()
@@ -1,6 +1,9 @@
-import copy
+import asyncio
+import pytest
+import time
 from fastapi.testclient import TestClient
-from product_service.main import app, products_db
+from product_service.main import (Inventory, InsufficientStock, ProductCatalog, ReservationConflict, app,
+                                  products_db)
 
 client = TestClient(app)
 
@@ -24,7 +27,7 @@ def test_get_product_404():
     assert r.status_code == 404
 
 def test_create_update_delete_product():
-    snapshot = copy.deepcopy(products_db)
+    snapshot = [dict(p) for p in products_db]
     try:
         r = client.post("/products", json={"name": "Test Item", "price": 10.0})
         assert r.status_code == 201
@@ -39,4 +42,197 @@ def test_create_update_delete_product():
         assert r.status_code == 200
         assert r.json()["message"] == "Product deleted"
     finally:
-        products_db[:] = snapshot
\ No newline at end of file
+        products_db.load(snapshot)
+
+def test_list_products_cursor_pagination():
+    r = client.get("/products", params={"limit": 4})
+    assert r.status_code == 200
+    first = r.json()
+    assert [p["id"] for p in first] == [1, 2, 3, 4]
+    r = client.get("/products", params={"limit": 4, "cursor": r.headers["X-Next-Cursor"]})
+    assert [p["id"] for p in r.json()] == [5, 6, 7, 8]
+
+    r = client.get("/products", params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+
+    # A cursor only fits the sort it was issued for
+    price_cursor = client.get("/products", params={"limit": 2, "sort": "price"}).headers["X-Next-Cursor"]
+    r = client.get("/products", params={"sort": "name", "cursor": price_cursor})
+    assert r.status_code == 400 and r.json()["detail"] == "Invalid cursor"
+
+def test_list_products_price_range_and_sort():
+    r = client.get("/products", params={"sort": "price", "order": "desc", "min_price": 300, "max_price": 1200})
+    assert r.status_code == 200
+    prices = [p["price"] for p in r.json()]
+    assert prices == sorted(prices, reverse=True)
+    assert all(300 <= price <= 1200 for price in prices)
+    assert "X-Next-Cursor" not in r.headers
+
+def test_created_ids_are_not_reused():
+    snapshot = [dict(p) for p in products_db]
+    try:
+        first = client.post("/products", json={"name": "A", "price": 1.0}).json()["id"]
+        client.delete(f"/products/{first}")
+        second = client.post("/products", json={"name": "B", "price": 1.0}).json()["id"]
+        assert second == first + 1
+    finally:
+        products_db.load(snapshot)
+
+def test_search_ranks_and_prefix_matches():
+    r = client.get("/products/search", params={"q": "gaming laptop"})
+    assert r.status_code == 200
+    data = r.json()
+    assert data[0]["id"] == 1
+    assert all("score" in p for p in data)
+
+    r = client.get("/products/search", params={"q": "headph"})
+    assert [p["id"] for p in r.json()] == [3]
+    r = client.get("/products/search", params={"q": "headph", "prefix": "false"})
+    assert r.json() == []
+
+def test_search_follows_writes():
+    snapshot = [dict(p) for p in products_db]
+    try:
+        pid = client.post("/products", json={"name": "Quantum Toaster", "price": 50.0}).json()["id"]
+        assert [p["id"] for p in client.get("/products/search", params={"q": "toaster"}).json()] == [pid]
+        client.put(f"/products/{pid}", json={"name": "Plasma Kettle", "price": 50.0})
+        assert client.get("/products/search", params={"q": "toaster"}).json() == []
+        assert client.get("/products/search", params={"q": "kettle"}).json()[0]["id"] == pid
+        client.delete(f"/products/{pid}")
+        assert client.get("/products/search", params={"q": "kettle"}).json() == []
+    finally:
+        products_db.load(snapshot)
+
+def test_search_stops_early_without_changing_the_top():
+    import random
+    rng = random.Random(7)
+    words = ["gaming", "game", "laptop", "lamp", "mouse", "red", "pro"] + [f"w{n}" for n in range(20)]
+    catalog = ProductCatalog([{"id": n, "name": " ".join(rng.choices(words, k=3)), "price": 1.0,
+                               "description": " ".join(rng.choices(words, k=rng.randint(0, 9)))}
+                              for n in range(1, 2001)])
+    index = catalog.search_index
+    for query in ["laptop", "gaming la", "red mouse", "w1 w2 pro", "ga"]:
+        everything = [score for score, _ in index.search(query, limit=2000)]
+        assert [score for score, _ in index.search(query, limit=5)] == everything[:5]
+
+def test_search_reads_a_bounded_number_of_postings(monkeypatch):
+    import product_service.main as products
+    catalog = ProductCatalog([{"id": n, "name": "red", "price": 1.0} for n in range(1, 1001)])
+    monkeypatch.setattr(products, "SEARCH_MAX_POSTINGS", 10)
+    # One posting group: the budget pays for it and nine of its documents
+    assert len(catalog.search_index.search("red", limit=20)) == 9
+
+def test_batch_lookup():
+    r = client.get("/products", params={"ids": "5,1,99999"})
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()] == [5, 1]
+
+    r = client.post("/products/batch", json={"ids": [9, 2]})
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()] == [9, 2]
+
+    assert client.get("/products", params={"ids": "1,x"}).status_code == 400
+
+def test_reserve_commit_and_release():
+    catalog = ProductCatalog([{"id": 1, "name": "A", "price": 2.5, "stock": 5},
+                              {"id": 2, "name": "B", "price": 10.0, "stock": 1}])
+    inventory = Inventory(catalog, ttl=60)
+    held = inventory.reserve("o1", {1: 2, 2: 1})
+    assert held["total_amount"] == 15.0
+    assert (catalog.get(1)["stock"], catalog.get(2)["stock"]) == (3, 0)
+    # A retry of the same reservation holds nothing more
+    assert inventory.reserve("o1", {1: 2, 2: 1}) is held
+    with pytest.raises(ReservationConflict):
+        inventory.reserve("o1", {1: 1})
+    # All or nothing: product 1 is not touched when product 2 is short
+    with pytest.raises(InsufficientStock) as e:
+        inventory.reserve("o2", {1: 1, 2: 1})
+    assert e.value.product_ids == [2]
+    assert catalog.get(1)["stock"] == 3
+
+    inventory.commit("o1")
+    inventory.commit("o1")
+    assert inventory.reserved == {}
+    with pytest.raises(ReservationConflict):
+        inventory.release("o1")
+
+    inventory.reserve("o3", {1: 3})
+    inventory.release("o3")
+    inventory.release("o3")
+    assert catalog.get(1)["stock"] == 3
+    with pytest.raises(ReservationConflict):
+        inventory.commit("o3")
+
+def test_expired_reservations_return_stock():
+    catalog = ProductCatalog([{"id": 1, "name": "A", "price": 1.0, "stock": 2}])
+    inventory = Inventory(catalog, ttl=10)
+    inventory.reserve("o1", {1: 2})
+    later = time.monotonic() + 11
+    inventory.expire(later)
+    assert catalog.get(1)["stock"] == 2
+    assert inventory.reservations["o1"]["state"] == "expired"
+    # Sold to someone else meanwhile: the late commit cannot take the units back
+    inventory.reserve("o2", {1: 1})
+    with pytest.raises(ReservationConflict):
+        inventory.commit("o1")
+    # Closed reservations are forgotten one ttl later
+    inventory.expire(later + 11)
+    assert "o1" not in inventory.reservations
+
+def test_late_commit_of_expired_reservation_takes_stock_back():
+    catalog = ProductCatalog([{"id": 1, "name": "A", "price": 1.0, "stock": 3}])
+    inventory = Inventory(catalog, ttl=10)
+    inventory.reserve("o1", {1: 2})
+    inventory.expire(time.monotonic() + 11)
+    assert catalog.get(1)["stock"] == 3
+    assert inventory.commit("o1")["state"] == "committed"
+    assert catalog.get(1)["stock"] == 1 and inventory.reserved == {}
+    assert inventory.commit("o1")["state"] == "committed"
+
+def test_concurrent_reservations_never_oversell():
+    catalog = ProductCatalog([{"id": 1, "name": "Hot", "price": 1.0, "stock": 100}])
+    inventory = Inventory(catalog, ttl=60)
+
+    async def checkout(n):
+        await asyncio.sleep(0)
+        try:
+            inventory.reserve(f"o{n}", {1: 1 + n % 3})
+        except InsufficientStock:
+            return 0
+        await asyncio.sleep(0)
+        (inventory.commit if n % 2 else inventory.release)(f"o{n}")
+        return 1
+
+    async def run():
+        return await asyncio.gather(*(checkout(n) for n in range(1000)))
+
+    asyncio.run(run())
+    sold = sum(sum(r["items"].values()) for r in inventory.reservations.values() if r["state"] == "committed")
+    assert catalog.get(1)["stock"] + sold == 100
+    assert catalog.get(1)["stock"] >= 0 and inventory.reserved == {}
+
+def test_reservation_endpoints():
+    snapshot = [dict(p) for p in products_db]
+    try:
+        stock = client.get("/products/3").json()["stock"]
+        r = client.post("/inventory/reservations", json={
+            "reservation_id": "test-checkout", "items": [{"product_id": 3, "quantity": 2},
+                                                         {"product_id": 3, "quantity": 1}]})
+        assert r.status_code == 201
+        assert r.json()["items"] == [{"product_id": 3, "quantity": 3, "unit_price": 399.99}]
+        assert r.json()["total_amount"] == 1199.97
+        assert client.get("/products/3").json()["stock"] == stock - 3
+        assert client.post("/inventory/reservations/test-checkout/commit").json()["state"] == "committed"
+        assert client.post("/inventory/reservations/test-checkout/release").status_code == 409
+
+        r = client.post("/inventory/reservations", json={
+            "reservation_id": "too-many", "items": [{"product_id": 3, "quantity": stock}]})
+        assert r.status_code == 409
+        assert r.json()["detail"]["product_ids"] == [3]
+        r = client.post("/inventory/reservations", json={
+            "reservation_id": "unknown", "items": [{"product_id": 99999, "quantity": 1}]})
+        assert r.status_code == 404
+        assert client.post("/inventory/reservations/missing/commit").status_code == 404
+        assert client.get("/inventory").json()["committed"] >= 1
+    finally:
+        products_db.load(snapshot)
@@ -1,44 +1,247 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict
+from array import array
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import base64
+import bisect
 import datetime
+import json
+import os
 
-app = FastAPI(title="Review Service")
+from common.health import install_health
+from common.metrics import install_metrics
+from common.storage import open_storage
+from common.tracing import install_tracing
+
+RATINGS = (1, 2, 3, 4, 5)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 class Review(BaseModel):
     product_id: int
     comment: str
-    rating: int | None = None  # optional 1-5
+    rating: int | None = Field(None, ge=1, le=5)  # optional 1-5
     username: str | None = None  # optional username
 
-# In-memory storage for reviews
-reviews: Dict[int, List[Dict]] = {
-    1: [
-        {"id": 1, "product_id": 1, "rating": 5, "comment": "Amazing laptop, very fast!", "username": "user", "date": "2025-12-01"},
-        {"id": 2, "product_id": 1, "rating": 4, "comment": "Good value for the price.", "username": "another_user", "date": "2025-12-02"},
-    ]
+class ProductIds(BaseModel):
+    ids: List[int]
+
+# Storage for reviews: {product_id: {review_id: review}}
+# With the default memory:// backend `reviews` is the live store.
+reviews: Dict[int, Dict[int, Dict]] = {
+    1: {
+        1: {"id": 1, "product_id": 1, "rating": 5, "comment": "Amazing laptop, very fast!", "username": "user", "date": "2025-12-01"},
+        2: {"id": 2, "product_id": 1, "rating": 4, "comment": "Good value for the price.", "username": "another_user", "date": "2025-12-02"},
+    }
 }
 
+
+def empty_summary() -> dict:
+    return {"count": 0, "total": 0, "histogram": [0] * len(RATINGS), "last_id": 0}
+
+
+def add_rating(rating: int):
+    # Applied atomically by the store; also hands out the next review id
+    def apply(summary):
+        summary = summary or empty_summary()
+        histogram = list(summary["histogram"])
+        histogram[rating - 1] += 1
+        return {"count": summary["count"] + 1, "total": summary["total"] + rating,
+                "histogram": histogram, "last_id": summary["last_id"] + 1}
+    return apply
+
+
+def summarize(product_reviews: Iterable[dict]) -> dict:
+    summary = None
+    for review in product_reviews:
+        summary = add_rating(review["rating"])(summary)
+        summary["last_id"] = max(summary["last_id"], review["id"])
+    return summary or empty_summary()
+
+
+# Per-product aggregates: {SUMMARIES: {product_id: summary}}, kept up to date on submit
+SUMMARIES = "summaries"
+summaries: Dict[str, Dict[int, Dict]] = {SUMMARIES: {pid: summarize(rs.values()) for pid, rs in reviews.items()}}
+
+storage = open_storage(os.getenv("STORAGE_URL", "memory://"))
+review_store = storage.collection("reviews", data=reviews)
+summary_store = storage.collection("review_summaries", data=summaries)
+
+
+def render_summary(product_id: int, summary: Optional[dict]) -> dict:
+    summary = summary or empty_summary()
+    count = summary["count"]
+    return {
+        "product_id": product_id,
+        "count": count,
+        "average": round(summary["total"] / count, 2) if count else None,
+        "histogram": {str(rating): n for rating, n in zip(RATINGS, summary["histogram"])},
+    }
+
+
+def insert_sorted(ids: "array[int]", review_id: int) -> bool:
+    position = bisect.bisect_left(ids, review_id)
+    if position < len(ids) and ids[position] == review_id:
+        return False
+    ids.insert(position, review_id)
+    return True
+
+
+class ReviewIndex:
+    """Review ids of one product, in date order overall and per rating.
+
+    Ids grow with submission time, so date order is id order and every list
+    stays sorted by appending. Pages are bisections into these arrays.
+    """
+
+    def __init__(self, product_reviews: Iterable[dict] = ()):
+        self.by_date = array("q")
+        self.by_rating = {rating: array("q") for rating in RATINGS}
+        for review in sorted(product_reviews, key=lambda r: r["id"]):
+            self.add(review["id"], review["rating"])
+
+    def __len__(self) -> int:
+        return len(self.by_date)
+
+    def add(self, review_id: int, rating: int):
+        if insert_sorted(self.by_date, review_id):
+            insert_sorted(self.by_rating[rating], review_id)
+
+    @staticmethod
+    def _slice(ids: "array[int]", descending: bool, after: Optional[int], limit: int) -> List[int]:
+        if descending:
+            end = bisect.bisect_left(ids, after) if after is not None else len(ids)
+            return list(reversed(ids[max(0, end - limit):end]))
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        return list(ids[start:start + limit])
+
+    def page(self, sort: str = "date", descending: bool = False, limit: int = DEFAULT_PAGE_SIZE,
+             cursor: Optional[Tuple] = None) -> Tuple[List[int], Optional[Tuple]]:
+        """Return up to `limit` review ids after `cursor` and the cursor of the next page.
+
+        A cursor is the (rating, id) pair of the last review returned; the
+        rating is None when sorting by date.
+        """
+        if sort == "date":
+            ids = self._slice(self.by_date, descending, cursor[1] if cursor else None, limit + 1)
+            keyed = [(None, review_id) for review_id in ids]
+        else:
+            keyed = []
+            for rating in (reversed(RATINGS) if descending else RATINGS):
+                if cursor is not None and (rating > cursor[0] if descending else rating < cursor[0]):
+                    continue
+                after = cursor[1] if cursor is not None and rating == cursor[0] else None
+                ids = self._slice(self.by_rating[rating], descending, after, limit + 1 - len(keyed))
+                keyed.extend((rating, review_id) for review_id in ids)
+                if len(keyed) > limit:
+                    break
+        if len(keyed) > limit:
+            return [review_id for _, review_id in keyed[:limit]], keyed[limit - 1]
+        return [review_id for _, review_id in keyed], None
+
+
+# In-process indexes: {product_id: ReviewIndex}, rebuilt from storage when the
+# stored review count shows another process has written to the product
+indexes: Dict[int, ReviewIndex] = {}
+
+
+async def product_index(product_id: int, count: int) -> ReviewIndex:
+    index = indexes.get(product_id)
+    if index is None or len(index) != count:
+        index = ReviewIndex((await review_store.items(product_id)).values())
+        indexes[product_id] = index
+    return index
+
+
+def encode_cursor(cursor: Tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    try:
+        rating, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == "rating" and rating not in RATINGS:
+            raise ValueError(rating)
+        return (rating, int(review_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def lookup_summaries(ids: List[int]) -> List[dict]:
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per lookup")
+    stored = await asyncio.gather(*(summary_store.get(SUMMARIES, pid) for pid in ids))
+    return [render_summary(pid, summary) for pid, summary in zip(ids, stored)]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await storage.aclose()
+
+
+app = FastAPI(title="Review Service", lifespan=lifespan)
+install_tracing(app, "review_service")
+install_metrics(app, "review_service")
+install_health(app, {"storage": storage.ping})
+
+# Declared before /reviews/{product_id} so "summaries" is not parsed as an id
+@app.get("/reviews/summaries", response_model=List[Dict])
+async def get_summaries(ids: str = Query(..., description="Comma-separated product ids, e.g. 1,5,9")):
+    try:
+        product_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    return await lookup_summaries(product_ids)
+
+@app.post("/reviews/summaries", response_model=List[Dict])
+async def batch_get_summaries(request: ProductIds):
+    return await lookup_summaries(request.ids)
+
+@app.get("/reviews/{product_id}/summary")
+async def get_review_summary(product_id: int):
+    return render_summary(product_id, await summary_store.get(SUMMARIES, product_id))
+
 @app.get("/reviews/{product_id}", response_model=List[Dict])
-async def get_reviews_for_product(product_id: int):
-    return reviews.get(product_id, [])
+async def get_reviews_for_product(
+    product_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = Query("date", pattern="^(date|rating)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+):
+    summary = await summary_store.get(SUMMARIES, product_id)
+    if not summary:
+        return []
+    index = await product_index(product_id, summary["count"])
+    # The body stays a plain list; the next page is advertised in a header
+    ids, next_cursor = index.page(sort=sort, descending=order == "desc", limit=limit,
+                                  cursor=decode_cursor(cursor, sort) if cursor else None)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_cursor)
+    page = await asyncio.gather(*(review_store.get(product_id, review_id) for review_id in ids))
+    return [review for review in page if review is not None]
 
 @app.post("/reviews")
 async def submit_review(review: Review):
     product_id = review.product_id
-    if product_id not in reviews:
-        reviews[product_id] = []
-    
-    new_review_id = len(reviews[product_id]) + 1
     # Apply sensible defaults for optional fields
     new_review = review.dict()
     if not new_review.get("username"):
         new_review["username"] = "anonymous"
     if not new_review.get("rating"):
         new_review["rating"] = 5
-    new_review["id"] = new_review_id
+    # Updating the aggregate allocates the id, so concurrent submits never collide
+    summary = await summary_store.update(SUMMARIES, product_id, add_rating(new_review["rating"]))
+    new_review["id"] = summary["last_id"]
     new_review["date"] = datetime.date.today().isoformat()
-    
-    reviews[product_id].append(new_review)
-    
+
+    await review_store.put(product_id, new_review["id"], new_review)
+    index = indexes.get(product_id)
+    if index is not None:
+        index.add(new_review["id"], new_review["rating"])
+
     return new_review
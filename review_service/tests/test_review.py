@@ -1,10 +1,23 @@
+import pytest
 from fastapi.testclient import TestClient
-from review_service.main import app, reviews
+from review_service.main import SUMMARIES, add_rating, app, indexes, reviews, summaries
+
+@pytest.fixture(autouse=True)
+def isolated_reviews():
+    review_snapshot = {k: {rid: item.copy() for rid, item in v.items()} for k, v in reviews.items()}
+    summary_snapshot = {pid: dict(s) for pid, s in summaries[SUMMARIES].items()}
+    indexes.clear()
+    try:
+        yield
+    finally:
+        reviews.clear(); reviews.update(review_snapshot)
+        summaries[SUMMARIES].clear(); summaries[SUMMARIES].update(summary_snapshot)
+        indexes.clear()
 
 client = TestClient(app)
 
 def test_add_review():
-    snapshot = {k: [item.copy() for item in v] for k, v in reviews.items()}
+    snapshot = {k: {rid: item.copy() for rid, item in v.items()} for k, v in reviews.items()}
     try:
         r = client.post("/reviews", json={"product_id": 1, "username": "tester", "rating": 5, "comment": "Great product!"})
         assert r.status_code == 200
@@ -17,7 +30,7 @@ def test_add_review():
         reviews.clear(); reviews.update(snapshot)
 
 def test_get_reviews():
-    snapshot = {k: [item.copy() for item in v] for k, v in reviews.items()}
+    snapshot = {k: {rid: item.copy() for rid, item in v.items()} for k, v in reviews.items()}
     try:
         client.post("/reviews", json={"product_id": 1, "username": "tester", "rating": 4, "comment": "Nice"})
         r = client.get("/reviews/1")
@@ -27,4 +40,53 @@ def test_get_reviews():
         assert len(data) > 0
         assert {"product_id", "rating", "comment", "username"} <= set(data[0].keys())
     finally:
-        reviews.clear(); reviews.update(snapshot)
\ No newline at end of file
+        reviews.clear(); reviews.update(snapshot)
+
+def test_summary_is_maintained_on_submit():
+    assert client.get("/reviews/1/summary").json() == {
+        "product_id": 1, "count": 2, "average": 4.5,
+        "histogram": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1},
+    }
+    ids = [client.post("/reviews", json={"product_id": 1, "rating": 1, "comment": "Broke"}).json()["id"] for _ in range(2)]
+    assert ids == [3, 4]
+    summary = client.get("/reviews/1/summary").json()
+    assert summary["count"] == 4 and summary["average"] == 2.75
+    assert summary["histogram"]["1"] == 2
+    assert client.post("/reviews", json={"product_id": 1, "rating": 6, "comment": "x"}).status_code == 422
+
+def test_bulk_summaries():
+    client.post("/reviews", json={"product_id": 2, "rating": 3, "comment": "Ok"})
+    expected = [(1, 2), (2, 1), (99, 0)]
+    for r in (client.get("/reviews/summaries", params={"ids": "1,2,99"}),
+              client.post("/reviews/summaries", json={"ids": [1, 2, 99]})):
+        assert r.status_code == 200
+        assert [(s["product_id"], s["count"]) for s in r.json()] == expected
+    assert r.json()[2]["average"] is None
+    assert client.get("/reviews/summaries", params={"ids": "1,x"}).status_code == 400
+
+def test_paginated_listing():
+    for rating in (3, 5, 1, 5, 2):
+        client.post("/reviews", json={"product_id": 1, "rating": rating, "comment": "c"})
+
+    def walk(**params):
+        seen, cursor = [], None
+        while True:
+            r = client.get("/reviews/1", params={**params, **({"cursor": cursor} if cursor else {})})
+            seen += [(review["rating"], review["id"]) for review in r.json()]
+            cursor = r.headers.get("x-next-cursor")
+            if cursor is None:
+                return seen
+
+    assert [rid for _, rid in walk(limit=2)] == [1, 2, 3, 4, 5, 6, 7]
+    assert [rid for _, rid in walk(limit=3, order="desc")] == [7, 6, 5, 4, 3, 2, 1]
+    assert walk(limit=2, sort="rating", order="desc") == [(5, 6), (5, 4), (5, 1), (4, 2), (3, 3), (2, 7), (1, 5)]
+    assert walk(limit=4, sort="rating") == [(1, 5), (2, 7), (3, 3), (4, 2), (5, 1), (5, 4), (5, 6)]
+    assert client.get("/reviews/1", params={"cursor": "bogus"}).status_code == 400
+    assert client.get("/reviews/42").json() == []
+
+def test_index_rebuilds_after_external_write():
+    client.get("/reviews/1")
+    # Simulate another worker process writing to the shared store
+    reviews[1][3] = {"id": 3, "product_id": 1, "rating": 2, "comment": "x", "username": "u", "date": "2025-12-03"}
+    summaries[SUMMARIES][1] = add_rating(2)(summaries[SUMMARIES][1])
+    assert [r["id"] for r in client.get("/reviews/1").json()] == [1, 2, 3]